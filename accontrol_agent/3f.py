@@ -1,16 +1,23 @@
 import os
 import json
+import time
+import atexit
+import signal
 import boto3
 import httpx
 import asyncio
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image, ImageDraw
 from datetime import datetime, timedelta
 from io import BytesIO
 from mangum import Mangum  # For AWS Lambda
 import pytz
+from accontrol_agent.utils.position_render import PositionRenderer, IMAGE_CONTENT_TYPES, FLOOR_3F
+from accontrol_agent.utils.position_stream import PositionBroadcaster, FakePositionUpstream
+from accontrol_agent.utils.area_poller import AreaState, MultiAreaPoller
+from accontrol_agent.utils.room_index import RoomIndex, RoomOccupancy
+from accontrol_agent.utils.position_history import HistoryWriter, S3HistoryStorage
 
 app = FastAPI()
 
@@ -27,7 +34,95 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-position_data_cache = {}
+# Rendered image output: PNG (zlib level 0-9) or WEBP
+POSITION_IMAGE_FORMAT = os.getenv("POSITION_IMAGE_FORMAT", "PNG").upper()
+POSITION_PNG_COMPRESS_LEVEL = int(os.getenv("POSITION_PNG_COMPRESS_LEVEL", "1"))
+POSITION_WEBP_QUALITY = int(os.getenv("POSITION_WEBP_QUALITY", "80"))
+IMAGE_EXT = POSITION_IMAGE_FORMAT.lower()
+
+# Areas to poll, e.g. POSITION_AREAS=10,11,12. The first one is the default for the API.
+POSITION_AREAS = [int(a) for a in os.getenv("POSITION_AREAS", "10").split(",") if a.strip()]
+DEFAULT_AREA = POSITION_AREAS[0]
+POSITION_MAX_CONCURRENCY = int(os.getenv("POSITION_MAX_CONCURRENCY", "4"))
+POSITION_FETCH_TIMEOUT = float(os.getenv("POSITION_FETCH_TIMEOUT", "10"))
+
+# S3 keys and floor geometry per area. Area 10 (3F) keeps the original key names.
+AREA_CONFIG = {
+    10: {
+        "name": "3F",
+        "base_key": "base.webp",
+        "overlay_key": "cover2.webp",
+        "data_key": "position_data.json",
+        "image_key": f"3F_human_position.{IMAGE_EXT}",
+        "history_prefix": "position_history/3F",
+        "floor": FLOOR_3F,
+    },
+}
+
+def parse_area_floors(spec: str) -> dict:
+    """"11=60,40,0.5,0.7;12=..." -> {11: {"width_m": 60.0, "height_m": 40.0, "origin_x": 0.5, "origin_y": 0.7}}"""
+    floors = {}
+    for part in (spec or "").split(";"):
+        if "=" in part:
+            area_id, values = part.split("=", 1)
+            width_m, height_m, origin_x, origin_y = (float(v) for v in values.split(","))
+            floors[int(area_id)] = {"width_m": width_m, "height_m": height_m,
+                                    "origin_x": origin_x, "origin_y": origin_y}
+    return floors
+
+# Floor geometry of areas not in AREA_CONFIG (metres, and where floor (0, 0) falls as fractions
+# of the base image), e.g. AREA_FLOORS="11=60,40,0.5,0.7"; unlisted areas are drawn as 3F
+AREA_FLOORS = parse_area_floors(os.getenv("AREA_FLOORS", ""))
+
+def area_config(area_id: int) -> dict:
+    return AREA_CONFIG.get(area_id, {
+        "name": f"area{area_id}",
+        "base_key": f"area{area_id}/base.webp",
+        "overlay_key": f"area{area_id}/cover.webp",
+        "data_key": f"area{area_id}/position_data.json",
+        "image_key": f"area{area_id}/human_position.{IMAGE_EXT}",
+        "history_prefix": f"position_history/area{area_id}",
+        "floor": AREA_FLOORS.get(area_id, FLOOR_3F),
+    })
+
+areas = {
+    area_id: AreaState(
+        area_id,
+        area_config(area_id),
+        snapshot_ring=int(os.getenv("POSITION_SNAPSHOT_RING", "32")),
+        cell_m=float(os.getenv("OCCUPANCY_CELL_M", "1.0")),
+    )
+    for area_id in POSITION_AREAS
+}
+
+# Append-only history: chunks are flushed by record count or age, whichever comes first
+history_storage = S3HistoryStorage(s3_client, S3_BUCKET_NAME)
+for _area in areas.values():
+    _area.history = HistoryWriter(
+        history_storage,
+        _area.config["history_prefix"],
+        max_records=int(os.getenv("POSITION_HISTORY_MAX_RECORDS", "50000")),
+        max_age_s=float(os.getenv("POSITION_HISTORY_MAX_AGE", "300")),
+    )
+
+def get_area(area_id: int | None) -> AreaState:
+    area = areas.get(DEFAULT_AREA if area_id is None else area_id)
+    if area is None:
+        raise HTTPException(status_code=404, detail=f"Unknown area_id: {area_id}")
+    return area
+
+# {"<area_id>": {"<room name>": [[x, y], ...]}} in API floor coordinates, names as in ROOM_ALIASES
+ROOM_POLYGONS_KEY = os.getenv("ROOM_POLYGONS_KEY", "room_polygons.json")
+ROOM_OCCUPANCY_KEY = os.getenv("ROOM_OCCUPANCY_KEY", "room_occupancy.json")
+room_polygons_loaded = False
+# after a failed load, retry no sooner than this (doubling up to ROOM_POLYGONS_MAX_BACKOFF seconds)
+ROOM_POLYGONS_MAX_BACKOFF = float(os.getenv("ROOM_POLYGONS_MAX_BACKOFF", "300"))
+room_polygons_retry = {"at": 0.0, "backoff": 5.0}
+# room name -> area_ids, for names with polygons in more than one area
+room_name_collisions = {}
+
+AUTH_TOKEN_TTL = int(os.getenv("POSITION_AUTH_TOKEN_TTL", "600"))
+auth_token_cache = {"token": None, "expires": 0.0}
 
 # Authenticate and get the access token
 async def APIAuth():
@@ -55,158 +150,274 @@ async def APIAuth():
 #     now = datetime.now(jst) - timedelta(seconds=10)
 #     return now.strftime("%Y-%m-%d+%H:%M:%S")
 
-async def fetch_position_data():
-    global position_data_cache
-    print("Fetching position data...")  # Log job execution
+async def get_auth_token():
+    """Reuse one login across areas and polls instead of logging in per request."""
+    now = time.time()
+    if auth_token_cache["token"] is None or now >= auth_token_cache["expires"]:
+        auth_token_cache["token"] = await APIAuth()
+        auth_token_cache["expires"] = now + AUTH_TOKEN_TTL
+    return auth_token_cache["token"]
+
+async def request_position_data(area_id: int):
+    """Fetch the latest snapshot for one area from the hito-navi API. Returns None on failure."""
+    auth_token = await get_auth_token()
+    # start_time = get_current_time_rounded()
+    position_url = f"https://api.hito-navi.net/api/v1/position/?area_id={area_id}"
+    headers = {"Authorization": f'Bearer {auth_token}'}
+
+    print(f"Requesting data from URL: {position_url}")
+
+    async with httpx.AsyncClient() as client:
+        response = await client.get(position_url, headers=headers)
+
+    print(f"Response Status: {response.status_code}")
+
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code == 401:
+        auth_token_cache["token"] = None
+    print(f"Failed to fetch data: {response.status_code} - {response.text}")
+    return None
+
+# POSITION_UPSTREAM=fake swaps the API for a local random-walk generator per area
+if os.getenv("POSITION_UPSTREAM") == "fake":
+    fake_upstreams = {
+        area_id: FakePositionUpstream(people=int(os.getenv("FAKE_POSITION_PEOPLE", "30")))
+        for area_id in POSITION_AREAS
+    }
+
+    async def position_source(area_id: int):
+        return await fake_upstreams[area_id]()
+else:
+    position_source = request_position_data
+
+def load_room_polygons():
+    """Build a RoomIndex per area from the polygons in S3 (once per process, retried with backoff)."""
+    global room_polygons_loaded
+    if room_polygons_loaded or time.time() < room_polygons_retry["at"]:
+        return
     try:
-        auth_token = await APIAuth()
-        # start_time = get_current_time_rounded()
-        position_url = f"https://api.hito-navi.net/api/v1/position/?area_id=10"
-        headers = {"Authorization": f'Bearer {auth_token}'}
-
-        print(f"Requesting data from URL: {position_url}")
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(position_url, headers=headers)
-
-        print(f"Response Status: {response.status_code}")
-        print(f"Response Body: {response.text}")
-
-        if response.status_code == 200:
-            new_data = response.json()
-            print(f"Fetched new data: {new_data}")  # Log fetched data
-
-            if new_data and isinstance(new_data, list):
-                if new_data[0]["time"] != (position_data_cache[0]["time"] if position_data_cache else None):
-                    position_data_cache = new_data
-                    print("Data received and stored in cache.")
-                    store_position_data()
-                    await store_position_image()
-                else:
-                    print("Data has not changed based on the time field.")
-            else:
-                print("API response is missing required data.")
-        else:
-            print(f"Failed to fetch data: {response.status_code} - {response.text}")
+        obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=ROOM_POLYGONS_KEY)
+        polygons = json.loads(obj['Body'].read())
+    except Exception as e:
+        room_polygons_retry["at"] = time.time() + room_polygons_retry["backoff"]
+        print(f"Room polygons not loaded, retrying in {room_polygons_retry['backoff']:.0f}s: {str(e)}")
+        room_polygons_retry["backoff"] = min(2 * room_polygons_retry["backoff"], ROOM_POLYGONS_MAX_BACKOFF)
+        return
+    room_polygons_loaded = True
+    seen = {}
+    for area_id, rooms in polygons.items():
+        area = areas.get(int(area_id))
+        if area is not None and rooms:
+            area.rooms = RoomOccupancy(RoomIndex(rooms))
+            print(f"Room index for {area.name}: {len(rooms)} rooms.")
+            for name in rooms:
+                seen.setdefault(name, []).append(area.area_id)
+    room_name_collisions.update({name: ids for name, ids in seen.items() if len(ids) > 1})
+    if room_name_collisions:
+        print(f"Room names in more than one area (first area wins by name): {room_name_collisions}")
+
+def room_occupancy_snapshot() -> dict:
+    rooms = {}
+    for area in areas.values():
+        if area.rooms is None:
+            continue
+        for name, count in area.rooms.snapshot().items():
+            if name in rooms:
+                continue  # reported in "collisions"; the agent looks rooms up by name
+            rooms[name] = {"count": count, "area_id": area.area_id, "time": area.rooms.time}
+    snapshot = {"updated": datetime.now().isoformat(timespec="seconds"), "rooms": rooms}
+    if room_name_collisions:
+        snapshot["collisions"] = room_name_collisions
+    return snapshot
+
+def store_room_occupancy():
+    try:
+        body = json.dumps(room_occupancy_snapshot(), ensure_ascii=False).encode('utf-8')
+        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=ROOM_OCCUPANCY_KEY, Body=body, ContentType='application/json')
+    except Exception as e:
+        print(f"Error storing room occupancy in S3: {str(e)}")
+
+def store_area_outputs(area: AreaState):
+    """Blocking S3 pipeline for one area; runs in a worker thread."""
+    store_position_data(area)
+    store_position_history(area)
+    store_position_image(area)
+    if area.rooms is not None:
+        store_room_occupancy()
+
+poller = MultiAreaPoller(
+    areas,
+    position_source,
+    on_change=store_area_outputs,
+    max_concurrency=POSITION_MAX_CONCURRENCY,
+    timeout=POSITION_FETCH_TIMEOUT,
+)
 
+async def fetch_position_data(area_ids=None):
+    print("Fetching position data...")  # Log job execution
+    try:
+        await asyncio.to_thread(load_room_polygons)
+        await poller.poll_once(area_ids)
     except Exception as e:
         print(f"Error occurred while fetching data: {str(e)}")
 
-def store_position_data():
-    global position_data_cache
+# One upstream poll per area, shared by every streaming client of that area
+for _area in areas.values():
+    _area.broadcaster = PositionBroadcaster(
+        _area.store,
+        lambda area=_area: poller.poll_area(area),
+        interval=float(os.getenv("POSITION_POLL_INTERVAL", "2")),
+    )
+
+def store_position_data(area: AreaState):
     try:
-        if position_data_cache:
-            json_bytes = json.dumps(position_data_cache).encode('utf-8')
-            s3_client.put_object(Bucket=S3_BUCKET_NAME, Key='position_data.json', Body=json_bytes, ContentType='application/json')
-            print("Position data stored in S3.")
+        if area.entries:
+            json_bytes = json.dumps(area.entries).encode('utf-8')
+            s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=area.config["data_key"], Body=json_bytes, ContentType='application/json')
+            print(f"Position data for {area.name} stored in S3.")
         else:
             print("Position data cache is empty. Skipping storage.")
     except Exception as e:
         print(f"Error storing position data in S3: {str(e)}")
 
-async def store_position_image():
+def store_position_history(area: AreaState):
+    try:
+        area.history.append(area.entries)
+    except Exception as e:
+        print(f"Error appending position history: {str(e)}")
+
+def flush_position_history(only_due: bool = False):
+    for area in areas.values():
+        try:
+            if only_due:
+                area.history.flush_if_due()
+            else:
+                area.history.flush()
+        except Exception as e:
+            print(f"Error flushing position history for {area.name}: {str(e)}")
+
+async def flush_position_history_periodically(interval: float):
+    # long-lived servers only: an idle area gets no appends, so append() never sees the age limit
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(flush_position_history, True)
+
+def store_position_image(area: AreaState):
     try:
-        await generate_position_image()  # Generate image first
+        generate_position_image(area)  # Generate image first
     except Exception as e:
         print(f"Error storing position image in S3: {str(e)}")
 
-async def generate_position_image():
+def get_position_renderer(area: AreaState):
+    """Load base/overlay rasters from S3 once per area and reuse them for every render."""
+    if area.renderer is None:
+        # concurrent polls of one area run their pipelines in separate worker threads
+        with area.lock:
+            if area.renderer is None:
+                base_image_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=area.config["base_key"])
+                overlay_image_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=area.config["overlay_key"])
+                area.renderer = PositionRenderer.from_bytes(
+                    base_image_obj['Body'].read(),
+                    overlay_image_obj['Body'].read(),
+                    floor=area.config.get("floor"),
+                )
+                print(f"Base and overlay images cached for rendering {area.name}.")
+    return area.renderer
+
+def generate_position_image(area: AreaState):
     try:
-        # Load the base image
-        base_image_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key='base.webp')
-        base_image_data = base_image_obj['Body'].read()
-        img = Image.open(BytesIO(base_image_data)).convert("RGBA")
-        
-        # Load the overlay image
-        overlay_image_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key='cover2.webp')
-        overlay_image_data = overlay_image_obj['Body'].read()
-        overlay_img = Image.open(BytesIO(overlay_image_data)).convert("RGBA")
+        renderer = get_position_renderer(area)
     except Exception as e:
         print(f"Error loading images from S3: {str(e)}")
         return
 
-    width, height = img.size
-    draw = ImageDraw.Draw(img)
-
-    x_scale = width / 81.3
-    y_scale = height / 73.4
-    x_offset = width * 0.5
-    y_offset = height * 0.7
-
-    # Draw basic points
-    basic_points = [
-        {"id": 1, "x": 34.32, "y": -23.25},
-        {"id": 2, "x": -17.7, "y": -23.25},
-        {"id": 3, "x": 34.32, "y": 2.95},
-        {"id": 4, "x": 0.0, "y": 0.0},
-        {"id": 5, "x": -17.7, "y": 2.95}
-    ]
-    # for point in basic_points:
-    #     draw_position(draw, point, x_scale, y_scale, x_offset, y_offset)
-
-    # Draw basic points regardless of num
-    if position_data_cache:
-        for entry in position_data_cache:
-            if entry.get("num", 0) > 5:
-                if "data" in entry and entry["data"] is not None:
-                    for human in entry["data"]:
-                        draw_position(draw, human, x_scale, y_scale, x_offset, y_offset)
-
-    # Overlay the overlay image
-    img.paste(overlay_img, (0, 0), overlay_img)
+    # Basic points (id 1-5) are reference markers and only drawn when they come from the API
+    humans = []
+    for entry in area.entries:
+        if entry.get("num", 0) > 5:
+            if "data" in entry and entry["data"] is not None:
+                humans.extend(entry["data"])
 
     try:
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key='3F_human_position.png', Body=img_byte_arr, ContentType='image/png')
-        print("Annotated image with overlay successfully saved to S3.")
+        image_bytes = renderer.render_bytes(
+            humans,
+            fmt=POSITION_IMAGE_FORMAT,
+            compress_level=POSITION_PNG_COMPRESS_LEVEL,
+            quality=POSITION_WEBP_QUALITY,
+        )
+        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=area.config["image_key"], Body=image_bytes,
+                             ContentType=IMAGE_CONTENT_TYPES[POSITION_IMAGE_FORMAT])
+        print(f"Annotated image with overlay for {area.name} successfully saved to S3.")
     except Exception as e:
         print(f"Error saving image to S3: {str(e)}")
 
 
-def draw_position(draw, human, x_scale, y_scale, x_offset, y_offset):
-    
-    base_image_obj = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key='base.webp')
-    base_image_data = base_image_obj['Body'].read()
-    img = Image.open(BytesIO(base_image_data)).convert("RGBA")
-    
-    width,height = img.size
-    # print(height)
-    x = (-human["y"] * x_scale) + x_offset
-    y = -((human["x"] * y_scale) + y_offset)+height
-    color = "red"
-
-    if human["id"] == 4:
-        color = "orange"
-    elif human["id"] in [1, 2, 3, 5]:
-        color = "blue"
-
-    ellipse_radius = 10
-    draw.ellipse((x - ellipse_radius, y - ellipse_radius, x + ellipse_radius, y + ellipse_radius), fill=color)
-    # draw.text((x + 35, y - 10), f'ID: {human["id"]}', fill="green")
-
-
 @app.get("/api/positions")
-async def get_position_data():
+async def get_position_data(since: str | None = None, area_id: int | None = None):
+    area = get_area(area_id)
     try:
-        if not position_data_cache:
+        if not area.entries:
             print("Position data cache is empty. Fetching new data.")
-            await fetch_position_data()
+            await poller.poll_area(area)
         else:
             print("Returning cached position data.")
-        return JSONResponse(content=position_data_cache)
+        if since is not None:
+            # Only people added/moved/removed since the client's version token (full snapshot
+            # if it came from another container or an earlier process)
+            return JSONResponse(content=area.store.delta(since))
+        return JSONResponse(content=area.entries,
+                            headers={"X-Position-Version": area.store.token})
     except Exception as e:
         print(f"Error in /api/positions: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/api/positions/stream")
+async def stream_position_data(request: Request, since: str | None = None, area_id: int | None = None):
+    # Server-Sent Events; needs a long-lived server (uvicorn), not the Mangum Lambda path
+    area = get_area(area_id)
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id:
+        since = last_event_id
+    return StreamingResponse(
+        area.broadcaster.stream(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/positions/stream/stats")
+async def get_stream_stats(area_id: int | None = None):
+    return JSONResponse(content=get_area(area_id).broadcaster.stats())
+
+@app.get("/api/areas/stats")
+async def get_area_stats():
+    return JSONResponse(content=poller.report())
+
+@app.get("/api/rooms/occupancy")
+async def get_room_occupancy(room: str | None = None):
+    snapshot = room_occupancy_snapshot()
+    if room is None:
+        return JSONResponse(content=snapshot)
+    if room not in snapshot["rooms"]:
+        raise HTTPException(status_code=404, detail=f"Unknown room: {room}")
+    return JSONResponse(content={"room": room, **snapshot["rooms"][room]})
+
+@app.get("/api/heatmap")
+async def get_occupancy_heatmap(resolution: str = "hour", window: int = 1, area_id: int | None = None):
+    area = get_area(area_id)
+    try:
+        return JSONResponse(content=area.occupancy.heatmap(resolution, window))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get('/api/human')
-async def get_position_image():
+async def get_position_image(area_id: int | None = None):
+    area = get_area(area_id)
     try:
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key='3F_human_position.png')
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=area.config["image_key"])
         img_data = response['Body'].read()
         print(f"Image size: {len(img_data)} bytes")
-        return StreamingResponse(BytesIO(img_data), media_type='image/png')
+        return StreamingResponse(BytesIO(img_data), media_type=IMAGE_CONTENT_TYPES[POSITION_IMAGE_FORMAT])
     except s3_client.exceptions.NoSuchKey:
         raise HTTPException(status_code=404, detail="Annotated image not found in S3")
     except Exception as e:
@@ -220,8 +431,33 @@ async def startup_event():
         print("Initial data fetch completed on startup.")
     except Exception as e:
         print(f"Error occurred during startup: {str(e)}")
-
-mangum_handler = Mangum(app)
+    asyncio.create_task(flush_position_history_periodically(
+        float(os.getenv("POSITION_HISTORY_FLUSH_CHECK", "30"))))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await asyncio.to_thread(flush_position_history)
+
+# No lifespan under Lambda: Mangum would run startup/shutdown (a fetch and a history flush) around
+# every request. /api/positions fetches on an empty cache; lambda_handler flushes history.
+mangum_handler = Mangum(app, lifespan="off")
+
+# Under Lambda the history buffer lives in the warm container across invocations and is flushed by
+# record count / age like on a server (one chunk per POSITION_HISTORY_MAX_AGE instead of one per
+# tick), plus once when the container shuts down. Records buffered in a container that is reclaimed
+# without a shutdown signal (Lambda only sends SIGTERM when an extension is registered) are lost:
+# at most POSITION_HISTORY_MAX_AGE seconds of history. POSITION_HISTORY_FLUSH_EVERY_INVOCATION=true
+# writes every invocation's records before it returns instead, at one chunk per tick.
+POSITION_HISTORY_FLUSH_EVERY_INVOCATION = os.getenv(
+    "POSITION_HISTORY_FLUSH_EVERY_INVOCATION", "false").lower() == "true"
+
+def flush_history_on_sigterm(signum, frame):
+    flush_position_history()
+    raise SystemExit(0)
+
+if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+    atexit.register(flush_position_history)
+    signal.signal(signal.SIGTERM, flush_history_on_sigterm)
 
 def lambda_handler(event, context):
     print(f"Received event: {json.dumps(event)}")
@@ -232,12 +468,17 @@ def lambda_handler(event, context):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
 
-    if "httpMethod" in event:
-        print("Handling API Gateway event.")
-        return mangum_handler(event, context)
-    else:
-        print("Handling direct invocation event.")
-        return direct_lambda_handler(event, context)
+    try:
+        if "httpMethod" in event:
+            print("Handling API Gateway event.")
+            return mangum_handler(event, context)
+        else:
+            print("Handling direct invocation event.")
+            return direct_lambda_handler(event, context)
+    finally:
+        # batches span warm invocations; a buffer past POSITION_HISTORY_MAX_AGE is written even
+        # when this invocation added nothing to it
+        flush_position_history(only_due=not POSITION_HISTORY_FLUSH_EVERY_INVOCATION)
 
 def direct_lambda_handler(event, context):
     try:
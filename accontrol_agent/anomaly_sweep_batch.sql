@@ -0,0 +1,26 @@
+-- Batch wrappers for the anomaly sweep (ANOMALY_SWEEP_BATCH=true in utils/tools.py).
+-- One PostgREST call returns the rows of get_room_anomaly / get_device_anomaly for every
+-- input as {input: [rows]}, so a sweep makes one request per ANOMALY_SWEEP_BATCH_SIZE
+-- rooms or devices instead of one per entity. Run once in the Supabase SQL editor.
+
+create or replace function get_rooms_anomaly(room_inputs text[])
+returns jsonb
+language sql
+as $$
+  select coalesce(jsonb_object_agg(
+           room_input,
+           (select coalesce(jsonb_agg(to_jsonb(r)), '[]'::jsonb) from get_room_anomaly(room_input) r)
+         ), '{}'::jsonb)
+  from unnest(room_inputs) as room_input;
+$$;
+
+create or replace function get_devices_anomaly(device_inputs text[])
+returns jsonb
+language sql
+as $$
+  select coalesce(jsonb_object_agg(
+           device_input,
+           (select coalesce(jsonb_agg(to_jsonb(r)), '[]'::jsonb) from get_device_anomaly(device_input) r)
+         ), '{}'::jsonb)
+  from unnest(device_inputs) as device_input;
+$$;
@@ -0,0 +1,93 @@
+import time
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from accontrol_agent.utils import bedrock_limiter
+from accontrol_agent.utils.bedrock_limiter import AdaptiveLimiter, LimitedClient, backoff_delay, is_throttle
+
+WORKERS = 48
+REQUESTS = 400
+QUOTA_CONCURRENCY = 6
+LATENCY = 0.05
+MODEL = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+
+
+class FakeBedrock:
+    """Throttles any call beyond QUOTA_CONCURRENCY in flight, like a saturated model quota."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.attempts = 0
+        self.throttles = 0
+
+    def invoke_model(self, **kwargs):
+        with self.lock:
+            self.attempts += 1
+            if self.in_flight >= QUOTA_CONCURRENCY:
+                self.throttles += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                                  "InvokeModel")
+            self.in_flight += 1
+        try:
+            time.sleep(LATENCY)
+            return {"body": b"{}"}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def naive_call(fake, attempts=4):
+    """What the boto3 default does: a few quick retries, then the error string path."""
+    for attempt in range(attempts):
+        try:
+            return fake.invoke_model(modelId=MODEL)
+        except ClientError as e:
+            if not is_throttle(e) or attempt == attempts - 1:
+                raise
+            time.sleep(backoff_delay(attempt, base=0.01, cap=0.1))
+
+
+def run(name, call, fake):
+    latencies, failures = [], 0
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            call()
+            return time.perf_counter() - start
+        except Exception:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(WORKERS) as pool:
+        for latency in pool.map(one, range(REQUESTS)):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else 0
+    print(f"{name:>18} | {len(latencies):5d} | {elapsed:6.2f} | {failures:6d} | {fake.attempts:8d} | "
+          f"{fake.throttles:9d} | {p95:7.0f}")
+
+
+if __name__ == "__main__":
+    print(f"{REQUESTS} requests from {WORKERS} threads, quota {QUOTA_CONCURRENCY} concurrent, "
+          f"{LATENCY * 1000:.0f} ms per call (ideal {QUOTA_CONCURRENCY / LATENCY:.0f} req/s)")
+    print(f"{'client':>18} | {'ok':>5} | {'wall s':>6} | {'failed':>6} | {'attempts':>8} | {'throttles':>9} | {'p95 ms':>7}")
+    fake = FakeBedrock()
+    run("boto3-style retry", lambda: naive_call(fake), fake)
+
+    # backoff scaled to the fake 50 ms latency (defaults assume multi-second Bedrock calls)
+    bedrock_limiter.BACKOFF_BASE, bedrock_limiter.BACKOFF_CAP = 0.02, 0.5
+    fake = FakeBedrock()
+    bedrock_limiter._limiters[MODEL] = AdaptiveLimiter(MODEL, max_limit=WORKERS)
+    client = LimitedClient(fake)
+    run("adaptive limiter", lambda: client.invoke_model(modelId=MODEL), fake)
+    report = bedrock_limiter.limiter_report()[MODEL]
+    print(f"final limit {report['limit']}, queue wait {report['queue_wait_ms']}, "
+          f"retries {report['retries']}, decreases {report['decreases']}")
@@ -0,0 +1,74 @@
+import os
+import ast
+import sys
+import zipfile
+import argparse
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER_MODULE = "accontrol_agent.utils.lambda"
+HANDLER = "accontrol_agent/utils/lambda.lambda_handler"
+REQUIREMENTS = os.path.join(ROOT, "accontrol_agent", "requirements-lambda.txt")
+
+
+def module_path(module: str) -> str | None:
+    path = os.path.join(ROOT, *module.split("."))
+    for candidate in (path + ".py", os.path.join(path, "__init__.py")):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def package_modules(module: str, seen: set | None = None) -> set:
+    """`module` and every accontrol_agent module it imports, directly or not (lazy imports included)."""
+    seen = set() if seen is None else seen
+    if module in seen or module_path(module) is None:
+        return seen
+    seen.add(module)
+    with open(module_path(module), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names = [node.module]
+        for name in names:
+            if name.split(".")[0] == "accontrol_agent":
+                package_modules(name, seen)
+    # packages on the way need their __init__.py
+    parts = module.split(".")
+    for i in range(1, len(parts)):
+        package_modules(".".join(parts[:i]), seen)
+    return seen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the knowledge Lambda (utils/lambda.py) deployment zip")
+    parser.add_argument("--out", default="dist/knowledge_lambda.zip")
+    parser.add_argument("--with-deps", action="store_true",
+                        help="also pip install requirements-lambda.txt into the zip (boto3 comes with the runtime)")
+    parser.add_argument("--index", help="local KB index directory (build_vector_index.py) to ship as kb_index/")
+    args = parser.parse_args()
+
+    modules = sorted(package_modules(HANDLER_MODULE))
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with zipfile.ZipFile(args.out, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for module in modules:
+            path = module_path(module)
+            bundle.write(path, os.path.relpath(path, ROOT))
+        if args.index:
+            for name in sorted(os.listdir(args.index)):
+                bundle.write(os.path.join(args.index, name), f"kb_index/{name}")
+        if args.with_deps:
+            with tempfile.TemporaryDirectory() as target:
+                subprocess.run([sys.executable, "-m", "pip", "install", "-q", "-r", REQUIREMENTS,
+                                "--target", target], check=True)
+                for directory, _, files in os.walk(target):
+                    for name in files:
+                        path = os.path.join(directory, name)
+                        bundle.write(path, os.path.relpath(path, target))
+    print(f"{args.out}: {len(modules)} package modules ({', '.join(modules)})"
+          f"{', kb_index/' if args.index else ''}{', requirements-lambda.txt' if args.with_deps else ''}; "
+          f"handler {HANDLER}")
@@ -0,0 +1,16 @@
+import argparse
+
+from accontrol_agent.build_vector_index import load_corpus
+from accontrol_agent.utils.lexical_index import build_lexical_index, LexicalIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the n-gram/BM25 index over the manual corpus.")
+    parser.add_argument("corpus", help="JSONL with text, uri and optional title per passage")
+    parser.add_argument("--out", default="kb_lexical")
+    args = parser.parse_args()
+
+    passages = load_corpus(args.corpus)
+    build_lexical_index(args.out, passages)
+    index = LexicalIndex(args.out)
+    print(f"Indexed {index.count} passages, {len(index.lexicon)} terms, "
+          f"{len(index.postings)} bytes of postings into {args.out}")
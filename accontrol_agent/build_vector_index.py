@@ -0,0 +1,43 @@
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from accontrol_agent.utils.vector_index import build_index, HashingEmbedder, BedrockEmbedder
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local memory-mapped KB index from the manual corpus.")
+    parser.add_argument("corpus", help="JSONL with text, uri, optional title and embedding per passage")
+    parser.add_argument("--embeddings", help=".npy matrix aligned with the corpus (overrides per-line embedding)")
+    parser.add_argument("--embedder", choices=["titan-v2", "hashing"], default="titan-v2",
+                        help="embedder used for the corpus; queries will use the same one")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (0 = flat search)")
+    parser.add_argument("--out", default="kb_index")
+    args = parser.parse_args()
+
+    passages = load_corpus(args.corpus)
+    if args.embeddings:
+        embeddings = np.load(args.embeddings)
+    elif all("embedding" in p for p in passages):
+        embeddings = np.array([p["embedding"] for p in passages], dtype=np.float32)
+    elif args.embedder == "hashing":
+        embeddings = HashingEmbedder(args.dim)([p["text"] for p in passages])
+    else:
+        import boto3
+        embed = BedrockEmbedder(boto3.client("bedrock-runtime", region_name="us-east-1"), args.dim)
+        embeddings = embed([p["text"] for p in passages])
+
+    if len(embeddings) != len(passages):
+        sys.exit(f"{len(embeddings)} embeddings for {len(passages)} passages")
+    if args.lists > len(passages):
+        sys.exit(f"--lists {args.lists} is more than the {len(passages)} passages; use at most {len(passages)}")
+    build_index(args.out, passages, embeddings, n_lists=args.lists, embedder=args.embedder)
+    print(f"Indexed {len(passages)} passages ({embeddings.shape[1]} dims, {args.lists} lists) into {args.out}")
@@ -0,0 +1,128 @@
+import os
+import time
+import random
+import tempfile
+
+from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from accontrol_agent.utils.state import AgentState
+from accontrol_agent.utils.checkpoint import ContentAddressedSerializer, BlobStore, open_db, thread_config
+
+THREADS = 50
+RPC_ROWS = 120
+PASSAGES = 5
+
+
+class TimedSerializer:
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.seconds = 0.0
+
+    def dumps_typed(self, obj):
+        start = time.perf_counter()
+        result = self.inner.dumps_typed(obj)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        return result
+
+    def loads_typed(self, data):
+        return self.inner.loads_typed(data)
+
+
+def fake_payloads(rng):
+    rows = [{"device_id": f"{rng.getrandbits(128):032x}", "time": f"2025-07-01T10:{i % 60:02d}:00",
+             "temperature": round(rng.uniform(22, 31), 1), "humidity": round(rng.uniform(40, 70), 1),
+             "anomaly": rng.random() < 0.1} for i in range(RPC_ROWS)]
+    passages = [{"index": i + 1, "content": "空調機のフィルターは定期的に清掃してください。" * 20,
+                 "uri": f"s3://manuals/{i}.txt", "score": rng.random()} for i in range(PASSAGES)]
+    answer = "403 CW2 の室温は 28.4℃ で設定温度より高めです。" * 15
+    return rows, passages, answer
+
+
+def build_graph(structured: bool, rng):
+    """Same topology as create_agent_graph with offline nodes producing realistic payloads."""
+
+    def interface(state):
+        if state.get("next_action") in ("format_output", "end"):
+            state["output"] = {"text": {"answer": state.get("final_result")}}
+            state["next_action"] = "end"
+        else:
+            state.update(processed_input=state["user_input"], retry_count=0, next_action="orchestrator_agent")
+        return state
+
+    def orchestrator(state):
+        rows, passages, answer = fake_payloads(rng)
+        tool_results = [{"name": "get_room_data", "input": {"room": "403 CW2"}, "output": rows}]
+        if structured:
+            state.update(tool_results=tool_results, knowledge_base_results=passages)
+        else:
+            state.update(tool_results=str([rows]), knowledge_base_results=f"参考マニュアル情報：\n{str(passages)}")
+        state["orchistrator_response"] = answer
+        return state
+
+    def validation(state):
+        retry = state.get("retry_count", 0)
+        full = {c: {"score": 70 if retry == 0 else 90, "reason": "理由の説明。" * 30}
+                for c in ("relevance", "completeness", "accuracy", "consistency")}
+        full["improved_response"] = state["orchistrator_response"]
+        result = full if not structured else {c: v["score"] for c, v in full.items() if c != "improved_response"}
+        if retry == 0:
+            state.update(validation_result=result, retry_count=1, next_action="retry_orchestrator")
+        else:
+            state.update(validation_result=result, final_result=state["orchistrator_response"],
+                         next_action="format_output")
+        return state
+
+    graph = StateGraph(AgentState)
+    graph.add_node("interface_agent", interface)
+    graph.add_node("orchestrator_agent", orchestrator)
+    graph.add_node("validation_agent", validation)
+    graph.set_entry_point("interface_agent")
+    graph.add_conditional_edges("interface_agent",
+                                lambda s: "orchestrator_agent" if s.get("next_action") != "end" else "end",
+                                {"orchestrator_agent": "orchestrator_agent", "end": END})
+    graph.add_edge("orchestrator_agent", "validation_agent")
+    graph.add_conditional_edges("validation_agent",
+                                lambda s: "retry_orchestrator" if s.get("next_action") == "retry_orchestrator" else "format_output",
+                                {"retry_orchestrator": "orchestrator_agent", "format_output": "interface_agent"})
+    return graph
+
+
+def db_bytes(path):
+    conn = open_db(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def run(name, structured, content_addressed):
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.sqlite")
+    inner = ContentAddressedSerializer(BlobStore(open_db(path))) if content_addressed else JsonPlusSerializer()
+    serde = TimedSerializer(inner)
+    saver = SqliteSaver(open_db(path), serde=serde)
+    graph = build_graph(structured, random.Random(0)).compile(checkpointer=saver)
+    start = time.perf_counter()
+    for i in range(THREADS):
+        graph.invoke({"user_input": "403 CW2 が暑いです"}, thread_config(f"t{i}"), durability="sync")
+    elapsed = time.perf_counter() - start
+    size = db_bytes(path)
+    collected = ""
+    if content_addressed:
+        # drop half the threads, then the blobs only they referred to
+        for i in range(0, THREADS, 2):
+            saver.delete_thread(f"t{i}")
+        dropped = inner.collect(saver.conn, grace=0)
+        collected = f" | {dropped} blobs collected after deleting {THREADS // 2} threads"
+    print(f"{name:>28} | {size / THREADS / 1024:9.1f} | {serde.seconds / serde.calls * 1e6:9.0f} | "
+          f"{elapsed / THREADS * 1000:7.1f}{collected}")
+
+
+if __name__ == "__main__":
+    print(f"{THREADS} threads, one retry each ({RPC_ROWS} RPC rows, {PASSAGES} passages)")
+    print(f"{'state / serializer':>28} | {'KiB/thread':>9} | {'us/dumps':>9} | {'ms/run':>7}")
+    run("string fields, msgpack", structured=False, content_addressed=False)
+    run("structured, msgpack", structured=True, content_addressed=False)
+    run("structured, content-addressed", structured=True, content_addressed=True)
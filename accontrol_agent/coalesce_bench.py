@@ -0,0 +1,143 @@
+import io
+import os
+import json
+import contextlib
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from accontrol_agent.utils import tools, nodes, single_flight, working_set
+from accontrol_agent.utils.rpc_cache import RPCCache
+from accontrol_agent.utils.intent_router import IntentRouter
+from accontrol_agent.graph import create_agent_graph
+
+USERS = 40
+# What users type during an incident: same question, different spacing/punctuation
+QUESTIONS = ["403 CW2 が暑いです", "403 CW2が暑いです。", "403 cw2 が暑いです！", "403 CW2 が暑いです"]
+LLM_SECONDS = 0.4
+RPC_SECONDS = 0.1
+KB_SECONDS = 0.2
+
+upstream = Counter()
+lock = threading.Lock()
+
+
+def count(name, seconds):
+    with lock:
+        upstream[name] += 1
+    time.sleep(seconds)
+
+
+class FakeLLM:
+    def bind_tools(self, _tools):
+        def select(_prompt):
+            count("llm", LLM_SECONDS)
+            return AIMessage(content=[{"type": "tool_use", "id": "t1", "name": "get_room_data",
+                                       "input": {"room": json.dumps({"room": "403 CW2"})}}])
+        return RunnableLambda(select)
+
+
+class FakeRPC:
+    def __init__(self, name, params):
+        self.name = name
+
+    def execute(self):
+        count("rpc", RPC_SECONDS)
+        return type("Result", (), {"data": [{"room": "403 CW2", "temperature": 29.1, "anomaly": True}]})
+
+
+class FakeSupabase:
+    def rpc(self, name, params):
+        return FakeRPC(name, params)
+
+
+def fake_retrieve(query, prompt, k):
+    count("kb", KB_SECONDS)
+    return [{"content": {"text": "室温が高い場合は設定温度を確認してください。"},
+             "location": {"s3Location": {"uri": "s3://manuals/ac.txt"}}, "score": 0.9}]
+
+
+def fake_interface(prompt):
+    count("llm", LLM_SECONDS)
+    if "Quality Assurance" in prompt:
+        return json.dumps({c: {"score": 90, "reason": "ok"} for c in nodes.VALIDATION_CRITERIA})
+    return "403 CW2 の室温は 29.1℃ です。設定温度を確認してください。"
+
+
+class NoFlight:
+    def do(self, key, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def run(name, coalesce):
+    upstream.clear()
+    single_flight._groups.clear()
+    # independent: nothing shared between users, i.e. no single flight in the orchestrator or in
+    # supabase_rpc / retrieve_kb_passages / run_interface, and no rpc_cache (zero TTL)
+    flight = single_flight.get_flight if coalesce else (lambda _name: NoFlight())
+    tools.get_flight = nodes.get_flight = flight
+    tools.rpc_cache = RPCCache(ttl=tools.RPC_CACHE_TTL_SECONDS if coalesce else 0)
+    tools.rpc_change_feed.subscribers = [tools.rpc_cache.on_change]
+    tools.ANOMALY_SWEEP_INTERVAL_SECONDS = 0
+    # both runs start with nothing learned by the intent router
+    nodes.intent_router = IntentRouter(shadow_rate=0.0)
+    graph = create_agent_graph()
+    start = time.perf_counter()
+    # the nodes print a lot; keep the table readable
+    with ThreadPoolExecutor(USERS) as pool, contextlib.redirect_stdout(io.StringIO()):
+        answers = list(pool.map(lambda i: graph.invoke({"user_input": QUESTIONS[i % len(QUESTIONS)]}),
+                                range(USERS)))
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for a in answers if a.get("output", {}).get("text", {}).get("answer"))
+    print(f"{name:>12} | {ok:4d} | {upstream['llm']:9d} | {upstream['rpc']:9d} | {upstream['kb']:8d} | {elapsed:6.2f}")
+
+
+def check_working_set_key():
+    """Two threads asking the same question share one run only if they could reuse the same kept entries."""
+    weather = working_set.make_entry("get_weather_data", {}, {"temperature": 31.0})
+    # the same follow-up entities, still usable for one thread and expired for the other
+    entities = working_set.entities_entry("403 CW2", None)
+    expired = {k: {**v, "fetched": v["fetched"] - working_set.TTL_SECONDS["entities"] - 1}
+               for k, v in entities.items()}
+    state = {"processed_input": "403 CW2 が暑いです", "room": "403 CW2", "device_id": None}
+    collect, runs = nodes.collect_and_answer, Counter()
+
+    def counted(*args):
+        runs[id(args[-1])] += 1
+        return collect(*args)
+
+    tools.get_flight = nodes.get_flight = single_flight.get_flight
+    nodes.collect_and_answer = counted
+    try:
+        for label, sets in (("same working set", [{}, {}]),
+                            ("different working sets", [{}, {"get_weather_data:{}": weather}]),
+                            ("entities expired for one", [entities, expired])):
+            runs.clear()
+            with ThreadPoolExecutor(2) as pool, contextlib.redirect_stdout(io.StringIO()):
+                list(pool.map(lambda ws: nodes.orchestrate({**state, "working_set": ws}, self_check=False), sets))
+            expected = 1 if label == "same working set" else 2
+            print(f"  {label}: {sum(runs.values())} run(s), expected {expected}")
+    finally:
+        nodes.collect_and_answer = collect
+
+
+if __name__ == "__main__":
+    tools._clients["llm"] = FakeLLM()
+    tools._clients["supabase"] = FakeSupabase()
+    tools.retrieve_with_lexical = fake_retrieve
+    tools._run_interface = fake_interface
+    print(f"{USERS} concurrent users, {len(QUESTIONS)} spellings of one question")
+    print(f"{'mode':>12} | {'ok':>4} | {'LLM calls':>9} | {'RPC calls':>9} | {'KB calls':>8} | {'wall s':>6}")
+    run("independent", coalesce=False)
+    run("coalesced", coalesce=True)
+    for group, report in single_flight.flight_report().items():
+        print(f"  {group:>12}: {report}")
+    print("orchestrator flight key and per-thread working sets:")
+    check_working_set_key()
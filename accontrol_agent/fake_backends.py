@@ -0,0 +1,138 @@
+import io
+import os
+import re
+import json
+import time
+import random
+import threading
+
+from botocore.exceptions import ClientError
+
+# Mean latencies (ms) of the fake backends; each call draws from a lognormal around the mean
+FAKE_LLM_MS = float(os.getenv("FAKE_LLM_MS", "1500"))
+FAKE_KB_MS = float(os.getenv("FAKE_KB_MS", "300"))
+FAKE_RPC_MS = float(os.getenv("FAKE_RPC_MS", "80"))
+FAKE_WEATHER_MS = float(os.getenv("FAKE_WEATHER_MS", "150"))
+# Concurrent model calls the fake Bedrock accepts before throttling (0 = unlimited)
+FAKE_BEDROCK_CONCURRENCY = int(os.getenv("FAKE_BEDROCK_CONCURRENCY", "0"))
+
+ROOM = re.compile(r"\d{3}\s?CW\d|\d{3}\s?SALC|\d{3}\s?HALC|\d{3}\s?中講義室")
+
+
+def sleep_ms(mean_ms: float):
+    if mean_ms > 0:
+        time.sleep(random.lognormvariate(0, 0.35) * mean_ms / 1000 / 1.063)  # 1.063 = e^(0.35^2/2)
+
+
+class FakeBedrockRuntime:
+    """bedrock-runtime stand-in: converse picks a tool, invoke_model answers or grades."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def _enter(self, operation: str):
+        with self.lock:
+            if FAKE_BEDROCK_CONCURRENCY and self.in_flight >= FAKE_BEDROCK_CONCURRENCY:
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                                  operation)
+            self.in_flight += 1
+
+    def _exit(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def converse(self, **kwargs):
+        self._enter("Converse")
+        try:
+            sleep_ms(FAKE_LLM_MS * 0.6)
+            text = json.dumps(kwargs.get("messages", []), ensure_ascii=False)
+            match = ROOM.search(text)
+            content = [{"toolUse": {"toolUseId": f"tool-{random.getrandbits(32):08x}", "name": "get_room_data",
+                                    "input": {"room": json.dumps({"room": match.group(0) if match else "403 CW2"},
+                                                                 ensure_ascii=False)}}}]
+            return {"output": {"message": {"role": "assistant", "content": content}},
+                    "stopReason": "tool_use",
+                    "usage": {"inputTokens": 600, "outputTokens": 40, "totalTokens": 640},
+                    "metrics": {"latencyMs": 0}}
+        finally:
+            self._exit()
+
+    def invoke_model(self, **kwargs):
+        self._enter("InvokeModel")
+        try:
+            prompt = json.loads(kwargs["body"])["messages"][0]["content"]
+            sleep_ms(FAKE_LLM_MS)
+            if "Quality Assurance" in prompt:
+                text = json.dumps({c: {"score": random.randint(78, 95), "reason": "-"}
+                                   for c in ("relevance", "completeness", "accuracy", "consistency")})
+            elif "Reply with JSON only" in prompt:
+                text = json.dumps({"answer": "室温は 28.4℃ です。設定温度を確認してください。",
+                                   **{c: random.randint(78, 95)
+                                      for c in ("relevance", "completeness", "accuracy", "consistency")}},
+                                  ensure_ascii=False)
+            else:
+                text = "室温は 28.4℃ です。設定温度を確認してください。"
+            body = json.dumps({"content": [{"type": "text", "text": text}]}, ensure_ascii=False)
+            return {"body": io.BytesIO(body.encode("utf-8"))}
+        finally:
+            self._exit()
+
+
+class FakeKnowledgeBase:
+    def retrieve(self, **kwargs):
+        sleep_ms(FAKE_KB_MS)
+        k = kwargs["retrievalConfiguration"]["vectorSearchConfiguration"]["numberOfResults"]
+        return {"retrievalResults": [
+            {"content": {"text": f"空調機の設定温度は夏季 26〜28℃ を目安にしてください。手順 {i}。"},
+             "location": {"s3Location": {"uri": f"s3://manuals/ac-{i}.txt"}}, "score": 0.9 - i / 100}
+            for i in range(k)]}
+
+
+class FakeSupabase:
+    def rpc(self, name, params):
+        room = params.get("room_input") or params.get("device_input")
+
+        class Call:
+            def execute(self):
+                sleep_ms(FAKE_RPC_MS)
+                rows = [{"room": room, "device_id": f"{i:08x}-0000-0000-0000-000000000000",
+                         "temperature": 28.4, "humidity": 58.0, "anomaly": i == 0} for i in range(3)]
+                return type("Result", (), {"data": rows})
+        return Call()
+
+
+class FakeOpenMeteo:
+    def weather_api(self, url, params):
+        sleep_ms(FAKE_WEATHER_MS)
+        value = type("Value", (), {"Value": lambda self: 25.0})()
+        current = type("Current", (), {"Time": lambda self: int(time.time()),
+                                       "Variables": lambda self, i: value})()
+        return [type("Response", (), {"Current": lambda self: current})()]
+
+
+class FakeS3:
+    def get_object(self, **kwargs):
+        body = json.dumps({"rooms": {"403 CW2": {"count": 12, "time": "2025-07-01T10:00:00+09:00"}}})
+        return {"Body": io.BytesIO(body.encode()), "ETag": "fake"}
+
+
+def install():
+    """Put the fakes behind the tools.py client getters (Bedrock still goes through the limiter)."""
+    from accontrol_agent.utils import tools
+    from accontrol_agent.utils.bedrock_limiter import LimitedClient
+
+    tools._clients.update({
+        "bedrock-runtime": LimitedClient(FakeBedrockRuntime()),
+        "bedrock-agent-runtime": LimitedClient(FakeKnowledgeBase()),
+        "supabase": FakeSupabase(),
+        "openmeteo": FakeOpenMeteo(),
+        "s3": FakeS3(),
+    })
+
+
+def create_fake_agent_graph():
+    """Graph factory for load tests: the real agent graph on fake backends."""
+    install()
+    from accontrol_agent.graph import create_agent_graph
+    return create_agent_graph()
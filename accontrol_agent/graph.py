@@ -1,19 +1,48 @@
+import os
 from dotenv import load_dotenv
 load_dotenv()
 
 from langgraph.graph import StateGraph, END
 from accontrol_agent.utils.state import AgentState
+from accontrol_agent.utils.checkpoint import create_checkpointer
+from accontrol_agent.utils.memory_profile import get_memory_profiler
+from accontrol_agent.utils.tools import ANOMALY_SWEEP_INTERVAL_SECONDS, get_anomaly_sweeper
 from accontrol_agent.utils.nodes import (
-    interface_agent, orchestrator_agent, validation_agent,
-    should_retry
+    interface_agent, orchestrator_agent, self_check_orchestrator_agent, validation_agent,
+    should_retry, should_validate
 )
 
+# Local durable checkpoints, e.g. AGENT_CHECKPOINT_DB=checkpoints.sqlite. Leave unset under
+# the LangGraph server, which brings its own persistence.
+AGENT_CHECKPOINT_DB = os.getenv("AGENT_CHECKPOINT_DB")
+# "validated" (answer, then a separate QA call) or "self_check" (answer and scores in one call,
+# QA call only below threshold)
+AGENT_TOPOLOGY = os.getenv("AGENT_TOPOLOGY", "validated")
+# tracemalloc per node, state size per step and top allocators per run (slow; for diagnosis)
+AGENT_MEMORY_PROFILE = os.getenv("AGENT_MEMORY_PROFILE", "false").lower() == "true"
+
 def create_agent_graph():
+    return build_graph(AGENT_TOPOLOGY)
+
+def create_self_check_graph():
+    return build_graph("self_check")
+
+def build_graph(topology: str):
+    if topology not in ("validated", "self_check"):
+        raise ValueError(f"Unknown agent topology: {topology}")
+    self_check = topology == "self_check"
     graph = StateGraph(AgentState)
+    nodes = {
+        "interface_agent": interface_agent,
+        "orchestrator_agent": self_check_orchestrator_agent if self_check else orchestrator_agent,
+        "validation_agent": validation_agent,
+    }
+    if AGENT_MEMORY_PROFILE:
+        profiler = get_memory_profiler()
+        nodes = {name: profiler.wrap(name, fn) for name, fn in nodes.items()}
 
-    graph.add_node("interface_agent", interface_agent)
-    graph.add_node("orchestrator_agent", orchestrator_agent)
-    graph.add_node("validation_agent", validation_agent)
+    for name, fn in nodes.items():
+        graph.add_node(name, fn)
 
     graph.set_entry_point("interface_agent")
     graph.add_conditional_edges(
@@ -25,7 +54,17 @@ def create_agent_graph():
         }
     )
 
-    graph.add_edge("orchestrator_agent", "validation_agent")
+    if self_check:
+        graph.add_conditional_edges(
+            "orchestrator_agent",
+            should_validate,
+            {
+                "validate": "validation_agent",
+                "format_output": "interface_agent",
+            }
+        )
+    else:
+        graph.add_edge("orchestrator_agent", "validation_agent")
     
     graph.add_conditional_edges(
         "validation_agent",
@@ -36,4 +75,9 @@ def create_agent_graph():
         }
     )
 
-    return graph.compile()
+    if ANOMALY_SWEEP_INTERVAL_SECONDS > 0:
+        # first sweep runs in the background while the server finishes starting
+        get_anomaly_sweeper()
+
+    checkpointer = create_checkpointer(AGENT_CHECKPOINT_DB) if AGENT_CHECKPOINT_DB else None
+    return graph.compile(checkpointer=checkpointer)
@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import tarfile
+import tempfile
+import statistics
+import subprocess
+
+ROUNDS = 7
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measures a cold `create_agent_graph()` in a fresh interpreter, as a LangGraph worker would see it
+SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+from accontrol_agent.graph import create_agent_graph
+t1 = time.perf_counter()
+create_agent_graph()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "build_ms": (t2 - t1) * 1000}))
+"""
+
+# Dummy settings so module-level clients (if any) can be constructed offline
+DUMMY_ENV = {
+    "SUPABASE_URL": "https://example.supabase.co",
+    "SUPABASE_KEY": "dummy",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+def export_ref(ref: str) -> str:
+    """Extract a git revision into a temp dir so it can be measured side by side."""
+    target = tempfile.mkdtemp(prefix="import_bench_")
+    archive = os.path.join(target, "tree.tar")
+    subprocess.run(["git", "archive", "-o", archive, ref], cwd=REPO_ROOT, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    return target
+
+
+def measure(root: str) -> dict:
+    env = {**os.environ, **DUMMY_ENV, "PYTHONPATH": root}
+    samples = []
+    for _ in range(ROUNDS):
+        out = subprocess.run([sys.executable, "-c", SNIPPET], cwd=root, env=env,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(out.stderr.strip().splitlines()[-1])
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "build_ms": statistics.median(s["build_ms"] for s in samples),
+    }
+
+
+if __name__ == "__main__":
+    # python -m accontrol_agent.import_bench [git-ref ...]; the working tree is always measured
+    targets = [(ref, export_ref(ref)) for ref in sys.argv[1:]] + [("working tree", REPO_ROOT)]
+    print(f"Median of {ROUNDS} fresh interpreters")
+    print(f"{'tree':>14} | {'import ms':>9} | {'build ms':>8} | {'total ms':>8}")
+    for name, root in targets:
+        result = measure(root)
+        total = result["import_ms"] + result["build_ms"]
+        print(f"{name:>14} | {result['import_ms']:9.0f} | {result['build_ms']:8.1f} | {total:8.0f}")
@@ -0,0 +1,75 @@
+import os
+import random
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+from accontrol_agent.utils.tools import ROOM_ALIASES, extract_room_name, extract_device_id
+from accontrol_agent.utils.intent_router import IntentRouter, tool_call
+
+QUESTIONS = 2000
+SELECT_SECONDS = 1.2    # a Bedrock tool-selection call, for the latency estimate only
+ROOMS = list(dict.fromkeys(ROOM_ALIASES.values()))
+# (question, tools a correct selection picks); {room} / {device} are filled in per question
+TEMPLATES = [
+    ("{room} が暑いです", ("get_room_data",)),
+    ("{room} の湿度は？", ("get_room_data",)),
+    ("{room} のエアコンの設定温度を教えて", ("get_room_data",)),
+    ("{room} は今何人いますか", ("get_room_occupancy",)),
+    ("{room} の混雑状況と温度", ("get_room_data", "get_room_occupancy")),
+    ("今日の箕面キャンパスの天気は？", ("get_weather_data",)),
+    ("{room} の外の天気と室温", ("get_room_data", "get_weather_data")),
+    ("デバイス {device} の温度", ("get_device_data",)),
+    ("{room} はどう？", ("get_room_data",)),
+    ("{room} の様子を教えて", ("get_room_data",)),
+    ("外は寒い？", ("get_weather_data",)),
+    ("エアコンの使い方を教えて", ()),
+    # room + "寒" but only the manual is needed: a manual question, so the rules must not be sure
+    ("{room} の寒さ対策のマニュアルは？", ()),
+    # room + a generic equipment word: reading or how-to, the rules cannot tell
+    ("{room} のエアコンの使い方は？", ()),
+    ("{room} の空調は大丈夫？", ("get_room_data",)),
+]
+
+
+class FakeSelector:
+    """Stands in for the tool-selection LLM: always picks the labelled tools."""
+
+    def __init__(self):
+        self.calls = 0
+        self.truth = {}
+
+    def __call__(self, question, room, device_id):
+        self.calls += 1
+        return [tool_call(name, room, device_id) for name in self.truth[question]]
+
+
+def run(name, router):
+    rng = random.Random(1)
+    selector = FakeSelector()
+    correct = 0
+    for _ in range(QUESTIONS):
+        template, tools = rng.choice(TEMPLATES)
+        question = template.format(room=rng.choice(ROOMS), device=f"{rng.getrandbits(32):08x}-0000-0000-0000-000000000000")
+        selector.truth[question] = tools
+        room, device_id = extract_room_name(question), extract_device_id(question)
+        calls = router.route(question, room, device_id, selector) if router else selector(question, room, device_id)
+        correct += tuple(sorted(c["name"] for c in calls)) == tuple(sorted(tools))
+    report = router.report() if router else {"hit_rate": 0.0, "disagreement_rate": 0.0, "shadow_checks": 0}
+    print(f"{name:>20} | {selector.calls:9d} | {report['hit_rate']:8.1%} | {report['shadow_checks']:6d} | "
+          f"{report['disagreement_rate']:8.1%} | {correct / QUESTIONS:8.1%} | "
+          f"{selector.calls * SELECT_SECONDS / QUESTIONS:6.2f}")
+    return report
+
+
+if __name__ == "__main__":
+    print(f"{QUESTIONS} questions from {len(TEMPLATES)} patterns over {len(ROOMS)} rooms; "
+          f"selection call ~{SELECT_SECONDS} s")
+    print(f"{'router':>20} | {'LLM calls':>9} | {'hit rate':>8} | {'shadow':>6} | {'disagree':>8} | "
+          f"{'correct':>8} | {'s/q':>6}")
+    run("none (LLM always)", None)
+    run("rules only", IntentRouter(learn_after=10 ** 9, shadow_rate=0.0))
+    run("rules + learned", IntentRouter(learn_after=2, shadow_rate=0.0))
+    report = run("+ 5% shadow", IntentRouter(learn_after=2, shadow_rate=0.05))
+    if report["top_disagreements"]:
+        print(f"  disagreements (router, LLM, n): {report['top_disagreements']}")
@@ -0,0 +1,92 @@
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+from accontrol_agent.utils.vector_index import build_index, LocalVectorIndex, normalize_rows
+from accontrol_agent.utils.lexical_index import build_lexical_index, LexicalIndex
+
+CORPUS_SIZES = [10_000, 100_000]
+DIM = 1024
+K = 10
+QUERIES = 32
+
+
+def synthetic(n, rng):
+    # clustered vectors so IVF behaves like it would on real manual chunks
+    centers = normalize_rows(rng.standard_normal((256, DIM)))
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, DIM)) / np.sqrt(DIM)
+    return normalize_rows(vectors)
+
+
+def timed(fn, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def lexical_passages(n, rng):
+    words = ["冷房", "暖房", "フィルター", "清掃", "温度", "設定", "運転", "停止", "点検", "室外機", "リモコン", "送風"]
+    passages = []
+    for i in range(n):
+        body = "".join(rng.choice(words, 30))
+        passages.append({"text": f"{body}。エラーコードE{i % 997:03d}は点検が必要です。型番 RAS-{i:05d}",
+                         "uri": f"s3://manuals/{i}.txt"})
+    return passages
+
+
+def remote_kb(query: str, rounds: int = 5):
+    import boto3
+    client = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        client.retrieve(knowledgeBaseId="IZXJ8417SA", retrievalQuery={"text": query},
+                        retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": K}})
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+if __name__ == "__main__":
+    # python -m accontrol_agent.kb_bench [--remote "query text"]
+    rng = np.random.default_rng(0)
+    print(f"dim={DIM}, k={K}, {QUERIES} queries, best of 3 (ms)")
+    print(f"{'passages':>8} | {'flat 1q':>8} | {'flat batch/q':>12} | {'ivf 1q':>7} | {'ivf recall':>10}")
+    for n in CORPUS_SIZES:
+        vectors = synthetic(n, rng)
+        queries = normalize_rows(vectors[rng.integers(0, n, QUERIES)] + 0.02 * rng.standard_normal((QUERIES, DIM)))
+        passages = [{"text": f"passage {i}", "uri": f"s3://manuals/{i}.txt"} for i in range(n)]
+        flat_dir, ivf_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        build_index(flat_dir, passages, vectors)
+        build_index(ivf_dir, passages, vectors, n_lists=int(np.sqrt(n)))
+        flat = LocalVectorIndex(flat_dir)
+        ivf = LocalVectorIndex(ivf_dir, n_probe=8)
+
+        single_ms, _ = timed(lambda: flat.search(queries[:1], K))
+        batch_ms, (flat_idx, _) = timed(lambda: flat.search(queries, K))
+        ivf_ms, _ = timed(lambda: ivf.search(queries[:1], K))
+        ivf_idx, _ = ivf.search(queries, K)
+        # IVF rows are stored in list order, so compare by passage uri
+        recall = np.mean([
+            len({flat.meta[i]["uri"] for i in a} & {ivf.meta[i]["uri"] for i in b}) / K
+            for a, b in zip(flat_idx, ivf_idx)
+        ])
+        print(f"{n:>8} | {single_ms:8.2f} | {batch_ms / QUERIES:12.3f} | {ivf_ms:7.2f} | {recall:10.2f}")
+
+    print(f"{'passages':>8} | {'exact-term query ms':>19} | {'japanese query ms':>17}")
+    for n in CORPUS_SIZES:
+        lexical_dir = tempfile.mkdtemp()
+        build_lexical_index(lexical_dir, lexical_passages(n, rng))
+        lexical = LexicalIndex(lexical_dir)
+        exact_ms, (ids, _) = timed(lambda: lexical.search("RAS-01234 の仕様", K), rounds=5)
+        assert lexical.meta[ids[0]]["uri"].endswith("/1234.txt")
+        japanese_ms, _ = timed(lambda: lexical.search("フィルター清掃の方法", K), rounds=5)
+        print(f"{n:>8} | {exact_ms:19.2f} | {japanese_ms:17.2f}")
+
+    if "--remote" in sys.argv:
+        query = sys.argv[sys.argv.index("--remote") + 1]
+        print(f"Bedrock KB retrieve (median of 5): {remote_kb(query):.0f} ms")
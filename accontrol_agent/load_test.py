@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = [
+    "403 CW2 が暑いです",
+    "402 CW1 の湿度は？",
+    "405 中講義室のエアコンの設定温度を教えて",
+    "404 SALC は今何人いますか",
+    "今日の箕面キャンパスの天気は？",
+]
+DUMMY_ENV = {
+    "SUPABASE_URL": "https://example.supabase.co",
+    "SUPABASE_KEY": "dummy",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "LANGCHAIN_TRACING_V2": "false",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(jobs: int, topology: str, fake_env: dict):
+    """
+    `langgraph dev` (in-memory runtime) serving the agent graph on fake
+    backends. Needs langgraph-cli[inmem]: pip install -r requirements-dev.txt
+    """
+    config = {
+        "graphs": {"agent": os.path.join(REPO_ROOT, "accontrol_agent", "fake_backends.py") + ":create_fake_agent_graph"},
+        "dependencies": [REPO_ROOT],
+    }
+    config_dir = tempfile.mkdtemp(prefix="load_test_")
+    config_path = os.path.join(config_dir, "langgraph.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+    port = free_port()
+    env = {**os.environ, **DUMMY_ENV, **fake_env, "AGENT_TOPOLOGY": topology,
+           "PYTHONPATH": REPO_ROOT, "AGENT_CHECKPOINT_DB": ""}
+    log = open(os.path.join(config_dir, "server.log"), "w")
+    proc = subprocess.Popen(
+        ["langgraph", "dev", "--config", config_path, "--port", str(port), "--no-browser", "--no-reload",
+         "--allow-blocking", "--n-jobs-per-worker", str(jobs), "--server-log-level", "WARNING"],
+        cwd=config_dir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 90
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"langgraph dev exited; see {log.name}")
+        try:
+            if httpx.get(f"{url}/ok", timeout=1).status_code == 200:
+                return proc, url, log.name
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"langgraph dev did not start; see {log.name}")
+
+
+async def one_run(client: httpx.AsyncClient, url: str, timeout: float) -> tuple[float, str]:
+    """
+    One stateless run through the runs API. Status is "ok", "agent" (an
+    answer came back but the run recorded an error, e.g. validation gave
+    up) or "http" (no answer: status code, timeout, connection error).
+    """
+    body = {"assistant_id": "agent", "input": {"user_input": random.choice(QUESTIONS)}}
+    start = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/runs/wait", json=body, timeout=timeout)
+        output = response.json() if response.status_code == 200 else {}
+        answer = (output.get("output") or {}).get("text", {}).get("answer")
+        status = "http" if not answer else "agent" if output.get("error") else "ok"
+    except (httpx.HTTPError, ValueError):
+        status = "http"
+    return time.perf_counter() - start, status
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    latencies = sorted(latency for latency, status in results if status != "http")
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+    share = lambda name: sum(1 for _, status in results if status == name) / len(results) if results else 0.0
+    return {
+        "runs": len(results),
+        "throughput": len(latencies) / elapsed,
+        "p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99),
+        "error_rate": share("http"),
+        "agent_error_rate": share("agent"),
+    }
+
+
+async def closed_loop(url: str, users: int, duration: float, timeout: float) -> dict:
+    """`users` clients, each sending its next run as soon as the previous one returns."""
+    results = []
+    stop = time.perf_counter() + duration
+
+    async def user(client):
+        while time.perf_counter() < stop:
+            results.append(await one_run(client, url, timeout))
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=users + 10)) as client:
+        await asyncio.gather(*(user(client) for _ in range(users)))
+    return summarize(results, time.perf_counter() - start)
+
+
+async def open_loop(url: str, rate: float, duration: float, timeout: float) -> dict:
+    """
+    Poisson arrivals at `rate` runs/s regardless of how fast the server
+    answers. Throughput is answered runs per second of the arrival window,
+    so queueing shows up as latency rather than lost throughput.
+    """
+    tasks = []
+    start = time.perf_counter()
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=None)) as client:
+        next_at = start
+        while next_at < start + duration:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(one_run(client, url, timeout)))
+            next_at += random.expovariate(rate)
+        results = await asyncio.gather(*tasks)
+    return summarize(results, duration)
+
+
+def saturated(step: dict, previous: dict | None, baseline: dict, mode: str) -> bool:
+    """
+    Over 1% HTTP errors, or: closed loop, adding users no longer adds 10%
+    throughput; open loop, p95 more than doubles from the lightest level
+    (runs are queueing).
+    """
+    if step["error_rate"] > 0.01:
+        return True
+    if mode == "closed":
+        return previous is not None and step["throughput"] < previous["throughput"] * 1.1
+    return step["p95"] > 2 * baseline["p95"]
+
+
+def print_step(label: str, step: dict):
+    print(f"{label:>12} | {step['runs']:5d} | {step['throughput']:7.2f} | {step['p50']:6.2f} | "
+          f"{step['p95']:6.2f} | {step['p99']:6.2f} | {step['error_rate']:6.1%} | {step['agent_error_rate']:9.1%}")
+
+
+async def ramp(url: str, mode: str, levels: list, duration: float, timeout: float):
+    print(f"{'users' if mode == 'closed' else 'offered/s':>12} | {'runs':>5} | {'runs/s':>7} | "
+          f"{'p50 s':>6} | {'p95 s':>6} | {'p99 s':>6} | {'errors':>6} | {'agent err':>9}")
+    previous, baseline, hit = None, None, False
+    for level in levels:
+        if mode == "closed":
+            step = await closed_loop(url, int(level), duration, timeout)
+        else:
+            step = await open_loop(url, level, duration, timeout)
+        baseline = baseline or step
+        print_step(f"{level:g}", step)
+        if saturated(step, previous, baseline, mode):
+            hit = True
+            break
+        previous = step
+    if not hit:
+        print("  not saturated at the highest level")
+    elif previous is None:
+        print("  saturated at the first level")
+    else:
+        print(f"  saturation point: ~{previous['throughput']:.2f} runs/s at p95 {previous['p95']:.2f} s "
+              f"(last level before saturation)")
+
+
+def parse_levels(text: str) -> list:
+    return [float(x) for x in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ramp concurrent runs against the LangGraph server")
+    parser.add_argument("--url", help="existing server; by default `langgraph dev` is started on fake backends")
+    parser.add_argument("--mode", choices=["closed", "open", "both"], default="both")
+    parser.add_argument("--users", default="1,2,4,8,16,32,64", help="closed-loop concurrency levels")
+    parser.add_argument("--rates", default="0.5,1,2,4,8,16,32", help="open-loop arrival rates (runs/s)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--jobs", default="10", help="--n-jobs-per-worker values to compare")
+    parser.add_argument("--topology", default="validated", help="AGENT_TOPOLOGY values to compare")
+    parser.add_argument("--llm-ms", default=os.getenv("FAKE_LLM_MS", "1500"))
+    parser.add_argument("--bedrock-concurrency", default=os.getenv("FAKE_BEDROCK_CONCURRENCY", "0"))
+    args = parser.parse_args()
+
+    modes = ["closed", "open"] if args.mode == "both" else [args.mode]
+    if args.url:
+        configs = [("external", args.url, None)]
+    else:
+        configs = [(f"jobs={jobs} topology={topology}", None, (int(jobs), topology))
+                   for jobs in args.jobs.split(",") for topology in args.topology.split(",")]
+    fake_env = {"FAKE_LLM_MS": str(args.llm_ms), "FAKE_BEDROCK_CONCURRENCY": str(args.bedrock_concurrency)}
+
+    for name, url, server in configs:
+        proc = None
+        if server:
+            proc, url, log = start_server(*server, fake_env)
+            print(f"\n== {name} (fake LLM {args.llm_ms} ms, Bedrock concurrency "
+                  f"{args.bedrock_concurrency or 'unlimited'}; server log {log})")
+        else:
+            print(f"\n== {name} {url}")
+        try:
+            # first runs pay for graph construction and client setup
+            asyncio.run(closed_loop(url, 2, 3.0, args.timeout))
+            for mode in modes:
+                print(f"-- {mode} loop, {args.duration:.0f} s per level")
+                levels = parse_levels(args.users if mode == "closed" else args.rates)
+                asyncio.run(ramp(url, mode, levels, args.duration, args.timeout))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait(timeout=30)
+    sys.exit(0)
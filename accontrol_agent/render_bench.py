@@ -0,0 +1,79 @@
+import time
+import random
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from accontrol_agent.utils.position_render import PositionRenderer, encode_image
+
+WIDTH, HEIGHT = 1626, 1468
+PEOPLE_COUNTS = [10, 50, 100, 250, 500, 1000]
+ROUNDS = 5
+
+
+def make_images():
+    """Synthetic base/overlay rasters roughly the size of base.webp / cover2.webp."""
+    rng = np.random.default_rng(0)
+    base = rng.integers(200, 255, size=(HEIGHT, WIDTH, 3), dtype=np.uint8)
+    overlay = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    overlay[::40, :, :] = (30, 30, 30, 255)
+    overlay[:, ::40, :] = (30, 30, 30, 255)
+    overlay[HEIGHT // 3:HEIGHT // 2, WIDTH // 4:WIDTH // 2] = (0, 120, 255, 90)
+    return Image.fromarray(base, "RGB"), Image.fromarray(overlay, "RGBA")
+
+
+def make_humans(n):
+    return [
+        {"id": i + 10, "x": random.uniform(-23, 20), "y": random.uniform(-30, 35)}
+        for i in range(n)
+    ]
+
+
+def legacy_render(base, overlay, humans):
+    """The previous generate_position_image path, minus the S3 round trips."""
+    img = base.convert("RGBA")
+    overlay_img = overlay.convert("RGBA")
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
+    x_scale = width / 81.3
+    y_scale = height / 73.4
+    x_offset = width * 0.5
+    y_offset = height * 0.7
+    for human in humans:
+        x = (-human["y"] * x_scale) + x_offset
+        y = -((human["x"] * y_scale) + y_offset) + height
+        draw.ellipse((x - 10, y - 10, x + 10, y + 10), fill="red")
+    img.paste(overlay_img, (0, 0), overlay_img)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def timed(fn):
+    best = float("inf")
+    result = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    base, overlay = make_images()
+    renderer = PositionRenderer(base, overlay)
+
+    print(f"Image {WIDTH}x{HEIGHT}, best of {ROUNDS} runs (ms / bytes)")
+    print(f"{'people':>6} | {'legacy png':>16} | {'stamp only':>10} | {'png lvl1':>16} | {'webp q80 m0':>16}")
+    for n in PEOPLE_COUNTS:
+        humans = make_humans(n)
+        legacy_ms, legacy_bytes = timed(lambda: legacy_render(base, overlay, humans))
+        render_ms, pixels = timed(lambda: renderer.render(humans))
+        png_ms, png_bytes = timed(lambda: encode_image(renderer.render(humans), "PNG", compress_level=1))
+        webp_ms, webp_bytes = timed(lambda: encode_image(renderer.render(humans), "WEBP", quality=80, method=0))
+        print(
+            f"{n:>6} | {legacy_ms:7.1f} {len(legacy_bytes):>8} | {render_ms:10.1f} | "
+            f"{png_ms:7.1f} {len(png_bytes):>8} | {webp_ms:7.1f} {len(webp_bytes):>8}"
+        )
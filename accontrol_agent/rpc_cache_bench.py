@@ -0,0 +1,80 @@
+import io
+import os
+import json
+import time
+import random
+import statistics
+from contextlib import redirect_stdout
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+from accontrol_agent.utils import tools
+from accontrol_agent.utils.rpc_cache import RPCCache
+
+QUESTIONS = 400
+RPC_SECONDS = 0.08
+UPDATE_EVERY = 10     # one "device X updated" event per this many questions
+UNKNOWN_SHARE = 0.1   # questions about rooms the RPC knows nothing about
+ROOMS = ["403 CW2", "402 CW1", "405 中講義室", "404 SALC", "食堂", "階段教室"]
+DEVICES = {room: [f"{i:02d}{j:06d}-0000-0000-0000-000000000000" for j in range(3)] for i, room in enumerate(ROOMS)}
+
+
+class FakeSupabase:
+    """Rows carry a per-device version so stale answers can be detected."""
+
+    def __init__(self):
+        self.version = {d: 0 for devices in DEVICES.values() for d in devices}
+        self.calls = 0
+
+    def rows(self, room):
+        return [{"room": room, "device_id": d, "temperature": 26.0, "version": self.version[d]}
+                for d in DEVICES.get(room, [])]
+
+    def rpc(self, name, params):
+        outer = self
+
+        class Call:
+            def execute(self):
+                outer.calls += 1
+                time.sleep(RPC_SECONDS)
+                return type("Result", (), {"data": outer.rows(params["room_input"])})
+        return Call()
+
+
+def run(name, ttl):
+    rng = random.Random(1)
+    db = FakeSupabase()
+    tools._clients["supabase"] = db
+    cache = RPCCache(ttl=ttl)
+    tools.rpc_cache = cache
+    tools.rpc_change_feed.subscribers = [cache.on_change]
+    latencies, stale = [], 0
+    for i in range(QUESTIONS):
+        if i % UPDATE_EVERY == 0:
+            room = rng.choice(ROOMS)
+            device = rng.choice(DEVICES[room])
+            db.version[device] += 1
+            tools.rpc_change_feed.publish({"device_id": device, "temperature": 27.5})
+        # a few rooms get most questions during an incident
+        room = "未登録の部屋" if rng.random() < UNKNOWN_SHARE else ROOMS[min(int(rng.expovariate(0.8)), len(ROOMS) - 1)]
+        start = time.perf_counter()
+        # get_room_data prints every result; keep the table readable
+        with redirect_stdout(io.StringIO()):
+            result = tools.get_room_data.invoke({"room": json.dumps({"room": room})})
+        latencies.append(time.perf_counter() - start)
+        if isinstance(result, list):
+            stale += any(row["version"] != db.version[row["device_id"]] for row in result)
+    report = cache.report()
+    print(f"{name:>16} | {statistics.median(latencies) * 1000:6.1f} | {statistics.mean(latencies) * 1000:6.1f} | "
+          f"{db.calls:9d} | {report['hit_rate']:8.1%} | {report['negative_hits']:8d} | "
+          f"{report['invalidations']:6d} | {stale:5d}")
+
+
+if __name__ == "__main__":
+    print(f"{QUESTIONS} questions, RPC {RPC_SECONDS * 1000:.0f} ms, a device update every {UPDATE_EVERY} questions, "
+          f"{UNKNOWN_SHARE:.0%} unknown rooms")
+    print(f"{'cache':>16} | {'p50 ms':>6} | {'avg ms':>6} | {'RPC calls':>9} | {'hit rate':>8} | "
+          f"{'neg hits':>8} | {'inval.':>6} | {'stale':>5}")
+    run("none (ttl 0)", ttl=0)
+    run("ttl 60 s + feed", ttl=60)
@@ -0,0 +1,162 @@
+import io
+import os
+import gc
+import sys
+import random
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Fake backends without latency: the soak is about memory, not time
+for name in ("FAKE_LLM_MS", "FAKE_KB_MS", "FAKE_RPC_MS", "FAKE_WEATHER_MS"):
+    os.environ.setdefault(name, "0")
+# Bounded caches small enough to fill during warm-up, so what still grows afterwards is unbounded
+os.environ.setdefault("RPC_CACHE_MAX_ENTRIES", "64")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+
+QUESTIONS = [
+    "403 CW2 が暑いです",
+    "402 CW1 の湿度は？",
+    "405 中講義室のエアコンの設定温度を教えて",
+    "404 SALC は今何人いますか",
+    "今日の箕面キャンパスの天気は？",
+]
+
+
+def question(rng: random.Random, odd_share: float) -> str:
+    """Mostly the usual questions; odd_share of them name a room nobody asked about before (typos, new rooms)."""
+    if rng.random() < odd_share:
+        return f"{rng.randint(100, 999)} CW{rng.randint(1, 9)} の温度は？"
+    return rng.choice(QUESTIONS)
+
+
+def sample(run: int) -> dict:
+    from accontrol_agent.utils.memory_profile import rss_bytes
+
+    gc.collect()
+    # tracemalloc's own bookkeeping grows with every traced block; judge RSS without it
+    tracer = tracemalloc.get_tracemalloc_memory()
+    return {"run": run, "rss": rss_bytes() - tracer, "tracer": tracer,
+            "traced": tracemalloc.get_traced_memory()[0], "objects": len(gc.get_objects())}
+
+
+def slope(xs: list, ys: list) -> float:
+    """Least-squares slope of ys over xs."""
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+def growth(samples: list, metric: str, per_run_limit: float, monotonic_share: float) -> dict:
+    """
+    Flag a metric that keeps climbing: a positive trend above per_run_limit
+    units per run, with at least monotonic_share of consecutive samples
+    going up (a leak climbs steadily; allocator noise and caches filling
+    up once do not).
+    """
+    xs = [s["run"] for s in samples]
+    ys = [s[metric] for s in samples]
+    rising = sum(1 for a, b in zip(ys, ys[1:]) if b > a) / max(1, len(ys) - 1)
+    per_run = slope(xs, ys)
+    return {"metric": metric, "start": ys[0], "end": ys[-1], "per_run": per_run, "rising": rising,
+            "leak": per_run > per_run_limit and rising >= monotonic_share}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the agent graph thousands of times and flag memory growth")
+    parser.add_argument("--runs", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=300, help="runs before the baseline (caches, imports)")
+    parser.add_argument("--every", type=int, default=100, help="sample memory every N runs")
+    parser.add_argument("--topology", default=os.getenv("AGENT_TOPOLOGY", "validated"))
+    parser.add_argument("--odd-share", type=float, default=0.1, help="share of questions about never-seen rooms")
+    parser.add_argument("--checkpoint", action="store_true", help="run with the SQLite checkpointer")
+    parser.add_argument("--threads", type=int, default=50, help="conversation threads when checkpointing")
+    parser.add_argument("--profile", action="store_true",
+                        help="after the leak check, run --profile-runs more with AGENT_MEMORY_PROFILE per-node stats")
+    parser.add_argument("--profile-runs", type=int, default=200)
+    parser.add_argument("--traced-limit", type=float, default=64.0, help="traced bytes/run counted as a leak")
+    parser.add_argument("--rss-limit", type=float, default=256.0,
+                        help="RSS bytes/run (less tracemalloc's own memory) counted as a leak")
+    parser.add_argument("--objects-limit", type=float, default=0.5, help="live objects/run counted as a leak")
+    parser.add_argument("--monotonic", type=float, default=0.7, help="share of rising samples for a leak")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["AGENT_TOPOLOGY"] = args.topology
+    os.environ["AGENT_CHECKPOINT_DB"] = (os.path.join(tempfile.mkdtemp(prefix="soak_"), "checkpoints.sqlite")
+                                         if args.checkpoint else "")
+    # the leak check always runs unprofiled: the profiler's snapshots and run history grow RSS and
+    # traced memory themselves; --profile adds a separate profiled pass afterwards
+    os.environ["AGENT_MEMORY_PROFILE"] = "false"
+
+    from accontrol_agent.fake_backends import create_fake_agent_graph
+    from accontrol_agent.utils.checkpoint import thread_config
+
+    graph = create_fake_agent_graph()
+    # trace from here on: import-time allocations only make snapshots slower
+    tracemalloc.start()
+    rng = random.Random(args.seed)
+    samples, baseline, errors = [], None, 0
+    print(f"{args.runs} runs ({args.topology}, checkpoint {'on' if args.checkpoint else 'off'}, "
+          f"{args.odd_share:.0%} never-seen rooms), sampling every {args.every} after {args.warmup} warm-up runs")
+    print(f"{'run':>6} | {'RSS MiB':>8} | {'tracer MiB':>10} | {'traced KiB':>10} | {'objects':>8}")
+
+    for run in range(1, args.runs + 1):
+        config = thread_config(f"soak-{run % args.threads}") if args.checkpoint else None
+        with redirect_stdout(io.StringIO()):
+            try:
+                state = graph.invoke({"user_input": question(rng, args.odd_share)}, config)
+                errors += bool(state.get("error"))
+            except Exception:
+                errors += 1
+        if run == args.warmup:
+            baseline = tracemalloc.take_snapshot()
+        if run >= args.warmup and (run - args.warmup) % args.every == 0:
+            s = sample(run)
+            samples.append(s)
+            print(f"{run:6d} | {s['rss'] / 2**20:8.1f} | {s['tracer'] / 2**20:10.1f} | {s['traced'] / 1024:10.1f} | "
+                  f"{s['objects']:8d}")
+
+    print(f"\n{errors} runs ended with an error")
+    if len(samples) < 3:
+        print("too few samples after warm-up; raise --runs or lower --every")
+        sys.exit(2)
+
+    limits = {"traced": args.traced_limit, "rss": args.rss_limit, "objects": args.objects_limit}
+    verdicts = [growth(samples, metric, limit, args.monotonic) for metric, limit in limits.items()]
+    for v in verdicts:
+        print(f"{v['metric']:>8}: {v['start']} -> {v['end']}, {v['per_run']:+.2f}/run, "
+              f"rising in {v['rising']:.0%} of samples -> {'GROWING' if v['leak'] else 'flat'}")
+
+    print("\ntop allocators since warm-up (retained):")
+    own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    final = tracemalloc.take_snapshot().filter_traces(own)
+    for stat in final.compare_to(baseline.filter_traces(own), "lineno")[:10]:
+        print(f"  {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {stat.traceback[0]}")
+
+    if args.profile:
+        from accontrol_agent import graph as agent_graph
+        from accontrol_agent.utils.memory_profile import get_memory_profiler
+
+        agent_graph.AGENT_MEMORY_PROFILE = True
+        profiled = agent_graph.create_agent_graph()
+        for run in range(args.profile_runs):
+            config = thread_config(f"soak-{run % args.threads}") if args.checkpoint else None
+            with redirect_stdout(io.StringIO()):
+                try:
+                    profiled.invoke({"user_input": question(rng, args.odd_share)}, config)
+                except Exception:
+                    pass
+        report = get_memory_profiler().report()
+        print(f"\nper node over {args.profile_runs} profiled runs (state bytes last/max, traced delta total):")
+        for name, stats in report["nodes"].items():
+            print(f"  {name:>18}: {stats['calls']} calls, {stats['last_state_bytes']}/{stats['max_state_bytes']} B, "
+                  f"{stats['traced_delta'] / 1024:+.1f} KiB; largest {stats['largest_fields']}")
+        if report["undeclared_keys"]:
+            print(f"  state keys not in AgentState: {report['undeclared_keys']}")
+
+    sys.exit(1 if any(v["leak"] for v in verdicts) else 0)
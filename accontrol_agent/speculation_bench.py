@@ -0,0 +1,52 @@
+import io
+import time
+import statistics
+import contextlib
+
+from accontrol_agent import coalesce_bench as fakes
+from accontrol_agent.utils import tools, nodes
+from accontrol_agent.utils.rpc_cache import RPCCache
+
+ROUNDS = 5
+# Plain readings: the question already says what the manual search needs
+READINGS = [{"room": "403 CW2", "temperature": 29.1, "humidity": 55.0, "time": "2025-07-01T10:00:00"}]
+# Anomaly text the question did not mention: the early passages will not cover it
+ANOMALY = [{"room": "403 CW2", "temperature": 29.1, "anomaly": "室外機 高圧異常 E5 コンプレッサー停止"}]
+
+
+def run(name, speculative, rows, routed=False):
+    nodes.KB_SPECULATIVE = speculative
+    # router miss (the 400 ms tool-selection call speculation overlaps) unless routed
+    nodes.INTENT_ROUTER = routed
+    nodes.intent_router.shadow_rate = 0.0
+    fakes.FakeRPC.execute = lambda self: (fakes.count("rpc", fakes.RPC_SECONDS),
+                                          type("Result", (), {"data": rows}))[1]
+    nodes.kb_speculation.update(used=0, refined=0)
+    # every round queries the (patched) RPC: no cached or swept rows from an earlier scenario
+    tools.rpc_cache = RPCCache(ttl=0)
+    tools.ANOMALY_SWEEP_INTERVAL_SECONDS = 0
+    samples = []
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            nodes.collect_and_answer(f"403 CW2 が暑いです ({i})", "403 CW2", None, "")
+        samples.append(time.perf_counter() - start)
+    print(f"{name:>30} | {statistics.median(samples) * 1000:8.0f} | "
+          f"{nodes.kb_speculation['used']:4d} | {nodes.kb_speculation['refined']:7d}")
+
+
+if __name__ == "__main__":
+    tools._clients["llm"] = fakes.FakeLLM()
+    tools._clients["supabase"] = fakes.FakeSupabase()
+    tools.retrieve_with_lexical = fakes.fake_retrieve
+    tools._run_interface = fakes.fake_interface
+    print(f"tool selection {fakes.LLM_SECONDS * 1000:.0f} ms, RPC {fakes.RPC_SECONDS * 1000:.0f} ms, "
+          f"KB {fakes.KB_SECONDS * 1000:.0f} ms, answer {fakes.LLM_SECONDS * 1000:.0f} ms")
+    print(f"{'mode / tool data':>30} | {'p50 ms':>8} | {'used':>4} | {'refined':>7}")
+    run("sequential / readings", False, READINGS)
+    run("speculative / readings", True, READINGS)
+    run("sequential / anomaly text", False, ANOMALY)
+    run("speculative / anomaly text", True, ANOMALY)
+    # the intent router answers this question by rules: only the RPC is left to overlap
+    run("routed sequential / readings", False, READINGS, routed=True)
+    run("routed speculative / readings", True, READINGS, routed=True)
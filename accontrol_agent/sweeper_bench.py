@@ -0,0 +1,136 @@
+import io
+import os
+import json
+import time
+import random
+import threading
+import statistics
+from contextlib import redirect_stdout
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+from accontrol_agent.utils import tools, anomaly_sweeper
+from accontrol_agent.utils.rpc_cache import RPCCache
+
+# Wall-clock scaled down 12x: cache TTL 5 s stands for 60 s, a sweep every 2.5 s for 30 s
+DURATION = 30.0
+MEAN_GAP = 0.1          # seconds between questions (exponential)
+RPC_SECONDS = 0.08
+TTL = 5.0
+SWEEP_INTERVAL = 2.5
+UPDATE_EVERY = 20       # one "device X updated" event per this many questions
+ROOMS = list(dict.fromkeys(tools.ROOM_ALIASES.values()))
+DEVICES = {room: [f"{i:02d}{j:06d}-0000-0000-0000-000000000000" for j in range(3)] for i, room in enumerate(ROOMS)}
+
+
+class FakeSupabase:
+    """Per-device versions to detect stale answers; calls counted by origin (sweep or interactive)."""
+
+    def __init__(self):
+        self.version = {d: 0 for devices in DEVICES.values() for d in devices}
+        self.room_of = {d: room for room, devices in DEVICES.items() for d in devices}
+        self.calls = {"sweep": 0, "interactive": 0}
+        self.lock = threading.Lock()
+
+    def rows(self, params):
+        devices = DEVICES.get(params.get("room_input"), [])
+        if params.get("device_input") in self.room_of:
+            devices = [params["device_input"]]
+        return [{"room": self.room_of[d], "device_id": d, "temperature": 26.0, "version": self.version[d],
+                 "anomaly": self.version[d] % 4 == 3} for d in devices]
+
+    def rpc(self, name, params):
+        outer = self
+
+        class Call:
+            def execute(self):
+                origin = "sweep" if threading.current_thread().name.startswith("anomaly-sweep") else "interactive"
+                with outer.lock:
+                    outer.calls[origin] += 1
+                time.sleep(RPC_SECONDS)
+                if name == "get_rooms_anomaly":
+                    return type("Result", (), {"data": {r: outer.rows({"room_input": r}) for r in params["room_inputs"]}})
+                if name == "get_devices_anomaly":
+                    return type("Result", (), {"data": {d: outer.rows({"device_input": d})
+                                                        for d in params["device_inputs"]}})
+                return type("Result", (), {"data": outer.rows(params)})
+        return Call()
+
+
+def check_copies(sweeper):
+    """A caller changing swept rows must not change what the next lookup returns."""
+    entity = ("room", ROOMS[0])
+    rows = sweeper.lookup(entity)
+    if not rows:
+        return "skipped (not swept)"
+    before = json.dumps(rows, sort_keys=True)
+    rows[0]["temperature"] = -1.0
+    rows.append({"room": ROOMS[0]})
+    return "ok" if json.dumps(sweeper.lookup(entity), sort_keys=True) == before else "FAILED: lookup shares rows"
+
+
+def run(name, sweep: bool, batch: bool = False):
+    rng = random.Random(1)
+    db = FakeSupabase()
+    tools._clients.clear()
+    tools._clients["supabase"] = db
+    cache = RPCCache(ttl=TTL)
+    tools.rpc_cache = cache
+    tools.rpc_change_feed.subscribers = [cache.on_change]
+    tools.ANOMALY_SWEEP_INTERVAL_SECONDS = SWEEP_INTERVAL if sweep else 0
+    tools.ANOMALY_SWEEP_MAX_AGE_SECONDS = min(SWEEP_INTERVAL, TTL)
+    tools.ANOMALY_SWEEP_BATCH = batch
+    sweeper = tools.get_anomaly_sweeper() if sweep else None
+    if sweeper:
+        time.sleep(1.0)  # the first sweep finishes while the server starts
+
+    latencies, first, stale, asked = [], [], 0, set()
+    stop = time.perf_counter() + DURATION
+    i = 0
+    while time.perf_counter() < stop:
+        time.sleep(rng.expovariate(1 / MEAN_GAP))
+        if i % UPDATE_EVERY == 0:
+            device = rng.choice(list(db.version))
+            db.version[device] += 1
+            tools.rpc_change_feed.publish({"device_id": device, "room": db.room_of[device], "temperature": 27.5})
+        i += 1
+        room = rng.choice(ROOMS)
+        start = time.perf_counter()
+        # get_room_data prints every result; keep the table readable
+        with redirect_stdout(io.StringIO()):
+            result = tools.get_room_data.invoke({"room": json.dumps({"room": room})})
+        latency = time.perf_counter() - start
+        latencies.append(latency)
+        if room not in asked:
+            asked.add(room)
+            first.append(latency)
+        if isinstance(result, list):
+            stale += any(row["version"] != db.version[row["device_id"]] for row in result)
+    overview = tools.get_anomaly_overview.invoke({}) if sweeper else None
+    copies = check_copies(sweeper) if sweeper else None
+    if sweeper:
+        sweeper.stop()
+
+    latencies.sort()
+    memory = sum(1 for latency in latencies if latency < RPC_SECONDS / 4) / len(latencies)
+    sweeps = sweeper.report()["sweeps"] if sweeper else 0
+    print(f"{name:>18} | {len(latencies):9d} | {statistics.median(latencies) * 1000:6.1f} | "
+          f"{latencies[int(0.95 * len(latencies))] * 1000:6.1f} | {statistics.median(first) * 1000:8.1f} | "
+          f"{memory:7.1%} | {db.calls['interactive']:11d} | {db.calls['sweep']:9d} | {sweeps:6d} | {stale:5d}")
+    if overview:
+        print(f"{'':>18}   overview: {overview['rooms_swept']} rooms swept, anomalous {overview['anomalous_rooms']}")
+    if copies:
+        print(f"{'':>18}   changed lookup rows leave the sweep unchanged: {copies}")
+
+
+if __name__ == "__main__":
+    # the sweeper logs new anomalies from its own thread; keep the table readable
+    anomaly_sweeper.print = lambda *args, **kwargs: None
+    print(f"{DURATION:.0f} s of questions over {len(ROOMS)} rooms, RPC {RPC_SECONDS * 1000:.0f} ms, "
+          f"cache TTL {TTL:.0f} s, sweep every {SWEEP_INTERVAL} s, a device update every {UPDATE_EVERY} questions")
+    print(f"{'':>18} | {'questions':>9} | {'p50 ms':>6} | {'p95 ms':>6} | {'first ms':>8} | "
+          f"{'memory':>7} | {'interactive':>11} | {'sweep RPC':>9} | {'sweeps':>6} | {'stale':>5}")
+    run("rpc cache only", sweep=False)
+    run("sweep + rpc cache", sweep=True)
+    run("batched sweep", sweep=True, batch=True)
@@ -0,0 +1,92 @@
+import io
+import json
+import time
+import random
+import statistics
+import contextlib
+
+from accontrol_agent import coalesce_bench as fakes
+from accontrol_agent.utils import tools, nodes
+from accontrol_agent.graph import build_graph
+
+RUNS = 100
+P_GOOD = 0.7              # chance a drafted answer is actually good
+P_SELF_MISS = 0.25        # chance the self-check rates a bad answer as passing
+P_SELF_DOUBT = 0.1        # chance the self-check rates a good answer below threshold
+# validator rewrites: fixed and grounded / invents a reading / grounded but still wrong
+P_IMPROVED = (0.7, 0.15, 0.15)
+# Bedrock-like latencies scaled down 50x (tool selection 1.5 s, answer 4 s, answer + scores 4.5 s, QA 3 s)
+SELECT_S, ANSWER_S, SELF_CHECK_S, VALIDATE_S = 0.03, 0.08, 0.09, 0.06
+
+calls = {"llm": 0, "qa": 0}
+
+
+def scores(good, rng):
+    return {c: rng.randint(85, 95) if good else rng.randint(62, 79) for c in nodes.VALIDATION_CRITERIA}
+
+
+def improved_response(rng):
+    kind = rng.choices(["fixed", "invented", "wrong"], weights=P_IMPROVED)[0]
+    if kind == "invented":
+        return "403 CW2 の室温は 31.4℃ です。設定温度を 24℃ に下げてください。[bad]"
+    tag = "good" if kind == "fixed" else "bad"
+    return f"403 CW2 の室温は 29.1℃ です。設定温度と風量を確認してください。[{tag}]"
+
+
+def make_interface(rng):
+    def fake_interface(prompt):
+        calls["llm"] += 1
+        if "Quality Assurance expert. Please evaluate" in prompt:
+            calls["qa"] += 1
+            time.sleep(VALIDATE_S)
+            good = "[good]" in prompt
+            result = {c: {"score": v, "reason": "-"} for c, v in scores(good, rng).items()}
+            result["improved_response"] = "" if good else improved_response(rng)
+            return json.dumps(result, ensure_ascii=False)
+        good = rng.random() < P_GOOD
+        answer = f"403 CW2 の室温は 29.1℃ です。[{'good' if good else 'bad'}]"
+        if "Reply with JSON only" not in prompt:
+            time.sleep(ANSWER_S)
+            return answer
+        time.sleep(SELF_CHECK_S)
+        believed = good if rng.random() >= (P_SELF_DOUBT if good else P_SELF_MISS) else not good
+        return json.dumps({"answer": answer, **scores(believed, rng)}, ensure_ascii=False)
+    return fake_interface
+
+
+def run(topology, accept_improved):
+    nodes.VALIDATION_ACCEPT_IMPROVED = accept_improved
+    nodes.improved_acceptance.update(accepted=0, rejected=0)
+    rng = random.Random(7)
+    tools._run_interface = make_interface(rng)
+    calls.update(llm=0, qa=0)
+    fakes.upstream.clear()
+    graph = build_graph(topology)
+    latencies, retried, bad = [], 0, 0
+    for i in range(RUNS):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            out = graph.invoke({"user_input": f"403 CW2 が暑いです ({i})"})
+        latencies.append(time.perf_counter() - start)
+        retried += out.get("retry_count", 0) > 0
+        bad += "[bad]" in (out.get("final_result") or "")
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    llm_calls = fakes.upstream["llm"] + calls["llm"]  # tool selection + run_interface
+    name = f"{topology}{' + improved' if accept_improved else ''}"
+    print(f"{name:>21} | {statistics.median(latencies) * 50:7.1f} | {p95 * 50:7.1f} | "
+          f"{llm_calls / RUNS:9.2f} | {calls['qa'] / RUNS:6.2f} | {retried / RUNS:10.0%} | {bad:9d} | "
+          f"{nodes.improved_acceptance['accepted']:4d}/{nodes.improved_acceptance['rejected']:<4d}")
+
+
+if __name__ == "__main__":
+    fakes.LLM_SECONDS, fakes.RPC_SECONDS, fakes.KB_SECONDS = SELECT_S, 0.005, 0.01
+    tools._clients["llm"] = fakes.FakeLLM()
+    tools._clients["supabase"] = fakes.FakeSupabase()
+    tools.retrieve_with_lexical = fakes.fake_retrieve
+    print(f"{RUNS} runs, {P_GOOD:.0%} of drafts good; latencies rescaled to Bedrock seconds")
+    print(f"{'topology':>21} | {'p50 s':>7} | {'p95 s':>7} | {'LLM/run':>9} | {'QA/run':>6} | "
+          f"{'retry rate':>10} | {'bad final':>9} | improved acc/rej")
+    run("validated", accept_improved=False)
+    run("validated", accept_improved=True)
+    run("self_check", accept_improved=False)
+    run("self_check", accept_improved=True)
@@ -0,0 +1,210 @@
+import copy
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from accontrol_agent.utils.rpc_cache import record_entities
+
+
+def anomalous(row: dict) -> bool:
+    """A sensor row flagged by any anomaly column (anomaly, is_anomaly, temperature_anomaly, ...)."""
+    return isinstance(row, dict) and any("anomal" in str(k).lower() and v for k, v in row.items())
+
+
+def summarize_rows(rows) -> dict:
+    """Compact per-entity summary: row count, devices and which of them are anomalous."""
+    rows = rows if isinstance(rows, list) else []
+    devices = {e[1] for row in rows for e in record_entities(row) if e[0] == "device"}
+    flagged = {e[1] for row in rows if anomalous(row) for e in record_entities(row) if e[0] == "device"}
+    return {
+        "rows": len(rows),
+        "devices": len(devices),
+        "anomalous_devices": sorted(flagged),
+        "anomalous_rows": sum(1 for row in rows if anomalous(row)),
+        "fingerprint": hash(json.dumps(rows, sort_keys=True, ensure_ascii=False, default=str)),
+    }
+
+
+def diff_summaries(previous: dict | None, current: dict) -> dict:
+    """What changed for one entity since the last sweep."""
+    before = set(previous["anomalous_devices"]) if previous else set()
+    after = set(current["anomalous_devices"])
+    return {
+        "new_anomalies": sorted(after - before),
+        "cleared": sorted(before - after),
+        "changed": previous is None or previous["fingerprint"] != current["fingerprint"],
+    }
+
+
+class AnomalySweeper:
+    """
+    Background sweep of every room, then every device seen in the room
+    rows, keeping the latest RPC rows with a compact summary and the diff
+    against the previous sweep. lookup(entity) returns rows swept within
+    `max_age` seconds, or None so the caller falls back to a live query.
+    A change event for an entity drops its entry; a sweep result that
+    raced such an event is not stored. With a batch_loader(kind, ids) ->
+    {id: rows}, each kind is fetched `batch_size` entities per call
+    instead of one call per entity (per-entity loaders if a batch fails).
+    """
+
+    def __init__(self, rooms, room_loader, device_loader, interval: float = 60.0,
+                 max_age: float = 120.0, concurrency: int = 4, batch_loader=None, batch_size: int = 50):
+        self.rooms = list(dict.fromkeys(rooms))
+        self.room_loader = room_loader
+        self.device_loader = device_loader
+        self.batch_loader = batch_loader
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_age = max_age
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="anomaly-sweep")
+        self.lock = threading.Lock()
+        self.store = {}          # entity -> {"rows", "summary", "diff", "swept"}
+        self.invalidated = {}    # entity -> time of the last change event
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"sweeps": 0, "fetches": 0, "fetch_errors": 0, "raced": 0, "batches": 0,
+                      "batch_errors": 0, "fresh": 0, "stale": 0, "missing": 0, "last_sweep_seconds": 0.0}
+
+    def _fetch(self, entity: tuple):
+        started = time.monotonic()
+        loader = self.room_loader if entity[0] == "room" else self.device_loader
+        try:
+            rows = loader(entity[1])
+        except Exception as e:
+            print(f"[anomaly_sweeper] Error sweeping {entity[0]} {entity[1]}: {str(e)}")
+            with self.lock:
+                self.stats["fetch_errors"] += 1
+            return entity, started, None
+        return entity, started, rows
+
+    def _fetch_batch(self, entities: list) -> list:
+        started = time.monotonic()
+        kind = entities[0][0]
+        try:
+            results = self.batch_loader(kind, [entity[1] for entity in entities]) or {}
+        except Exception as e:
+            print(f"[anomaly_sweeper] Batch sweep of {len(entities)} {kind}s failed, querying one by one: {str(e)}")
+            with self.lock:
+                self.stats["batch_errors"] += 1
+            return [self._fetch(entity) for entity in entities]
+        with self.lock:
+            self.stats["batches"] += 1
+        # an entity missing from the result has no rows
+        return [(entity, started, results.get(entity[1]) or []) for entity in entities]
+
+    def _store(self, entity: tuple, started: float, rows) -> dict | None:
+        touched = {entity} | {e for row in (rows if isinstance(rows, list) else []) for e in record_entities(row)}
+        summary = summarize_rows(rows)
+        with self.lock:
+            self.stats["fetches"] += 1
+            if any(self.invalidated.get(e, -1.0) >= started for e in touched):
+                self.stats["raced"] += 1
+                return None
+            previous = self.store.get(entity)
+            diff = diff_summaries(previous["summary"] if previous else None, summary)
+            self.store[entity] = {"rows": rows, "summary": summary, "diff": diff, "swept": time.monotonic()}
+            return diff
+
+    def _sweep_entities(self, entities: list) -> dict:
+        if self.batch_loader is not None:
+            batches = [entities[i:i + self.batch_size] for i in range(0, len(entities), self.batch_size)]
+            fetched = [item for batch in self.pool.map(self._fetch_batch, batches) for item in batch]
+        else:
+            fetched = self.pool.map(self._fetch, entities)
+        changes = {}
+        for entity, started, rows in fetched:
+            if rows is None:
+                continue
+            diff = self._store(entity, started, rows)
+            if diff and (diff["changed"] or diff["new_anomalies"] or diff["cleared"]):
+                changes[entity] = diff
+        return changes
+
+    def sweep(self) -> dict:
+        """One pass over all rooms, then all devices known from room rows; returns the changed entities."""
+        started = time.monotonic()
+        changes = self._sweep_entities([("room", room) for room in self.rooms])
+        with self.lock:
+            devices = sorted({e for entry in self.store.values() for row in entry["rows"] or []
+                              for e in record_entities(row) if e[0] == "device"})
+            # events older than this sweep can no longer race anything
+            self.invalidated = {e: t for e, t in self.invalidated.items() if t >= started}
+        changes.update(self._sweep_entities(devices))
+        with self.lock:
+            self.stats["sweeps"] += 1
+            self.stats["last_sweep_seconds"] = round(time.monotonic() - started, 3)
+        new = sorted(d for diff in changes.values() for d in diff["new_anomalies"])
+        if new:
+            print(f"[anomaly_sweeper] New anomalies since last sweep: {new}")
+        return changes
+
+    def lookup(self, entity: tuple):
+        """Swept rows for entity if younger than max_age, else None."""
+        with self.lock:
+            entry = self.store.get(entity)
+            if entry is None:
+                self.stats["missing"] += 1
+                return None
+            if time.monotonic() - entry["swept"] > self.max_age:
+                self.stats["stale"] += 1
+                return None
+            self.stats["fresh"] += 1
+            rows = entry["rows"]
+        # swept rows are shared by every caller: hand out copies (outside the lock), as RPCCache does
+        return copy.deepcopy(rows)
+
+    def summary(self, entity: tuple) -> dict | None:
+        """Compact summary and diff since the previous sweep for a fresh entity, else None."""
+        with self.lock:
+            entry = self.store.get(entity)
+            if entry is None or time.monotonic() - entry["swept"] > self.max_age:
+                return None
+            summary = {k: v for k, v in entry["summary"].items() if k != "fingerprint"}
+            return {**summary, **entry["diff"], "swept_seconds_ago": round(time.monotonic() - entry["swept"], 1)}
+
+    def overview(self) -> dict:
+        """Fresh room summaries, rooms with anomalies (or changes since the last sweep) first."""
+        rooms = {room: self.summary(("room", room)) for room in self.rooms}
+        rooms = {room: s for room, s in rooms.items() if s is not None}
+        flagged = lambda s: bool(s["anomalous_devices"] or s["new_anomalies"] or s["cleared"])
+        return {
+            "rooms_swept": len(rooms),
+            "rooms_missing": sorted(set(self.rooms) - set(rooms)),
+            "anomalous_rooms": sorted(room for room, s in rooms.items() if s["anomalous_devices"]),
+            "rooms": dict(sorted(rooms.items(), key=lambda kv: not flagged(kv[1]))),
+        }
+
+    def on_change(self, record: dict):
+        """Change-feed callback: forget the swept rows of the row's device and room."""
+        now = time.monotonic()
+        with self.lock:
+            for entity in record_entities(record):
+                self.invalidated[entity] = now
+                self.store.pop(entity, None)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[anomaly_sweeper] Sweep failed: {str(e)}")
+            # fixed rate: each entity is refreshed every `interval`, however long a sweep takes
+            self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="anomaly-sweeper", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def report(self) -> dict:
+        with self.lock:
+            lookups = self.stats["fresh"] + self.stats["stale"] + self.stats["missing"]
+            return {**self.stats, "entities": len(self.store),
+                    "hit_rate": round(self.stats["fresh"] / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,151 @@
+import time
+import asyncio
+import threading
+
+from accontrol_agent.utils.position_store import PositionStore
+from accontrol_agent.utils.occupancy import OccupancyAggregator
+
+
+class AreaState:
+    """Cache, change detection and per-area pipeline state for one area_id."""
+
+    def __init__(self, area_id: int, config: dict, snapshot_ring: int = 32, cell_m: float = 1.0):
+        self.area_id = area_id
+        self.config = config
+        self.name = config.get("name", str(area_id))
+        self.entries = []
+        self.store = PositionStore(max_snapshots=snapshot_ring)
+        self.occupancy = OccupancyAggregator(cell_m=cell_m, floor=config.get("floor"))
+        self.broadcaster = None
+        self.renderer = None
+        # guards lazy per-area state built in worker threads (renderer)
+        self.lock = threading.Lock()
+        self.rooms = None  # RoomOccupancy, once room polygons are loaded
+        self.history = None  # HistoryWriter
+
+        self.fetches = 0
+        self.changes = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.people = 0
+        self.total_latency_ms = 0.0
+        self.last_latency_ms = None
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.store.token,
+            "fetches": self.fetches,
+            "changes": self.changes,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": round(self.total_latency_ms / self.fetches, 1) if self.fetches else None,
+        }
+
+
+class MultiAreaPoller:
+    """
+    Polls several areas concurrently, at most `max_concurrency` requests in
+    flight. Each area runs its own fetch -> change detection -> pipeline
+    chain, so a slow or failing area never holds back the others.
+    `fetch(area_id)` returns the API entries (or None); `on_change(area)` is
+    the blocking S3/render pipeline and runs in a worker thread.
+    """
+
+    def __init__(self, areas: dict, fetch, on_change=None, max_concurrency: int = 4,
+                 timeout: float = 10.0):
+        self.areas = areas
+        self.fetch = fetch
+        self.on_change = on_change
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.rounds = 0
+        self.started_at = None
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # direct Lambda invocations run each poll on a fresh event loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def poll_area(self, area: AreaState) -> bool:
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        try:
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    entries = await asyncio.wait_for(self.fetch(area.area_id), self.timeout)
+                finally:
+                    area.fetches += 1
+                    area.last_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+                    area.total_latency_ms += area.last_latency_ms
+        except asyncio.TimeoutError:
+            area.timeouts += 1
+            print(f"[area {area.area_id}] Fetch timed out after {self.timeout}s.")
+            return False
+        except Exception as e:
+            area.errors += 1
+            print(f"[area {area.area_id}] Error occurred while fetching data: {str(e)}")
+            return False
+
+        if not entries or not isinstance(entries, list):
+            print(f"[area {area.area_id}] API response is missing required data.")
+            return False
+        if not area.store.update(entries):
+            print(f"[area {area.area_id}] Data has not changed based on the time field.")
+            return False
+
+        area.entries = entries
+        area.changes += 1
+        area.people += sum(len(entry.get("data") or []) for entry in entries)
+        print(f"[area {area.area_id}] Data received and stored in cache (version {area.store.token}).")
+
+        if area.broadcaster is not None:
+            area.broadcaster.publish()
+        area.occupancy.add_snapshot(entries)
+        if area.rooms is not None:
+            area.rooms.update(entries)
+        if self.on_change is not None:
+            try:
+                await asyncio.to_thread(self.on_change, area)
+            except Exception as e:
+                area.errors += 1
+                print(f"[area {area.area_id}] Error in area pipeline: {str(e)}")
+        return True
+
+    async def poll_once(self, area_ids=None) -> list[bool]:
+        area_ids = list(self.areas) if area_ids is None else area_ids
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.poll_area(self.areas[a]) for a in area_ids))
+        self.rounds += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Polled {len(area_ids)} areas in {elapsed_ms:.0f} ms ({sum(results)} changed).")
+        return results
+
+    def report(self) -> dict:
+        """Aggregate throughput since the first poll plus per-area stats."""
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        fetches = sum(a.fetches for a in self.areas.values())
+        changes = sum(a.changes for a in self.areas.values())
+        people = sum(a.people for a in self.areas.values())
+        return {
+            "areas": len(self.areas),
+            "max_concurrency": self.max_concurrency,
+            "rounds": self.rounds,
+            "elapsed_s": round(elapsed, 1),
+            "fetches": fetches,
+            "changes": changes,
+            "errors": sum(a.errors for a in self.areas.values()),
+            "timeouts": sum(a.timeouts for a in self.areas.values()),
+            "fetches_per_s": round(fetches / elapsed, 2) if elapsed else None,
+            "snapshots_per_s": round(changes / elapsed, 2) if elapsed else None,
+            "people_per_s": round(people / elapsed, 1) if elapsed else None,
+            "per_area": {a.area_id: a.stats() for a in self.areas.values()},
+        }
@@ -0,0 +1,219 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+
+# Error codes Bedrock uses when a model or account is over quota / busy
+THROTTLE_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+# Errors botocore's standard retry mode would retry that are not throttles (those go through AIMD)
+TRANSIENT_CODES = {"InternalServerException", "InternalFailure", "RequestTimeout", "RequestTimeoutException"}
+TRANSIENT_ERRORS = {"ConnectionError", "EndpointConnectionError", "ConnectionClosedError",
+                    "ReadTimeoutError", "ConnectTimeoutError"}
+# Client methods that count against a model (or knowledge base) quota
+LIMITED_METHODS = {
+    "invoke_model",
+    "invoke_model_with_response_stream",
+    "converse",
+    "converse_stream",
+    "retrieve",
+    "retrieve_and_generate",
+}
+
+DEFAULT_BUDGET = int(os.getenv("BEDROCK_DEFAULT_CONCURRENCY", "8"))
+MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "6"))
+# as in botocore's standard mode: 5xx and connection errors get up to 3 attempts
+TRANSIENT_ATTEMPTS = int(os.getenv("BEDROCK_TRANSIENT_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("BEDROCK_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("BEDROCK_BACKOFF_CAP", "20"))
+
+
+def parse_budgets(spec: str) -> dict:
+    """"model-a=4,model-b=16" -> {"model-a": 4, "model-b": 16}"""
+    budgets = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, value = part.rsplit("=", 1)
+            budgets[name.strip()] = int(value)
+    return budgets
+
+
+# Per-model concurrency ceilings; anything not listed gets DEFAULT_BUDGET
+MODEL_BUDGETS = parse_budgets(os.getenv("BEDROCK_MODEL_BUDGETS", ""))
+
+
+class BedrockThrottled(Exception):
+    """Raised when a call is still throttled after MAX_ATTEMPTS."""
+
+
+def is_throttle(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLE_CODES
+
+
+def is_transient(error: Exception) -> bool:
+    """A 5xx or connection / timeout error worth retrying (throttles excluded)."""
+    if is_throttle(error):
+        return False
+    if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+        return True
+    response = getattr(error, "response", None) or {}
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    return response.get("Error", {}).get("Code") in TRANSIENT_CODES or status >= 500
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one model. Each success raises the limit by
+    1/limit (about +1 per round of calls) up to `max_limit`; a throttle
+    halves it. Only calls started after the last decrease can halve it
+    again, so a burst of throttles from one overload counts once (as TCP
+    does once per window). Callers over the limit wait in acquire(), and
+    the wait is recorded.
+    """
+
+    def __init__(self, name: str, max_limit: int, min_limit: int = 1):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.last_decrease = 0.0
+        self.waits = deque(maxlen=1024)
+        self.stats = {"calls": 0, "throttles": 0, "retries": 0, "failures": 0, "decreases": 0}
+
+    def acquire(self) -> float:
+        start = time.monotonic()
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+            started = time.monotonic()
+            self.waits.append(started - start)
+        return started
+
+    def release(self, started: float, throttled: bool = False, count: str | None = None):
+        """Give the slot back; `count` names the stat this attempt adds to (under the same lock)."""
+        with self.cond:
+            self.in_flight -= 1
+            if count:
+                self.stats[count] += 1
+            if throttled:
+                self.stats["throttles"] += 1
+                if started > self.last_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = time.monotonic()
+                    self.stats["decreases"] += 1
+                    print(f"[bedrock] {self.name} throttled, concurrency limit -> {int(self.limit)}")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn under the limit, retrying throttles (up to MAX_ATTEMPTS, and
+        halving the limit) and transient 5xx / connection errors (up to
+        TRANSIENT_ATTEMPTS) with jittered backoff.
+        """
+        throttles = transients = 0
+        while True:
+            started = self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttle(e)
+                if throttled:
+                    throttles += 1
+                    retry = throttles < MAX_ATTEMPTS
+                else:
+                    transients += is_transient(e)
+                    retry = is_transient(e) and transients < TRANSIENT_ATTEMPTS
+                self.release(started, throttled=throttled, count="retries" if retry else "failures")
+                if throttled and not retry:
+                    raise BedrockThrottled(f"{self.name} still throttled after {MAX_ATTEMPTS} attempts") from e
+                if not retry:
+                    raise
+                time.sleep(backoff_delay((throttles if throttled else transients) - 1, BACKOFF_BASE, BACKOFF_CAP))
+                continue
+            self.release(started, count="calls")
+            return result
+
+    def report(self) -> dict:
+        with self.cond:
+            stats, waits = dict(self.stats), sorted(self.waits)
+            limit, in_flight = self.limit, self.in_flight
+        pick = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 1) if waits else 0.0
+        return {
+            **stats,
+            "limit": round(limit, 2),
+            "max_limit": self.max_limit,
+            "in_flight": in_flight,
+            "queue_wait_ms": {"p50": pick(0.5), "p95": pick(0.95), "max": pick(1.0)},
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> AdaptiveLimiter:
+    """Process-wide limiter per model id / knowledge base id."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model)
+            if limiter is None:
+                limiter = _limiters[model] = AdaptiveLimiter(model, MODEL_BUDGETS.get(model, DEFAULT_BUDGET))
+    return limiter
+
+
+def limiter_report() -> dict:
+    return {name: limiter.report() for name, limiter in list(_limiters.items())}
+
+
+class LimitedClient:
+    """
+    Wraps a bedrock-runtime / bedrock-agent-runtime boto3 client so every
+    model call goes through the limiter for its modelId (or
+    knowledgeBaseId). Everything else is passed through, so it can be
+    handed to ChatBedrockConverse or BedrockEmbedder like the raw client.
+    Streaming calls hold a slot only until the stream is opened.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in LIMITED_METHODS:
+            return attr
+
+        def limited(*args, **kwargs):
+            key = kwargs.get("modelId") or kwargs.get("knowledgeBaseId") or name
+            return get_limiter(key).call(attr, *args, **kwargs)
+        return limited
+
+
+def limited_client(service: str, region: str):
+    """
+    boto3 client for `service` behind the limiter. botocore's own retries
+    are turned off; otherwise each throttle would be retried inside the
+    slot, invisible to the limiter. AdaptiveLimiter.call retries throttles
+    and the transient errors botocore would have retried instead.
+    """
+    import boto3
+    from botocore.config import Config
+
+    config = Config(retries={"total_max_attempts": 1, "mode": "standard"})
+    return LimitedClient(boto3.client(service, region_name=region, config=config))
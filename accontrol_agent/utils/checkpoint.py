@@ -0,0 +1,171 @@
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+BLOB_MIN_BYTES = 512
+BLOB_KEY = "__blob__"
+BLOB_TYPE = "blob"
+
+
+class BlobStore:
+    """
+    Content-addressed, zlib-compressed serialized values in a `blobs` table.
+    Blobs are never deleted on their own: LangGraph only deletes checkpoints
+    with delete_thread, after which ContentAddressedSerializer.collect drops
+    the blobs nothing refers to any more.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, max_known: int = 4096, cache_size: int = 1024):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.max_known = max_known
+        self.cache_size = cache_size
+        self.known = OrderedDict()  # digest -> monotonic time of its last put, oldest first
+        self.cache = OrderedDict()  # digest -> (type, data), least recently used first
+        with self.lock:
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, type TEXT, data BLOB)")
+            conn.commit()
+
+    def put(self, typ: str, data: bytes) -> str:
+        digest = hashlib.sha256(typ.encode() + b"\0" + data).hexdigest()
+        with self.lock:
+            if digest not in self.known:
+                self.conn.execute("INSERT OR IGNORE INTO blobs (hash, type, data) VALUES (?, ?, ?)",
+                                  (digest, typ, zlib.compress(data)))
+                self.conn.commit()
+            self.known[digest] = time.monotonic()
+            self.known.move_to_end(digest)
+            while len(self.known) > self.max_known:
+                self.known.popitem(last=False)
+        return digest
+
+    def get(self, digest: str) -> tuple[str, bytes]:
+        with self.lock:
+            value = self.cache.get(digest)
+            if value is None:
+                typ, data = self.conn.execute("SELECT type, data FROM blobs WHERE hash = ?",
+                                              (digest,)).fetchone()
+                value = self.cache[digest] = (typ, zlib.decompress(data))
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            self.cache.move_to_end(digest)
+            return value
+
+    def collect(self, referenced: set, grace: float = 300.0) -> int:
+        """
+        Delete blobs not in `referenced`, except those put in the last `grace`
+        seconds (their checkpoint may not be committed yet). Only this
+        process's puts are known, so run it while no other process writes.
+        """
+        with self.lock:
+            now = time.monotonic()
+            keep = referenced | {d for d, t in self.known.items() if now - t < grace}
+            drop = [h for (h,) in self.conn.execute("SELECT hash FROM blobs") if h not in keep]
+            self.conn.executemany("DELETE FROM blobs WHERE hash = ?", [(h,) for h in drop])
+            self.conn.commit()
+            for h in drop:
+                self.known.pop(h, None)
+                self.cache.pop(h, None)
+        return len(drop)
+
+
+class ContentAddressedSerializer:
+    """
+    Wraps LangGraph's msgpack serializer. Every node returns the whole
+    state, so unchanged tool payloads, KB passages and answers would be
+    re-serialized into each checkpoint and pending write. Values whose
+    msgpack form is at least `min_bytes` are stored once in the blob table
+    and replaced by their hash: at the top level for pending writes, and
+    per channel inside a checkpoint's channel_values.
+    """
+
+    def __init__(self, blobs: BlobStore, min_bytes: int = BLOB_MIN_BYTES, inner=None):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        self.blobs = blobs
+        self.min_bytes = min_bytes
+        self.inner = inner or JsonPlusSerializer()
+
+    def _ref(self, value):
+        typ, data = self.inner.dumps_typed(value)
+        if len(data) < self.min_bytes:
+            return value
+        return {BLOB_KEY: self.blobs.put(typ, data)}
+
+    def _deref(self, value):
+        if isinstance(value, dict) and len(value) == 1 and BLOB_KEY in value:
+            return self.inner.loads_typed(self.blobs.get(value[BLOB_KEY]))
+        return value
+
+    def dumps_typed(self, obj):
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            obj = {**obj, "channel_values": {k: self._ref(v) for k, v in obj["channel_values"].items()}}
+            return self.inner.dumps_typed(obj)
+        typ, data = self.inner.dumps_typed(obj)
+        if len(data) < self.min_bytes:
+            return typ, data
+        return BLOB_TYPE, self.blobs.put(typ, data).encode()
+
+    def loads_typed(self, data):
+        typ, payload = data
+        if typ == BLOB_TYPE:
+            return self.inner.loads_typed(self.blobs.get(payload.decode()))
+        obj = self.inner.loads_typed(data)
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            obj["channel_values"] = {k: self._deref(v) for k, v in obj["channel_values"].items()}
+        return obj
+
+    def collect(self, conn: sqlite3.Connection, grace: float = 300.0) -> int:
+        """Drop blobs no checkpoint or pending write in the saver's database refers to; returns the count."""
+        referenced = set()
+        for typ, data in conn.execute("SELECT type, checkpoint FROM checkpoints"):
+            obj = self.inner.loads_typed((typ, data))
+            for value in (obj.get("channel_values") or {}).values():
+                if isinstance(value, dict) and len(value) == 1 and BLOB_KEY in value:
+                    referenced.add(value[BLOB_KEY])
+        for (value,) in conn.execute("SELECT value FROM writes WHERE type = ?", (BLOB_TYPE,)):
+            referenced.add(value.decode())
+        return self.blobs.collect(referenced, grace)
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@lru_cache(maxsize=None)
+def create_checkpointer(path: str):
+    """
+    SQLite checkpointer shared by every graph compiled in this process.
+    WAL with synchronous=NORMAL turns each checkpoint commit into an append
+    without an fsync; together with LangGraph's default "async" durability
+    the writes overlap the next node instead of delaying it. Large values
+    go through ContentAddressedSerializer.
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    serde = ContentAddressedSerializer(BlobStore(open_db(path)))
+    return SqliteSaver(open_db(path), serde=serde)
+
+
+def thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def resume(graph, thread_id: str):
+    """
+    Continue an interrupted run from the last completed node. Passing None
+    as input makes LangGraph pick up the pending tasks of the thread's
+    latest checkpoint instead of starting over.
+    """
+    config = thread_config(thread_id)
+    if not graph.get_state(config).next:
+        print(f"[checkpoint] Thread {thread_id} has nothing pending.")
+        return graph.get_state(config).values
+    return graph.invoke(None, config)
@@ -0,0 +1,150 @@
+import re
+import json
+import random
+import threading
+from collections import OrderedDict, Counter
+
+from accontrol_agent.utils.single_flight import normalize_question
+
+WEATHER_WORDS = ("天気", "天候", "外気", "屋外", "外の", "雨", "weather", "forecast", "outside", "rain")
+OCCUPANCY_WORDS = ("何人", "人数", "混んで", "混雑", "空いて", "occupancy", "how many people", "crowd")
+# Words asking for a current reading; enough, with a room, to be sure get_room_data is wanted
+SENSOR_WORDS = ("温度", "室温", "湿度", "湿気", "暑", "寒", "暖", "冷", "蒸し", "co2", "二酸化炭素", "異常",
+                "センサ", "temperature", "humid", "hot", "cold", "anomal", "sensor")
+# Equipment words that fit readings and how-to questions alike: they pick get_room_data, but never surely
+GENERIC_WORDS = ("エアコン", "空調", "設定", "快適", "air")
+# How-to / manual questions: the KB answers them, sensor data may not be wanted at all
+MANUAL_WORDS = ("マニュアル", "使い方", "手順", "方法", "対策", "やり方", "manual", "how to", "how do")
+UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+DIGITS = re.compile(r"\d+")
+
+
+def query_template(question: str, room: str | None, device_id: str | None) -> str:
+    """Normalized question with the entities masked, so "403 CW2 が暑い" and "402 CW1 が暑い" share a template."""
+    text = question
+    if room:
+        text = re.sub(re.escape(room), " <room> ", text, flags=re.IGNORECASE)
+    if device_id:
+        text = re.sub(re.escape(device_id), " <device> ", text, flags=re.IGNORECASE)
+    text = UUID.sub(" <device> ", text)
+    return DIGITS.sub("#", normalize_question(text))
+
+
+def tool_call(name: str, room: str | None, device_id: str | None) -> dict:
+    """A tool call shaped like the ones the tool-selection LLM emits (JSON string arguments)."""
+    if name == "get_device_data":
+        return {"name": name, "input": {"device_id": json.dumps({"device_id": device_id}, ensure_ascii=False)}}
+    if name in ("get_room_data", "get_room_occupancy"):
+        return {"name": name, "input": {"room": json.dumps({"room": room}, ensure_ascii=False)}}
+    return {"name": name, "input": {}}
+
+
+def rule_plan(question: str, room: str | None, device_id: str | None) -> tuple[list[str], bool]:
+    """
+    Tool names for the question by keyword rules, and whether the rules
+    are sure: every tool is backed by a specific keyword and has its
+    entity, and the question is not a how-to / manual question.
+    """
+    text = normalize_question(question)
+    has = lambda words: any(w in text for w in words)
+    weather, occupancy, sensor = has(WEATHER_WORDS), has(OCCUPANCY_WORDS), has(SENSOR_WORDS)
+    generic, manual = has(GENERIC_WORDS), has(MANUAL_WORDS)
+    plan = []
+    if device_id:
+        plan.append("get_device_data")
+    elif room and (sensor or generic or not (weather or occupancy)):
+        plan.append("get_room_data")
+    if occupancy and room:
+        plan.append("get_room_occupancy")
+    if weather:
+        plan.append("get_weather_data")
+    # get_room_data backed only by a generic word (or by nothing) is a guess
+    room_guess = "get_room_data" in plan and not sensor
+    sure = (bool(plan) and (weather or occupancy or sensor) and not (occupancy and not room)
+            and not room_guess and not manual)
+    return plan, sure
+
+
+class IntentRouter:
+    """
+    Picks the tools for a question without the tool-selection LLM call
+    when it can: keyword rules first, then a cache of what the LLM chose
+    for the same query template (entities masked) once it has chosen the
+    same tools `learn_after` times. Anything else goes to the LLM, whose
+    choice is remembered. A `shadow_rate` share of routed questions also
+    asks the LLM, to measure how often the router disagrees with it.
+    """
+
+    def __init__(self, learn_after: int = 2, shadow_rate: float = 0.05, max_templates: int = 1024):
+        self.learn_after = learn_after
+        self.shadow_rate = shadow_rate
+        self.max_templates = max_templates
+        self.lock = threading.Lock()
+        self.templates = OrderedDict()   # template -> Counter of LLM tool sets
+        self.stats = {"rules": 0, "learned": 0, "llm": 0, "shadow_checks": 0, "disagreements": 0}
+        self.disagreements = Counter()   # (router tools, LLM tools) -> count
+
+    def _learned(self, template: str) -> tuple | None:
+        with self.lock:
+            votes = self.templates.get(template)
+            if not votes:
+                return None
+            self.templates.move_to_end(template)
+            tools, count = votes.most_common(1)[0]
+            # only a template the LLM always answered the same way
+            return tools if count >= self.learn_after and len(votes) == 1 else None
+
+    def _remember(self, template: str, tools: tuple):
+        with self.lock:
+            self.templates.setdefault(template, Counter())[tools] += 1
+            self.templates.move_to_end(template)
+            while len(self.templates) > self.max_templates:
+                self.templates.popitem(last=False)
+
+    def _compare(self, routed: tuple, chosen: tuple):
+        with self.lock:
+            self.stats["shadow_checks"] += 1
+            if routed != chosen:
+                self.stats["disagreements"] += 1
+                self.disagreements[(routed, chosen)] += 1
+
+    def route(self, question: str, room, device_id, select_with_llm) -> list[dict]:
+        """Tool calls for the question; select_with_llm(question, room, device_id) is the fallback."""
+        template = query_template(question, room, device_id)
+        plan, sure = rule_plan(question, room, device_id)
+        source = "rules" if sure else None
+        if not sure:
+            learned = self._learned(template)
+            needs = {"get_room_data": room, "get_room_occupancy": room, "get_device_data": device_id}
+            if learned is not None and all(needs.get(name, True) for name in learned):
+                plan, source = list(learned), "learned"
+
+        if source and random.random() >= self.shadow_rate:
+            with self.lock:
+                self.stats[source] += 1
+            return [tool_call(name, room, device_id) for name in plan]
+
+        calls = select_with_llm(question, room, device_id)
+        chosen = tuple(sorted(call["name"] for call in calls))
+        self._remember(template, chosen)
+        if source:
+            # shadow check: the router decided, the LLM was asked anyway; its answer is used
+            self._compare(tuple(sorted(plan)), chosen)
+        else:
+            with self.lock:
+                self.stats["llm"] += 1
+        return calls
+
+    def report(self) -> dict:
+        with self.lock:
+            routed = self.stats["rules"] + self.stats["learned"]
+            total = routed + self.stats["llm"] + self.stats["shadow_checks"]
+            return {
+                **self.stats,
+                "templates": len(self.templates),
+                # share of questions that skipped the tool-selection LLM call
+                "hit_rate": round(routed / total, 3) if total else 0.0,
+                "disagreement_rate": round(self.stats["disagreements"] / self.stats["shadow_checks"], 3)
+                if self.stats["shadow_checks"] else 0.0,
+                "top_disagreements": [(list(r), list(c), n) for (r, c), n in self.disagreements.most_common(5)],
+            }
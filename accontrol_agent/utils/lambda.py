@@ -1,17 +1,47 @@
+import os
 import json
-import boto3
+from accontrol_agent.utils.rerank import rerank_passages
+from accontrol_agent.utils.bedrock_limiter import limited_client, limiter_report
+
+RAG_MAX_PASSAGES = int(os.getenv("RAG_MAX_PASSAGES", "5"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "3000"))
+# "bedrock" (KB JOSLJLSFLZ) or "local" (memory-mapped index built with build_vector_index.py)
+RAG_KB_BACKEND = os.getenv("RAG_KB_BACKEND", "bedrock")
+RAG_LOCAL_INDEX_PATH = os.getenv("RAG_LOCAL_INDEX_PATH", "kb_index")
+local_index = None
+clients = {}
+
+def get_client(service: str, region: str):
+    """Reused per container; calls go through the per-model limiters."""
+    if (service, region) not in clients:
+        clients[service, region] = limited_client(service, region)
+    return clients[service, region]
+
+def get_local_index():
+    global local_index
+    if local_index is None:
+        from accontrol_agent.utils.vector_index import open_local_index
+        local_index = open_local_index(
+            RAG_LOCAL_INDEX_PATH,
+            get_client('bedrock-runtime', 'us-east-1'),
+            n_probe=int(os.getenv("RAG_LOCAL_N_PROBE", "8")),
+        )
+    return local_index
 
 def retrieve_knowledge(input_prompt: str):
-    bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name='ap-northeast-1')
-    response = bedrock_agent_runtime.retrieve(
-        knowledgeBaseId='JOSLJLSFLZ',
-        retrievalQuery={'text': input_prompt},
-        retrievalConfiguration={
-            'vectorSearchConfiguration': {
-                'numberOfResults': 10,
+    if RAG_KB_BACKEND == "local":
+        response = {'retrievalResults': get_local_index().retrieve(input_prompt, 10)}
+    else:
+        bedrock_agent_runtime = get_client('bedrock-agent-runtime', 'ap-northeast-1')
+        response = bedrock_agent_runtime.retrieve(
+            knowledgeBaseId='JOSLJLSFLZ',
+            retrievalQuery={'text': input_prompt},
+            retrievalConfiguration={
+                'vectorSearchConfiguration': {
+                    'numberOfResults': 10,
+                }
             }
-        }
-    )
+        )
 
     generated_text = response.get('output', {}).get('text', '')
     results = response['retrievalResults'] if response.get('retrievalResults') else []
@@ -34,7 +64,7 @@ def retrieve_knowledge(input_prompt: str):
     }
 
 def generate_response(prompt: str):
-    bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+    bedrock_runtime = get_client('bedrock-runtime', 'us-east-1')
     try:
         input_data = {
             "thinking": {"type": "enabled", "budget_tokens": 1600},
@@ -52,9 +82,38 @@ def generate_response(prompt: str):
     except Exception as e:
         return {"error": str(e)}
 
+def generate_response_stream(prompt: str):
+    """Yield answer text as it is generated (thinking deltas are skipped)."""
+    bedrock_runtime = get_client('bedrock-runtime', 'us-east-1')
+    input_data = {
+        "thinking": {"type": "enabled", "budget_tokens": 1600},
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 2048,
+        "anthropic_version": "bedrock-2023-05-31"
+    }
+    response = bedrock_runtime.invoke_model_with_response_stream(
+        modelId="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
+        body=json.dumps(input_data),
+        contentType='application/json'
+    )
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        data = json.loads(chunk['bytes'].decode('utf-8'))
+        if data.get('type') == 'content_block_delta' and data['delta'].get('type') == 'text_delta':
+            yield data['delta']['text']
+
 def create_rag_prompt(input_prompt: str, knowledge_info: dict):
-    citations = knowledge_info.get("citations", [])
-    print("Citations", citations)
+    retrieved = knowledge_info.get("citations", [])
+    # Rerank/trim locally; each kept passage keeps its original citation index
+    citations = rerank_passages(input_prompt, retrieved, text_key="content",
+                                max_passages=RAG_MAX_PASSAGES, token_budget=RAG_TOKEN_BUDGET)
+    print(f"Citations kept {len(citations)}/{len(retrieved)}: {[c['index'] for c in citations]}")
+    prompt_citations = [
+        {"index": c["index"], "pdf_name": c["pdf_name"], "content": c["content"]}
+        for c in citations
+    ]
 
     citation_text = ""
     for c in citations:
@@ -71,10 +130,11 @@ def create_rag_prompt(input_prompt: str, knowledge_info: dict):
 
     質問：{input_prompt}
 
-　　利用可能なマニュアル情報：{str(citations)}
+　　利用可能なマニュアル情報：{str(prompt_citations)}
     
     """
-    return {"prompt": prompt, "citation_text": citation_text}
+    print(f"RAG prompt: {len(prompt)} chars (untrimmed passages: {len(str(retrieved))} chars)")
+    return {"prompt": prompt, "citation_text": citation_text, "citations": citations}
 
 def lambda_handler(event, context):
     input_prompt = event.get("prompt", "")
@@ -109,3 +169,64 @@ def lambda_handler(event, context):
             "citations": citations
             })
     }
+
+def ndjson(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False) + "\n"
+
+def stream_answer(input_prompt: str):
+    """
+    NDJSON stream for the manual-search UI: one `citations` line as soon as
+    retrieval finishes, then `delta` lines with answer text, then `done`
+    (or `error`).
+    """
+    try:
+        knowledge_info = retrieve_knowledge(input_prompt)
+        rag_info = create_rag_prompt(input_prompt, knowledge_info)
+        yield ndjson({
+            "type": "citations",
+            "citation_text": rag_info.get("citation_text"),
+            "citations": [
+                {"index": c["index"], "pdf_name": c["pdf_name"], "title": c["title"]}
+                for c in rag_info.get("citations", [])
+            ],
+        })
+        for text in generate_response_stream(rag_info.get("prompt")):
+            yield ndjson({"type": "delta", "text": text})
+        yield ndjson({"type": "done"})
+    except Exception as e:
+        yield ndjson({"type": "error", "error": str(e)})
+
+def create_stream_app():
+    """
+    FastAPI app serving POST /stream as chunked NDJSON. Plain Lambda
+    responses are buffered, so run this where responses can stream, e.g.
+    `uvicorn --factory` behind the Lambda Web Adapter with a streaming
+    Function URL.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+    from fastapi.middleware.cors import CORSMiddleware
+
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["OPTIONS", "POST", "GET"],
+        allow_headers=["Content-Type"],
+    )
+
+    @app.post("/stream")
+    async def stream(request: Request):
+        body = await request.json()
+        return StreamingResponse(
+            stream_answer(body.get("prompt", "")),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/stats/bedrock")
+    async def bedrock_stats():
+        # current limit, throttles/retries and queue-wait percentiles per model
+        return limiter_report()
+
+    return app
@@ -0,0 +1,151 @@
+import os
+import json
+import math
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from accontrol_agent.utils.rerank import terms
+
+POSTINGS_FILE = "postings.bin"
+LEXICON_FILE = "lexicon.json"
+META_FILE = "meta.jsonl"
+
+
+def encode_varints(values) -> bytes:
+    out = bytearray()
+    for v in values:
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> list[int]:
+    values, current, shift = [], 0, 0
+    for byte in data:
+        current |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(current)
+            current, shift = 0, 0
+    return values
+
+
+def encode_postings(doc_ids: list[int], tfs: list[int]) -> bytes:
+    """Delta-encoded doc ids interleaved with term frequencies, as varints."""
+    flat, previous = [], 0
+    for doc_id, tf in zip(doc_ids, tfs):
+        flat.extend((doc_id - previous, tf))
+        previous = doc_id
+    return encode_varints(flat)
+
+
+def decode_postings(data: bytes):
+    flat = np.array(decode_varints(data), dtype=np.int64)
+    return np.cumsum(flat[0::2]), flat[1::2]
+
+
+def build_lexical_index(out_dir: str, passages: list[dict]):
+    """Index `text` of each passage (dicts with text, uri, optional title)."""
+    os.makedirs(out_dir, exist_ok=True)
+    postings = defaultdict(list)
+    doc_lengths = []
+    for doc_id, passage in enumerate(passages):
+        tf = Counter(terms(passage["text"]))
+        doc_lengths.append(sum(tf.values()))
+        for term, count in tf.items():
+            postings[term].append((doc_id, count))
+
+    lexicon = {}
+    with open(os.path.join(out_dir, POSTINGS_FILE), "wb") as f:
+        offset = 0
+        for term in sorted(postings):
+            entries = postings[term]
+            data = encode_postings([d for d, _ in entries], [c for _, c in entries])
+            f.write(data)
+            lexicon[term] = [offset, len(data), len(entries)]
+            offset += len(data)
+
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        for p in passages:
+            f.write(json.dumps({"text": p["text"], "uri": p.get("uri", ""), "title": p.get("title")},
+                               ensure_ascii=False) + "\n")
+    with open(os.path.join(out_dir, LEXICON_FILE), "w", encoding="utf-8") as f:
+        json.dump({"doc_lengths": doc_lengths, "terms": lexicon}, f, ensure_ascii=False)
+
+
+class LexicalIndex:
+    """
+    BM25 over character bigrams plus whole ASCII terms (error codes, model
+    numbers, device UUIDs). Postings stay compressed in a memory-mapped
+    file and are decoded per query term, with recently used terms cached.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, cache_terms: int = 4096):
+        with open(os.path.join(path, LEXICON_FILE), encoding="utf-8") as f:
+            lexicon = json.load(f)
+        self.lexicon = lexicon["terms"]
+        self.doc_lengths = np.array(lexicon["doc_lengths"], dtype=np.float64)
+        self.count = len(self.doc_lengths)
+        self.avg_length = self.doc_lengths.mean() if self.count else 0.0
+        self.postings = np.memmap(os.path.join(path, POSTINGS_FILE), dtype=np.uint8, mode="r")
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = [json.loads(line) for line in f]
+        self.k1 = k1
+        self.b = b
+        self.term_postings = lru_cache(maxsize=cache_terms)(self._term_postings)
+
+    def _term_postings(self, term: str):
+        offset, length, _ = self.lexicon[term]
+        return decode_postings(self.postings[offset:offset + length].tobytes())
+
+    def search(self, query: str, k: int = 10):
+        """Top-k (doc ids, BM25 scores); docs must share at least one term."""
+        scores = np.zeros(self.count, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / (self.avg_length or 1))
+        for term, qtf in Counter(terms(query)).items():
+            if term not in self.lexicon:
+                continue
+            df = self.lexicon[term][2]
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            doc_ids, tfs = self.term_postings(term)
+            scores[doc_ids] += qtf * idf * tfs * (self.k1 + 1) / (tfs + norm[doc_ids])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return [], []
+        top = hits[np.argsort(-scores[hits])[:k]]
+        return top.tolist(), scores[top].tolist()
+
+    def retrieve(self, text: str, k: int = 10) -> list[dict]:
+        """Same shape as bedrock-agent-runtime `retrievalResults`."""
+        ids, scores = self.search(text, k)
+        results = []
+        for doc_id, score in zip(ids, scores):
+            meta = self.meta[doc_id]
+            results.append({
+                "content": {"text": meta["text"]},
+                "location": {"s3Location": {"uri": meta["uri"]}},
+                "score": float(score),
+                **({"title": meta["title"]} if meta.get("title") else {}),
+            })
+        return results
+
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], k: int = 60, limit: int | None = None) -> list[dict]:
+    """
+    Merge retrievalResults lists by reciprocal rank. Passages are matched on
+    (uri, text); the fused score replaces the per-backend score.
+    """
+    fused, first_seen = {}, {}
+    for results in result_lists:
+        for rank, item in enumerate(results, 1):
+            key = (item.get("location", {}).get("s3Location", {}).get("uri", ""),
+                   item.get("content", {}).get("text", ""))
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(key, item)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [{**first_seen[key], "score": round(fused[key], 6)} for key in ranked]
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import deque
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Bytes held by obj and everything reachable through dicts, lists, tuples and sets."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux /proc; falls back to peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryProfiler:
+    """
+    Instrumentation for graph nodes (AGENT_MEMORY_PROFILE=true):
+    - per node: traced-memory delta across the call and the deep size of
+      the returned state, with its largest fields;
+    - keys in the state that AgentState does not declare;
+    - per run (interface_agent starting an input -> formatting output),
+      every `run_every` runs since a snapshot costs seconds: a
+      tracemalloc snapshot diff, i.e. the top allocators still alive at
+      the end of the run.
+    Runs overlapping in one process share the tracer, so per-run diffs
+    are only exact when runs are sequential (as in soak_test.py).
+    """
+
+    def __init__(self, declared_keys=(), top: int = 10, frames: int = 1, keep_runs: int = 50,
+                 run_every: int = 50):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.declared = set(declared_keys)
+        self.top = top
+        self.run_every = max(1, run_every)
+        self.started_runs = 0
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.undeclared = set()
+        self.runs = deque(maxlen=keep_runs)
+        self.run_start = None
+
+    def wrap(self, name: str, fn):
+        def profiled(state):
+            boundary = name == "interface_agent"
+            start = None
+            if boundary and self.run_start is None and self.started_runs % self.run_every == 0:
+                start = (time.perf_counter(), tracemalloc.take_snapshot())
+            before = tracemalloc.get_traced_memory()[0]
+            result = fn(state)
+            delta = tracemalloc.get_traced_memory()[0] - before
+            self.record(name, result, delta)
+            if boundary and result.get("next_action") == "orchestrator_agent":
+                self.started_runs += 1
+                self.run_start = start or self.run_start
+            elif boundary and self.run_start and result.get("next_action") == "end":
+                self.finish_run(result)
+            return result
+        profiled.__name__ = getattr(fn, "__name__", name)
+        return profiled
+
+    def record(self, name: str, state: dict, delta: int):
+        fields = {k: deep_sizeof(v) for k, v in state.items()}
+        size = sum(fields.values())
+        largest = sorted(fields.items(), key=lambda kv: kv[1], reverse=True)[:3]
+        with self.lock:
+            stats = self.nodes.setdefault(name, {"calls": 0, "traced_delta": 0, "max_state_bytes": 0})
+            stats["calls"] += 1
+            stats["traced_delta"] += delta
+            stats["last_state_bytes"] = size
+            stats["max_state_bytes"] = max(stats["max_state_bytes"], size)
+            stats["largest_fields"] = largest
+            if self.declared:
+                self.undeclared |= set(state) - self.declared
+
+    def finish_run(self, state: dict):
+        started, snapshot = self.run_start
+        self.run_start = None
+        own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = tracemalloc.take_snapshot().filter_traces(own).compare_to(snapshot.filter_traces(own), "lineno")
+        top = [(str(stat.traceback[0]), stat.size_diff, stat.count_diff) for stat in diff[:self.top]]
+        run = {"seconds": round(time.perf_counter() - started, 3),
+               "state_bytes": deep_sizeof(state),
+               "retained_bytes": sum(stat.size_diff for stat in diff),
+               "top_allocators": top}
+        with self.lock:
+            self.runs.append(run)
+        print(f"[memory] run {run['seconds']} s, state {run['state_bytes']} B, "
+              f"retained {run['retained_bytes']} B; top: {top[:3]}")
+
+    def report(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            return {
+                "traced_current": current,
+                "traced_peak": peak,
+                "rss": rss_bytes(),
+                "nodes": {k: dict(v) for k, v in self.nodes.items()},
+                "undeclared_keys": sorted(self.undeclared),
+                "last_run": self.runs[-1] if self.runs else None,
+            }
+
+
+_profiler = None
+
+
+def get_memory_profiler() -> MemoryProfiler:
+    global _profiler
+    if _profiler is None:
+        from accontrol_agent.utils.state import AgentState
+        _profiler = MemoryProfiler(AgentState.__annotations__,
+                                   run_every=int(os.getenv("AGENT_MEMORY_PROFILE_RUN_EVERY", "50")))
+    return _profiler
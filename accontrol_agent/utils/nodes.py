@@ -1,13 +1,31 @@
 import json
 import re
 from datetime import datetime
+import os
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.tools import tool
 from accontrol_agent.utils.tools import (
-    get_room_data, get_device_data,get_weather_data,search_knowledge_base,
-    extract_room_name, extract_device_id, llm, run_interface
+    get_room_data, get_device_data,get_weather_data,get_room_occupancy, get_anomaly_overview,
+    retrieve_kb_passages, format_kb_passages, kb_refine_needed, get_speculation_pool, KB_SPECULATIVE,
+    extract_room_name, extract_device_id, get_llm, run_interface, ANOMALY_SWEEP_INTERVAL_SECONDS
 )
 from accontrol_agent.utils.state import AgentState
+from accontrol_agent.utils.bedrock_limiter import BedrockThrottled
+from accontrol_agent.utils.single_flight import get_flight, normalize_question
+from accontrol_agent.utils.intent_router import IntentRouter
+from accontrol_agent.utils import working_set
+
+def follow_up_entities(user_input: str, state: AgentState) -> dict:
+    """
+    Room and device for a new question. A question naming neither, asked
+    soon after one that did (working_set.TTL_SECONDS["entities"]), is a
+    follow-up about that room and device.
+    """
+    room, device_id = extract_room_name(user_input), extract_device_id(user_input)
+    if WORKING_SET and not room and not device_id:
+        previous = working_set.follow_up_entities(state.get("working_set"))
+        if previous:
+            room, device_id = previous["room"], previous["device_id"]
+    return {"room": room, "device_id": device_id}
 
 def interface_agent(state: AgentState) -> AgentState:
     """
@@ -27,12 +45,13 @@ def interface_agent(state: AgentState) -> AgentState:
             print("[interface_agent] New input detected after end. Restarting orchestration.")
             state.update({
                 "processed_input": user_input,
-                "room": extract_room_name(user_input),
-                "device_id": extract_device_id(user_input),
+                **follow_up_entities(user_input, state),
                 "retry_count": 0,
                 "validation_passed": False,
-                "validation_result": "",
+                "validation_result": None,
+                "improved_accepted": False,
                 "error": None,
+                "error_type": None,
                 "final_result": None,
                 "tool_results": None,
                 "knowledge_base_results": None,
@@ -49,6 +68,7 @@ def interface_agent(state: AgentState) -> AgentState:
             "room": state.get("room"),
             "device_id": state.get("device_id"),
             "error": state.get("error"),
+            "improved_accepted": bool(state.get("improved_accepted")),
             "timestamp": datetime.now().isoformat(timespec="seconds")
         }
 
@@ -62,12 +82,13 @@ def interface_agent(state: AgentState) -> AgentState:
         print(f"[interface_agent] Received input: '{user_input}' (previous: '{previous_input}')")
         state.update({
             "processed_input": user_input,
-            "room": extract_room_name(user_input),
-            "device_id": extract_device_id(user_input),
+            **follow_up_entities(user_input, state),
             "retry_count": 0,
             "validation_passed": False,
-            "validation_result": "",
+            "validation_result": None,
+            "improved_accepted": False,
             "error": None,
+            "error_type": None,
             "final_result": None,
             "tool_results": None,
             "knowledge_base_results": None,
@@ -90,17 +111,47 @@ def interface_agent(state: AgentState) -> AgentState:
             }
         }
     return state
-def orchestrator_agent(state: AgentState) -> AgentState:
-    """
-    Orchestrator Agent - Task Decomposition and Control
-    Handles task decomposition, tool selection, and data collection
-    """
-    user_input = state["processed_input"]
-    room = state.get("room")
-    device_id = state.get("device_id")
-    
-    # Initialize LLM with tools
-    llm_with_tools = llm.bind_tools([get_room_data, get_device_data, get_weather_data])
+
+
+kb_speculation = {"used": 0, "refined": 0}
+VALIDATION_CRITERIA = ("relevance", "completeness", "accuracy", "consistency")
+VALIDATION_THRESHOLD = 80
+# Opt-in: accept the validator's improved_response instead of retrying when every score is within
+# VALIDATION_ACCEPT_MARGIN of the threshold and the improved text passes the grounding check. Saves
+# retries but lets some wrong rewrites through (see topology_bench), so it is off by default.
+VALIDATION_ACCEPT_IMPROVED = os.getenv("VALIDATION_ACCEPT_IMPROVED", "false").lower() == "true"
+VALIDATION_ACCEPT_MARGIN = int(os.getenv("VALIDATION_ACCEPT_MARGIN", "15"))
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+improved_acceptance = {"accepted": 0, "rejected": 0}
+# Per-thread working set: follow-ups without a room / device keep the previous ones for a while, and
+# weather, occupancy and KB passages still fresh (working_set.TTL_SECONDS) are reused instead of fetched
+WORKING_SET = os.getenv("WORKING_SET", "true").lower() == "true"
+working_set_stats = {"reused": 0, "fetched": 0, "kb_reused": 0, "kb_fetched": 0}
+AVAILABLE_TOOLS = {t.name: t for t in (get_room_data, get_device_data, get_weather_data, get_room_occupancy)}
+if ANOMALY_SWEEP_INTERVAL_SECONDS > 0:
+    # building-wide anomaly questions, answered from the background sweep
+    AVAILABLE_TOOLS[get_anomaly_overview.name] = get_anomaly_overview
+# Route common questions to tools by rules / learned query templates instead of the tool-selection
+# LLM call; INTENT_ROUTER_SHADOW_RATE of routed questions also ask the LLM to measure disagreement
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "true").lower() == "true"
+intent_router = IntentRouter(
+    learn_after=int(os.getenv("INTENT_ROUTER_LEARN_AFTER", "2")),
+    shadow_rate=float(os.getenv("INTENT_ROUTER_SHADOW_RATE", "0.05")),
+)
+
+def parse_json_object(raw: str) -> dict:
+    """The JSON object in an LLM reply, with or without surrounding text."""
+    try:
+        return json.loads(raw)
+    except Exception:
+        match = re.search(r"\{.*\}", raw, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+        raise ValueError("Could not parse LLM output as JSON.")
+
+def select_tools_with_llm(user_input: str, room, device_id) -> list[dict]:
+    """Tool calls ({"name", "input"}) chosen by the LLM with the tools bound."""
+    llm_with_tools = get_llm().bind_tools(list(AVAILABLE_TOOLS.values()))
     
     system_prompt = f"""You are a smart building orchestrator agent responsible for task decomposition and control.
     
@@ -115,70 +166,218 @@ def orchestrator_agent(state: AgentState) -> AgentState:
     
     Based on the user's input, determine what data to collect and use the appropriate tools."""
 
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        ("human", "{user_input}")
+    ])
+    chain = prompt | llm_with_tools
+    result = chain.invoke({"user_input": user_input})
+
+    calls = []
+    if isinstance(result.content, list):
+        for item in result.content:
+            if item.get("type") == "tool_use" and item.get("name") in AVAILABLE_TOOLS:
+                calls.append({"name": item["name"], "input": item["input"]})
+    return calls
+
+def collect_and_answer(user_input: str, room, device_id, advice: str, self_check: bool = False,
+                       thread_working_set: dict | None = None) -> dict:
+    """
+    Tool selection, tool calls, KB retrieval and the draft answer for one
+    question. With self_check the answer call also returns the four
+    validation scores, stored as validation_result. Tool data and KB
+    passages still fresh in the thread's working set are reused instead of
+    fetched; everything used comes back as working_set_entries.
+    """
+    used = {}
+    # KB passages kept from an earlier question about the same room / device (not on a retry,
+    # whose advice steers retrieval)
+    kept_kb = None if advice else working_set.reusable_passages(thread_working_set, user_input, room, device_id)
+
+    # Speculative KB retrieval from the question and extracted entities, overlapping tool calling
+    speculative = None
+    if KB_SPECULATIVE and kept_kb is None:
+        hints = [{"room": room, "device_id": device_id}]
+        speculative = get_speculation_pool().submit(retrieve_kb_passages, user_input, hints, advice)
+
+    # Tool plan from the intent router, or the tool-selection LLM call when it is unsure
+    if INTENT_ROUTER:
+        tool_calls = intent_router.route(user_input, room, device_id, select_tools_with_llm)
+    else:
+        tool_calls = select_tools_with_llm(user_input, room, device_id)
+
+    # Process tool calls and collect data
+    tool_results, fetched_outputs = [], []
+    for item in tool_calls:
+        entry = working_set.lookup(thread_working_set, item["name"], item["input"])
+        if entry is not None:
+            working_set_stats["reused"] += 1
+            tool_result = entry["output"]
+        else:
+            working_set_stats["fetched"] += 1
+            tool_result = AVAILABLE_TOOLS[item["name"]].invoke(item["input"])
+            fetched_outputs.append(tool_result)
+            # errors are not worth keeping; sensor data stays with cached_rpc (change-event invalidation)
+            if working_set.keeps(item["name"]) and not (isinstance(tool_result, dict) and "error" in tool_result):
+                entry = working_set.make_entry(item["name"], item["input"], tool_result)
+        if entry is not None:
+            used[working_set.entry_key(item["name"], item["input"])] = entry
+        tool_results.append({"name": item["name"], "input": item["input"], "output": tool_result})
+    tool_outputs = [t["output"] for t in tool_results]
+    basis = working_set.fingerprint(tool_outputs)
+
+    # Get knowledge base information
     try:
-        print("Reach Orchestrator Agent")
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{user_input}")
-        ])
-        chain = prompt | llm_with_tools
-        result = chain.invoke({"user_input": user_input})
-
-        # Process tool calls and collect data
-        tool_results = []
-        
-        if isinstance(result.content, list):
-            for item in result.content:
-                if item.get("type") == "tool_use":
-                    if item.get("name") == "get_room_data":
-                        # print("Name",item.get("name"))
-                        # print(f"............Invoking get_room_data with input: {item['input']}")
-                        tool_result = get_room_data.invoke(item["input"])
-                        tool_results.append(tool_result)
-                    elif item.get("name") == "get_device_data":
-                        # print(f"............Invoking get_device_data with input: {item['input']}")
-                        tool_result = get_device_data.invoke(item["input"])
-                        tool_results.append(tool_result)
-                    elif item.get("name") == "get_weather_data":
-                        # print(f"............Invoking get_room_data with input: {item['input']}")
-                        tool_result = get_weather_data.invoke(item["input"])
-                        tool_results.append(tool_result)
-
-        # Get knowledge base information
-        knowledge_base_results = ""
-        advice = state.get("improved_result", "")
-        knowledge_base_results = search_knowledge_base(user_input, tool_results, advice)
-        # print(f"Knowledge Base Results: {knowledge_base_results}")
-        
-        # Generate initial response
-        if tool_results or knowledge_base_results:
-            response_prompt = f"""
-            Based on the collected data, Please provide the best possible answer based on the user's question."
-            
-            User question：{user_input}
-            Available data：
-            {str(tool_results)}
-            {knowledge_base_results}
-            Advice：{advice}
-        """           
-            orchistrator_response = run_interface(response_prompt)
-            print(f"Initial Response: {orchistrator_response}")
+        kb_passages, kb_entry = None, None
+        # kept passages were retrieved with the tool data they record as basis; only changed data
+        # (sensor rows are fetched again every turn) can call for more
+        if kept_kb is not None and (kept_kb.get("basis") == basis
+                                    or not kb_refine_needed(user_input, fetched_outputs, kept_kb["output"])):
+            working_set_stats["kb_reused"] += 1
+            kb_passages, kb_entry = kept_kb["output"], {**kept_kb, "basis": basis}
+        elif speculative is not None:
+            try:
+                kb_passages = speculative.result()
+            except Exception as e:
+                print(f"Speculative KB retrieval failed: {str(e)}")
+            if kb_passages is not None and kb_refine_needed(user_input, tool_outputs, kb_passages):
+                kb_speculation["refined"] += 1
+                kb_passages = None
+            elif kb_passages is not None:
+                kb_speculation["used"] += 1
+        if kb_passages is None:
+            kb_passages = retrieve_kb_passages(user_input, tool_outputs, advice)
+        if kb_entry is None:
+            working_set_stats["kb_fetched"] += 1
+            kb_entry = working_set.make_entry("kb", working_set.kb_input(room, device_id), kb_passages,
+                                              basis=basis)
+        used[working_set.entry_key("kb", working_set.kb_input(room, device_id))] = kb_entry
+        knowledge_base_results = format_kb_passages(kb_passages)
+    except Exception as e:
+        kb_passages = []
+        knowledge_base_results = f"Error retrieving from knowledge base: {str(e)}"
+    # print(f"Knowledge Base Results: {knowledge_base_results}")
+
+    # Generate initial response
+    response_prompt = f"""
+        Based on the collected data, Please provide the best possible answer based on the user's question."
         
+        User question：{user_input}
+        Available data：
+        {str(tool_outputs)}
+        {knowledge_base_results}
+        Advice：{advice}
+    """
+    if self_check:
+        response_prompt += SELF_CHECK_INSTRUCTIONS
+    orchistrator_response = run_interface(response_prompt)
+    print(f"Initial Response: {orchistrator_response}")
+
+    result = {
+        "tool_results": tool_results,
+        "knowledge_base_results": kb_passages,
+        "orchistrator_response": orchistrator_response,
+        "working_set_entries": used,
+    }
+    if self_check:
+        try:
+            parsed = parse_json_object(orchistrator_response)
+            result["orchistrator_response"] = parsed.get("answer", orchistrator_response)
+            result["validation_result"] = {c: int(parsed.get(c, 0)) for c in VALIDATION_CRITERIA}
+        except Exception as e:
+            # No usable self-scores; the validation agent decides
+            print(f"Self-check parse error: {str(e)}")
+            result["validation_result"] = None
+    return result
+
+SELF_CHECK_INSTRUCTIONS = """
+        Then evaluate your own answer strictly, as a Quality Assurance expert would (score 0-100 each):
+        relevance to the question, completeness, accuracy against the data above, and consistency.
+        Reply with JSON only:
+        {"answer": str, "relevance": int, "completeness": int, "accuracy": int, "consistency": int}
+    """
+
+def orchestrator_agent(state: AgentState) -> AgentState:
+    """
+    Orchestrator Agent - Task Decomposition and Control
+    Handles task decomposition, tool selection, and data collection.
+    Concurrent runs of the same question (normalized) for the same room,
+    device, advice and reusable working-set entries share one
+    collect_and_answer call.
+    """
+    return orchestrate(state, self_check=False)
+
+def self_check_orchestrator_agent(state: AgentState) -> AgentState:
+    """
+    Orchestrator for the self-check topology: the answer comes back with
+    its own validation scores, and the answer is final when every score
+    reaches VALIDATION_THRESHOLD. Otherwise validation_agent runs as usual.
+    """
+    state = orchestrate(state, self_check=True)
+    scores = state.get("validation_result")
+    if not state.get("error") and scores and min(scores.values()) >= VALIDATION_THRESHOLD:
         state.update({
-            "tool_results": str(tool_results),
-            "knowledge_base_results": knowledge_base_results,
-            "orchistrator_response": orchistrator_response
+            "final_result": state["orchistrator_response"],
+            "validation_passed": True,
+            "next_action": "format_output",
         })
-        
-        # print(f"Orchestrator Agent - Collected data, generated initial response")
-        
+    else:
+        state["next_action"] = "validate"
+    return state
+
+def orchestrate(state: AgentState, self_check: bool) -> AgentState:
+    user_input = state["processed_input"]
+    room = state.get("room")
+    device_id = state.get("device_id")
+    advice = state.get("improved_result") or ""
+
+    try:
+        print("Reach Orchestrator Agent")
+        thread_working_set = state.get("working_set") if WORKING_SET else None
+        # the answer depends on the kept entries too: only runs that could reuse the same ones share it
+        key = (normalize_question(user_input), room, device_id, advice, self_check,
+               working_set.flight_fingerprint(thread_working_set))
+        result = get_flight("orchestrator").do(key, collect_and_answer, user_input, room, device_id,
+                                               advice, self_check, thread_working_set)
+        # coalesced runs get their own copy of the result; working_set_entries are merged, not stored
+        state.update({k: v for k, v in result.items() if k != "working_set_entries"})
+        if WORKING_SET:
+            state["working_set"] = working_set.merge(state.get("working_set"), {
+                **result["working_set_entries"], **working_set.entities_entry(room, device_id)})
     except Exception as e:
         state["error"] = str(e)
+        state["error_type"] = type(e).__name__
         state["orchistrator_response"] = f"データ収集中にエラーが発生しました: {str(e)}"
         print(f"Orchestrator Agent Error: {str(e)}")
     
     return state
 
+def numbers_in(text: str) -> set[float]:
+    # small integers are list markers, counts, months ... rather than readings
+    return {float(n) for n in NUMBER.findall(text or "") if "." in n or int(n) > 12}
+
+def improved_response_grounded(improved: str, state: AgentState) -> tuple[bool, str]:
+    """
+    Cheap consistency check for the validator's rewrite (no LLM call):
+    every reading-like number must come from the tool results, KB
+    passages, question or original answer; it must not name a different
+    room or device; and it must not drop most of the original answer.
+    """
+    original = state.get("orchistrator_response") or ""
+    if not improved or len(improved) < 0.3 * len(original):
+        return False, "empty or much shorter than the original"
+    sources = [str([t["output"] for t in state.get("tool_results") or []]),
+               *[p["content"] for p in state.get("knowledge_base_results") or []],
+               state.get("processed_input") or "", original]
+    unknown = numbers_in(improved) - set().union(*(numbers_in(s) for s in sources))
+    if unknown:
+        return False, f"numbers not in the collected data: {sorted(unknown)}"
+    room, device_id = extract_room_name(improved), extract_device_id(improved)
+    if (room and state.get("room") and room != state["room"]) or \
+            (device_id and state.get("device_id") and device_id != state["device_id"]):
+        return False, "refers to a different room or device"
+    return True, "grounded"
+
 def validation_agent(state: AgentState) -> AgentState:
     """
     Validation Agent (Quality Assurance)
@@ -188,6 +387,15 @@ def validation_agent(state: AgentState) -> AgentState:
     user_input = state.get("processed_input", "")
     
     print("Reach Validation Agent")
+
+    if state.get("error_type") == BedrockThrottled.__name__:
+        # The orchestrator was throttled by Bedrock; another LLM call would only add load
+        state.update({
+            "final_result": orchistrator_response,
+            "validation_passed": False,
+            "next_action": "format_output",
+        })
+        return state
     
     validation_prompt = f"""You are a Quality Assurance expert. Please evaluate 
     the following response strictly based on the criteria below:
@@ -214,45 +422,53 @@ def validation_agent(state: AgentState) -> AgentState:
         validation_result_raw = run_interface(validation_prompt)
         # print("Validation Result", validation_result_raw)
 
-        try:
-            validation_result = json.loads(validation_result_raw)
-        except Exception:
-            match = re.search(r"\{.*\}", validation_result_raw, re.DOTALL)
-            if match:
-                validation_result = json.loads(match.group(0))
-            else:
-                raise ValueError("Could not parse LLM output as JSON.")
-            
+        validation_result = parse_json_object(validation_result_raw)
         print("Parsed Validation Result", validation_result)
+        # Only the scores go into state; reasons are logged above
+        scores = {
+            criterion: validation_result.get(criterion, {}).get("score", 0)
+            for criterion in VALIDATION_CRITERIA
+        }
 
-        validation_passed = (
-            validation_result.get("relevance", {}).get("score", 0) >= 80 and
-            validation_result.get("completeness", {}).get("score", 0) >= 80 and
-            validation_result.get("accuracy", {}).get("score", 0) >= 80 and
-            validation_result.get("consistency", {}).get("score", 0) >= 80
-        )
+        validation_passed = min(scores.values()) >= VALIDATION_THRESHOLD
 
         if validation_passed:
             state.update({
                 "final_result": orchistrator_response,
-                "validation_result": validation_result,
+                "validation_result": scores,
                 "next_action": "format_output",
                 "validation_passed": True,
             })
         else:
             retry_count = state.get("retry_count", 0)
-            if retry_count < 3:
+            improved = validation_result.get("improved_response", "")
+            near = min(scores.values()) >= VALIDATION_THRESHOLD - VALIDATION_ACCEPT_MARGIN
+            grounded = False
+            if VALIDATION_ACCEPT_IMPROVED and near and improved:
+                grounded, reason = improved_response_grounded(improved, state)
+                improved_acceptance["accepted" if grounded else "rejected"] += 1
+                print(f"[validation_agent] improved_response {'accepted' if grounded else 'rejected'}: {reason}")
+            if grounded:
+                # the scores were for the replaced answer: not a pass, but a rewrite taken in its place
+                state.update({
+                    "final_result": improved,
+                    "validation_result": scores,
+                    "next_action": "format_output",
+                    "validation_passed": False,
+                    "improved_accepted": True,
+                })
+            elif retry_count < 3:
                 state.update({
-                    "improved_result": validation_result.get("improved_response", ""),
+                    "improved_result": improved,
                     "retry_count": retry_count + 1,
-                    "validation_result": validation_result,
+                    "validation_result": scores,
                     "next_action": "retry_orchestrator",
                     "validation_passed": False,
                 })
             else:
                 state.update({
                     "final_result": orchistrator_response,
-                    "validation_result": validation_result,
+                    "validation_result": scores,
                     "validation_passed": False,
                     "next_action": "format_output",
                     "error": "Validation failed after maximum retries"
@@ -260,6 +476,7 @@ def validation_agent(state: AgentState) -> AgentState:
 
     except Exception as e:
         state["error"] = str(e)
+        state["error_type"] = type(e).__name__
         state["final_result"] = orchistrator_response
         state["validation_passed"] = False
         state["next_action"] = "format_output"
@@ -270,4 +487,7 @@ def validation_agent(state: AgentState) -> AgentState:
 def should_retry(state: AgentState) -> str:
     return "retry_orchestrator" if state.get("next_action") == "retry_orchestrator" else "format_output"
 
+def should_validate(state: AgentState) -> str:
+    return "validate" if state.get("next_action") == "validate" else "format_output"
+
 
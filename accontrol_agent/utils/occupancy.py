@@ -0,0 +1,135 @@
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from accontrol_agent.utils.position_render import (
+    FLOOR_3F, REFERENCE_IDS, ORIGIN_ID, floor_transform, to_pixels
+)
+
+# resolution -> (bucket seconds, buckets kept)
+RESOLUTIONS = {
+    "minute": (60, 60),
+    "hour": (3600, 24),
+    "day": (86400, 30),
+}
+
+JST_OFFSET = 9 * 3600
+JST = timezone(timedelta(seconds=JST_OFFSET))
+ANCHOR_IDS = (*REFERENCE_IDS, ORIGIN_ID)
+
+
+def parse_snapshot_time(value) -> float:
+    """Epoch seconds from the API `time` field (naive times are JST), or now."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        for parse in (datetime.fromisoformat, lambda v: datetime.strptime(v, "%Y-%m-%d+%H:%M:%S")):
+            try:
+                parsed = parse(value)
+            except ValueError:
+                continue
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=JST)
+            return parsed.timestamp()
+    return time.time()
+
+
+class RollingCounts:
+    """Ring of (slots, rows, cols) count grids for one bucket size."""
+
+    def __init__(self, seconds: int, slots: int, rows: int, cols: int, tz_offset: int):
+        self.seconds = seconds
+        self.slots = slots
+        self.tz_offset = tz_offset
+        self.counts = np.zeros((slots, rows, cols), dtype=np.uint32)
+        self.ticks = np.zeros(slots, dtype=np.uint32)
+        self.keys = np.full(slots, -1, dtype=np.int64)
+
+    def bucket(self, ts: float) -> int:
+        return int((ts + self.tz_offset) // self.seconds)
+
+    def add(self, ts: float, rows: np.ndarray, cols: np.ndarray):
+        key = self.bucket(ts)
+        slot = key % self.slots
+        if self.keys[slot] != key:
+            if key < self.keys[slot]:
+                return  # older than anything this slot could still hold
+            self.counts[slot] = 0
+            self.ticks[slot] = 0
+            self.keys[slot] = key
+        np.add.at(self.counts[slot], (rows, cols), 1)
+        self.ticks[slot] += 1
+
+    def window(self, now: float, buckets: int):
+        """Summed counts and ticks over the last `buckets` buckets up to `now`."""
+        latest = self.bucket(now)
+        live = (self.keys > latest - buckets) & (self.keys <= latest)
+        return self.counts[live].sum(axis=0), int(self.ticks[live].sum())
+
+
+class OccupancyAggregator:
+    """
+    Incremental occupancy heatmap for one area's floor (3F unless `floor`
+    is given). Each snapshot is binned into a fixed grid with the same
+    floor transform the position image uses and added to per-minute,
+    per-hour and per-day rings, so a tick costs O(people) and history is
+    never rescanned.
+    """
+
+    def __init__(self, cell_m: float = 1.0, tz_offset: int = JST_OFFSET, floor: dict | None = None):
+        self.cell_m = cell_m
+        self.floor = floor or FLOOR_3F
+        self.cols = math.ceil(self.floor["width_m"] / cell_m)
+        self.rows = math.ceil(self.floor["height_m"] / cell_m)
+        self.transform = floor_transform(self.cols, self.rows, self.floor)
+        self.rings = {
+            name: RollingCounts(seconds, slots, self.rows, self.cols, tz_offset)
+            for name, (seconds, slots) in RESOLUTIONS.items()
+        }
+        self.outside = 0
+
+    def bin_people(self, humans: list[dict]):
+        humans = [h for h in humans if h.get("id") not in ANCHOR_IDS]
+        if not humans:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        px, py = to_pixels([h["x"] for h in humans], [h["y"] for h in humans], self.transform)
+        cols = np.floor(px).astype(np.int64)
+        rows = np.floor(py).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        self.outside += int((~inside).sum())
+        return rows[inside], cols[inside]
+
+    def add_snapshot(self, entries):
+        if not entries:
+            return
+        humans = []
+        for entry in entries:
+            humans.extend(entry.get("data") or [])
+        ts = parse_snapshot_time(entries[0].get("time"))
+        rows, cols = self.bin_people(humans)
+        for ring in self.rings.values():
+            ring.add(ts, rows, cols)
+
+    def heatmap(self, resolution: str = "hour", window: int = 1, now: float | None = None) -> dict:
+        """
+        Counts summed over the last `window` buckets. `mean` divides by the
+        number of ticks, i.e. average people per cell per snapshot.
+        """
+        if resolution not in self.rings:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        ring = self.rings[resolution]
+        window = max(1, min(window, ring.slots))
+        counts, ticks = ring.window(time.time() if now is None else now, window)
+        mean = counts / ticks if ticks else np.zeros_like(counts, dtype=np.float64)
+        return {
+            "resolution": resolution,
+            "window": window,
+            "cell_m": self.cell_m,
+            "rows": self.rows,
+            "cols": self.cols,
+            "ticks": ticks,
+            "counts": counts.tolist(),
+            "mean": np.round(mean, 3).tolist(),
+        }
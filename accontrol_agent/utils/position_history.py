@@ -0,0 +1,207 @@
+import os
+import time
+import zlib
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from accontrol_agent.utils.occupancy import JST, parse_snapshot_time
+
+# One fixed-width record per person per snapshot (24 bytes)
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("id", "<i8"), ("x", "<f4"), ("y", "<f4")])
+CHUNK_SUFFIX = ".rec.z"
+
+
+def snapshot_records(entries) -> np.ndarray:
+    """Pack one API snapshot into a structured array."""
+    humans = [h for entry in entries or [] for h in entry.get("data") or []]
+    records = np.empty(len(humans), dtype=RECORD_DTYPE)
+    if humans:
+        records["time"] = parse_snapshot_time(entries[0].get("time"))
+        records["id"] = [h["id"] for h in humans]
+        records["x"] = [h["x"] for h in humans]
+        records["y"] = [h["y"] for h in humans]
+    return records
+
+
+def partition_of(ts: float) -> str:
+    """Hourly JST partition, e.g. 2024-05-01/10."""
+    return datetime.fromtimestamp(ts, JST).strftime("%Y-%m-%d/%H")
+
+
+def encode_chunk(records: np.ndarray, level: int = 6) -> bytes:
+    return zlib.compress(records.tobytes(), level)
+
+
+def decode_chunk(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype=RECORD_DTYPE)
+
+
+def chunk_key(prefix: str, records: np.ndarray) -> str:
+    start, end = records["time"][0], records["time"][-1]
+    return (f"{prefix}/{partition_of(start)}/"
+            f"{int(start * 1000)}-{int(end * 1000)}-{len(records)}{CHUNK_SUFFIX}")
+
+
+def parse_chunk_key(key: str):
+    """(start, end, count) from a chunk key."""
+    name = key.rsplit("/", 1)[-1][:-len(CHUNK_SUFFIX)]
+    start, end, count = name.split("-")
+    return int(start) / 1000, int(end) / 1000, int(count)
+
+
+class S3HistoryStorage:
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="application/octet-stream")
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def list(self, prefix: str) -> list[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []))
+        return keys
+
+
+class LocalHistoryStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, key: str, data: bytes):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    def list(self, prefix: str) -> list[str]:
+        base = os.path.join(self.root, prefix)
+        if not os.path.isdir(base):
+            return []
+        return sorted(
+            os.path.relpath(os.path.join(d, name), self.root).replace(os.sep, "/")
+            for d, _, names in os.walk(base) for name in names
+        )
+
+
+class HistoryWriter:
+    """
+    Append-only position history. Snapshots are buffered as records and
+    written as one compressed chunk per flush, when the buffer reaches
+    `max_records`, is older than `max_age_s`, or crosses an hour partition.
+    """
+
+    def __init__(self, storage, prefix: str, max_records: int = 50_000,
+                 max_age_s: float = 300.0, level: int = 6):
+        self.storage = storage
+        self.prefix = prefix
+        self.max_records = max_records
+        self.max_age_s = max_age_s
+        self.level = level
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_started = None
+        self.partition = None
+        self.lock = threading.Lock()
+        self.chunks_written = 0
+        self.bytes_written = 0
+        self.records_written = 0
+
+    def append(self, entries):
+        records = snapshot_records(entries)
+        if not len(records):
+            return
+        with self.lock:
+            partition = partition_of(records["time"][0])
+            if self.buffer and partition != self.partition:
+                self._flush()
+            if not self.buffer:
+                # wall clock: a Lambda container's monotonic clock may stand still while it is frozen
+                self.buffer_started = time.time()
+                self.partition = partition
+            self.buffer.append(records)
+            self.buffered += len(records)
+            if (self.buffered >= self.max_records
+                    or time.time() - self.buffer_started >= self.max_age_s):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def flush_if_due(self):
+        """Flush a buffer older than max_age_s even when no new snapshot arrives."""
+        with self.lock:
+            if self.buffer and time.time() - self.buffer_started >= self.max_age_s:
+                self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        records = np.concatenate(self.buffer)
+        data = encode_chunk(records, self.level)
+        key = chunk_key(self.prefix, records)
+        self.storage.put(key, data)
+        self.chunks_written += 1
+        self.bytes_written += len(data)
+        self.records_written += len(records)
+        print(f"History chunk {key}: {len(records)} records, {len(data)} bytes "
+              f"({len(data) / records.nbytes:.0%} of raw).")
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_started = None
+
+
+class HistoryReader:
+    """Reads history chunks for a time range, chunk by chunk or into a memory-mapped file."""
+
+    def __init__(self, storage, prefix: str):
+        self.storage = storage
+        self.prefix = prefix
+
+    def chunk_keys(self, start: float, end: float) -> list[str]:
+        keys = []
+        hour = datetime.fromtimestamp(start, JST).replace(minute=0, second=0, microsecond=0)
+        while hour.timestamp() < end:
+            for key in self.storage.list(f"{self.prefix}/{hour:%Y-%m-%d/%H}/"):
+                if not key.endswith(CHUNK_SUFFIX):
+                    continue
+                first, last, _ = parse_chunk_key(key)
+                if first < end and last >= start:
+                    keys.append(key)
+            hour += timedelta(hours=1)
+        return sorted(keys, key=parse_chunk_key)
+
+    def iter_range(self, start: float, end: float):
+        """Yield one record array per chunk, trimmed to [start, end)."""
+        for key in self.chunk_keys(start, end):
+            records = decode_chunk(self.storage.get(key))
+            mask = (records["time"] >= start) & (records["time"] < end)
+            yield records[mask]
+
+    def read_range(self, start: float, end: float) -> np.ndarray:
+        parts = list(self.iter_range(start, end))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+    def materialize(self, start: float, end: float, path: str) -> np.ndarray:
+        """Write the range to an .npy file and return it memory-mapped read-only."""
+        parts = list(self.iter_range(start, end))
+        total = sum(len(p) for p in parts)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=RECORD_DTYPE, shape=(total,))
+        offset = 0
+        for part in parts:
+            out[offset:offset + len(part)] = part
+            offset += len(part)
+        out.flush()
+        del out
+        return np.load(path, mmap_mode="r")
@@ -0,0 +1,147 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Floor dimensions (metres) of the 3F plan covered by base.webp
+FLOOR_WIDTH_M = 81.3
+FLOOR_HEIGHT_M = 73.4
+# Floor geometry of an area: size in metres and where floor (0, 0) falls, as fractions of the
+# image width / height. Other areas set their own in AREA_CONFIG (3f.py).
+FLOOR_3F = {"width_m": FLOOR_WIDTH_M, "height_m": FLOOR_HEIGHT_M, "origin_x": 0.5, "origin_y": 0.7}
+
+MARKER_RADIUS = 10
+
+# RGBA colours, same as the previous ImageDraw names
+COLOR_PERSON = (255, 0, 0, 255)      # red
+COLOR_REFERENCE = (0, 0, 255, 255)   # blue
+COLOR_ORIGIN = (255, 165, 0, 255)    # orange
+REFERENCE_IDS = (1, 2, 3, 5)
+ORIGIN_ID = 4
+
+
+def floor_transform(width: int, height: int, floor: dict | None = None) -> dict:
+    """Scale/offset used to map floor coordinates onto the base image (3F unless `floor` is given)."""
+    floor = floor or FLOOR_3F
+    return {
+        "x_scale": width / floor["width_m"],
+        "y_scale": height / floor["height_m"],
+        "x_offset": width * floor["origin_x"],
+        "y_offset": height * floor["origin_y"],
+        "height": height,
+    }
+
+
+def to_pixels(xs, ys, transform: dict):
+    """Vectorized version of the per-person transform from draw_position."""
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    px = (-ys * transform["x_scale"]) + transform["x_offset"]
+    py = transform["height"] - ((xs * transform["y_scale"]) + transform["y_offset"])
+    return px, py
+
+
+def disc_offsets(radius: int) -> np.ndarray:
+    """(K, 2) array of (dy, dx) offsets covering a filled disc."""
+    r = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(r, r, indexing="ij")
+    inside = dy * dy + dx * dx <= radius * radius
+    return np.stack([dy[inside], dx[inside]], axis=1)
+
+
+class PositionRenderer:
+    """
+    Renders person markers onto a cached base raster.
+    The base image, the marker disc and the overlay alpha are decoded and
+    precomputed once, so a render is one vectorized stamp plus one blend.
+    """
+
+    def __init__(self, base_image: Image.Image, overlay_image: Image.Image | None = None,
+                 radius: int = MARKER_RADIUS, floor: dict | None = None):
+        self.base = np.asarray(base_image.convert("RGBA"), dtype=np.uint8).copy()
+        self.height, self.width = self.base.shape[:2]
+        self.transform = floor_transform(self.width, self.height, floor)
+        self.offsets = disc_offsets(radius)
+
+        self.overlay_premul = None
+        self.overlay_inv_alpha = None
+        if overlay_image is not None:
+            overlay = overlay_image.convert("RGBA")
+            if overlay.size != (self.width, self.height):
+                # Image.paste at (0, 0) only covers the overlapping region
+                padded = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
+                padded.paste(overlay, (0, 0))
+                overlay = padded
+            overlay = np.asarray(overlay, dtype=np.uint16)
+            alpha = overlay[..., 3:4]
+            # out = canvas * (255 - a) / 255 + overlay * a / 255, in integer math
+            self.overlay_premul = overlay * alpha + 127
+            self.overlay_inv_alpha = 255 - alpha
+
+    @classmethod
+    def from_bytes(cls, base_bytes: bytes, overlay_bytes: bytes | None = None,
+                   radius: int = MARKER_RADIUS, floor: dict | None = None) -> "PositionRenderer":
+        base = Image.open(BytesIO(base_bytes))
+        overlay = Image.open(BytesIO(overlay_bytes)) if overlay_bytes else None
+        return cls(base, overlay, radius, floor)
+
+    def marker_colors(self, ids) -> np.ndarray:
+        ids = np.asarray(ids)
+        colors = np.empty((len(ids), 4), dtype=np.uint8)
+        colors[:] = COLOR_PERSON
+        colors[np.isin(ids, REFERENCE_IDS)] = COLOR_REFERENCE
+        colors[ids == ORIGIN_ID] = COLOR_ORIGIN
+        return colors
+
+    def render(self, humans: list[dict]) -> np.ndarray:
+        """Return an RGBA array with every person stamped and the overlay applied."""
+        canvas = self.base.copy()
+
+        if humans:
+            xs = [h["x"] for h in humans]
+            ys = [h["y"] for h in humans]
+            ids = [h.get("id") for h in humans]
+            px, py = to_pixels(xs, ys, self.transform)
+            cx = np.rint(px).astype(np.int64)
+            cy = np.rint(py).astype(np.int64)
+
+            # (N, K) pixel coordinates of every disc, flattened in draw order
+            rows = (cy[:, None] + self.offsets[:, 0]).ravel()
+            cols = (cx[:, None] + self.offsets[:, 1]).ravel()
+            colors = np.repeat(self.marker_colors(ids), len(self.offsets), axis=0)
+
+            visible = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+            canvas[rows[visible], cols[visible]] = colors[visible]
+
+        if self.overlay_premul is not None:
+            blended = canvas * self.overlay_inv_alpha + self.overlay_premul
+            canvas = (blended // 255).astype(np.uint8)
+
+        return canvas
+
+    def render_bytes(self, humans: list[dict], fmt: str = "PNG", **options) -> bytes:
+        return encode_image(self.render(humans), fmt, **options)
+
+
+def encode_image(pixels: np.ndarray, fmt: str = "PNG", compress_level: int = 1,
+                 quality: int = 80, lossless: bool = False, method: int = 0) -> bytes:
+    """
+    Encode an RGBA array. PNG takes a zlib compress_level (0-9, PIL default is 6);
+    WEBP takes quality/lossless/method (0 is fastest).
+    """
+    img = Image.fromarray(pixels, "RGBA")
+    buf = BytesIO()
+    fmt = fmt.upper()
+    if fmt == "PNG":
+        img.save(buf, format="PNG", compress_level=compress_level)
+    elif fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=quality, lossless=lossless, method=method)
+    else:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return buf.getvalue()
+
+
+IMAGE_CONTENT_TYPES = {
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
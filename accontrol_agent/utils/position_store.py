@@ -0,0 +1,100 @@
+import uuid
+from collections import OrderedDict
+
+
+def snapshot_time(entries):
+    return entries[0].get("time") if entries else None
+
+
+def index_people(entries) -> dict:
+    """Flatten API entries into {person_id: (x, y)}."""
+    people = {}
+    for entry in entries or []:
+        for human in entry.get("data") or []:
+            people[human["id"]] = (human["x"], human["y"])
+    return people
+
+
+class PositionStore:
+    """
+    Versioned store of position snapshots.
+    Keeps the last `max_snapshots` snapshots so clients can ask for what
+    changed since the version they already have. Clients see versions as
+    "<epoch>.<n>" tokens: the epoch is new in every process, so a token
+    issued by another container (or before a restart) gets a full snapshot
+    instead of a delta against the wrong base.
+    """
+
+    def __init__(self, max_snapshots: int = 32):
+        self.max_snapshots = max_snapshots
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.entries = []
+        self.snapshots = OrderedDict()  # version -> {person_id: (x, y)}
+
+    @property
+    def time(self):
+        return snapshot_time(self.entries)
+
+    @property
+    def token(self) -> str:
+        return f"{self.epoch}.{self.version}"
+
+    def parse_token(self, token) -> int | None:
+        """Our version number in `token`, or None if it is malformed or from another epoch."""
+        epoch, _, version = str(token).rpartition(".")
+        return int(version) if epoch == self.epoch and version.isdigit() else None
+
+    def update(self, entries) -> bool:
+        """Store a new snapshot if its time differs from the current one."""
+        if not entries or snapshot_time(entries) == self.time:
+            return False
+        self.version += 1
+        self.entries = entries
+        self.snapshots[self.version] = index_people(entries)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return True
+
+    def snapshot(self) -> dict:
+        people = self.snapshots.get(self.version, {})
+        return {
+            "version": self.token,
+            "time": self.time,
+            "full": True,
+            "people": [[pid, x, y] for pid, (x, y) in people.items()],
+        }
+
+    def delta(self, since: str) -> dict:
+        """
+        People added, moved or removed since the `since` token, as [id, x, y]
+        rows and removed ids. Falls back to a full snapshot when `since` has
+        already left the ring or is not a token this store issued.
+        """
+        version = self.parse_token(since)
+        if version == self.version:
+            return {"version": self.token, "since": since, "time": self.time,
+                    "full": False, "added": [], "moved": [], "removed": []}
+        old = self.snapshots.get(version)
+        if old is None:
+            return self.snapshot()
+
+        current = self.snapshots[self.version]
+        added, moved = [], []
+        for pid, pos in current.items():
+            prev = old.get(pid)
+            if prev is None:
+                added.append([pid, pos[0], pos[1]])
+            elif prev != pos:
+                moved.append([pid, pos[0], pos[1]])
+        removed = [pid for pid in old if pid not in current]
+
+        return {
+            "version": self.token,
+            "since": since,
+            "time": self.time,
+            "full": False,
+            "added": added,
+            "moved": moved,
+            "removed": removed,
+        }
@@ -0,0 +1,152 @@
+import json
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from accontrol_agent.utils.position_store import PositionStore
+
+
+class Subscriber:
+    """
+    One streaming client. Holds only the last version token it was sent and a
+    wake-up flag, so a slow reader never queues snapshots: when it catches
+    up it gets a single delta covering everything it missed.
+    """
+
+    def __init__(self, since: str | None):
+        self.version = since
+        self.wakeup = asyncio.Event()
+        self.sent = 0
+        self.coalesced = 0
+
+    def notify(self):
+        if self.wakeup.is_set():
+            self.coalesced += 1
+        self.wakeup.set()
+
+
+class PositionBroadcaster:
+    """
+    Fans new position versions out to any number of subscribers.
+    While at least one subscriber is connected, a single poll loop calls
+    `refresh` (one upstream fetch) every `interval` seconds.
+    """
+
+    def __init__(self, store: PositionStore, refresh, interval: float = 2.0,
+                 heartbeat: float = 15.0):
+        self.store = store
+        self.refresh = refresh
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.subscribers = set()
+        self.poll_task = None
+        self.published = 0
+        self.closed_sent = 0
+        self.closed_coalesced = 0
+
+    def publish(self):
+        """Called after the store accepted a new snapshot."""
+        self.published += 1
+        for sub in self.subscribers:
+            sub.notify()
+
+    def subscribe(self, since: str | None = None) -> Subscriber:
+        sub = Subscriber(since)
+        self.subscribers.add(sub)
+        # Send the current state straight away
+        sub.notify()
+        if self.refresh is not None and (self.poll_task is None or self.poll_task.done()):
+            self.poll_task = asyncio.create_task(self.poll())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        if sub in self.subscribers:
+            self.subscribers.discard(sub)
+            self.closed_sent += sub.sent
+            self.closed_coalesced += sub.coalesced
+
+    async def poll(self):
+        print(f"Position poller started ({len(self.subscribers)} subscribers).")
+        while self.subscribers:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error in position poller: {str(e)}")
+            await asyncio.sleep(self.interval)
+        print("Position poller stopped (no subscribers).")
+
+    def next_message(self, sub: Subscriber) -> dict | None:
+        if self.store.version == 0 or sub.version == self.store.token:
+            return None
+        if sub.version is None:
+            payload = self.store.snapshot()
+        else:
+            payload = self.store.delta(sub.version)
+        sub.version = self.store.token
+        sub.sent += 1
+        return payload
+
+    async def stream(self, since: str | None = None):
+        """Async generator of Server-Sent Events for one client."""
+        sub = self.subscribe(since)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(sub.wakeup.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                sub.wakeup.clear()
+                payload = self.next_message(sub)
+                if payload is not None:
+                    yield format_sse(payload, payload["version"])
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "sent": self.closed_sent + sum(s.sent for s in self.subscribers),
+            "coalesced": self.closed_coalesced + sum(s.coalesced for s in self.subscribers),
+        }
+
+
+def format_sse(payload: dict, event_id: str, event: str = "positions") -> str:
+    data = json.dumps(payload, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class FakePositionUpstream:
+    """
+    Stand-in for the hito-navi position API for local runs.
+    Each call returns a new snapshot where people random-walk and a few
+    enter or leave.
+    """
+
+    def __init__(self, people: int = 30, step: float = 0.5, seed: int | None = None):
+        self.rng = random.Random(seed)
+        self.step = step
+        self.next_id = 100
+        self.people = {}
+        for _ in range(people):
+            self.add_person()
+
+    def add_person(self):
+        self.people[self.next_id] = [self.rng.uniform(-23, 20), self.rng.uniform(-30, 35)]
+        self.next_id += 1
+
+    async def __call__(self):
+        for pos in self.people.values():
+            pos[0] += self.rng.uniform(-self.step, self.step)
+            pos[1] += self.rng.uniform(-self.step, self.step)
+        if self.people and self.rng.random() < 0.2:
+            del self.people[self.rng.choice(list(self.people))]
+        if self.rng.random() < 0.2:
+            self.add_person()
+        data = [{"id": pid, "x": round(x, 2), "y": round(y, 2)} for pid, (x, y) in self.people.items()]
+        return [{
+            "time": datetime.now(timezone(timedelta(hours=9))).isoformat(timespec="milliseconds"),
+            "num": len(data),
+            "data": data,
+        }]
@@ -0,0 +1,100 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+
+SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?])|\n+|(?<=\.)\s+")
+ASCII_TERM = re.compile(r"[a-z0-9][a-z0-9_\-.]*")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def terms(text: str) -> list[str]:
+    """
+    Character bigrams for Japanese plus whole ASCII terms, so error codes
+    and model numbers still match exactly.
+    """
+    text = normalize(text)
+    ascii_terms = ASCII_TERM.findall(text)
+    chars = re.sub(r"\s+", "", text)
+    return [chars[i:i + 2] for i in range(len(chars) - 1)] + ascii_terms
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Claude token estimate: ~1 per Japanese character, ~4 ASCII chars per token."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil((len(text) - ascii_chars) + ascii_chars / 4)
+
+
+def bm25_scores(query_terms: list[str], docs: list[list[str]], k1: float = 1.2, b: float = 0.75) -> list[float]:
+    """BM25 with the candidate passages themselves as the corpus."""
+    n = len(docs)
+    avg_len = sum(len(d) for d in docs) / n if n else 0
+    df = Counter(t for d in docs for t in set(d))
+    query = set(query_terms)
+    scores = []
+    for doc in docs:
+        tf = Counter(doc)
+        score = 0.0
+        for t in query:
+            if t not in tf:
+                continue
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            norm = tf[t] + k1 * (1 - b + b * len(doc) / (avg_len or 1))
+            score += idf * tf[t] * (k1 + 1) / norm
+        scores.append(score)
+    return scores
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def trim_passage(query_terms: list[str], text: str, max_sentences: int = 4) -> str:
+    """Keep the sentences that overlap the query most, in their original order."""
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(text or "") if s and s.strip()]
+    if len(sentences) <= max_sentences:
+        return "\n".join(sentences)
+    query = set(query_terms)
+    scored = []
+    for i, sentence in enumerate(sentences):
+        sentence_terms = set(terms(sentence))
+        scored.append((len(query & sentence_terms) / (len(sentence_terms) ** 0.5 or 1), i))
+    # ties go to earlier sentences, which usually carry the context
+    keep = sorted(i for _, i in sorted(scored, key=lambda s: (-s[0], s[1]))[:max_sentences])
+    return "\n".join(sentences[i] for i in keep)
+
+
+def rerank_passages(query: str, passages: list[dict], text_key: str = "content",
+                    max_passages: int = 5, token_budget: int = 3000,
+                    max_sentences: int = 4, dedup_threshold: float = 0.8) -> list[dict]:
+    """
+    Score passages against the question, drop near-duplicates, trim each to
+    its most relevant sentences and stop at `token_budget`. Passages are
+    returned as copies in score order with any index/citation keys intact.
+    """
+    if not passages:
+        return []
+    query_terms = terms(query)
+    doc_terms = [terms(p.get(text_key, "")) for p in passages]
+    lexical = bm25_scores(query_terms, doc_terms)
+    # the retriever's own ranking breaks ties and helps when the query shares no terms
+    order = sorted(range(len(passages)), key=lambda i: (lexical[i], -i), reverse=True)
+
+    kept, kept_terms, used = [], [], 0
+    for i in order:
+        term_set = set(doc_terms[i])
+        if any(jaccard(term_set, other) >= dedup_threshold for other in kept_terms):
+            continue
+        text = trim_passage(query_terms, passages[i].get(text_key, ""), max_sentences)
+        tokens = estimate_tokens(text)
+        if kept and used + tokens > token_budget:
+            continue
+        kept.append({**passages[i], text_key: text, "rerank_score": round(lexical[i], 3)})
+        kept_terms.append(term_set)
+        used += tokens
+        if len(kept) >= max_passages:
+            break
+    return kept
@@ -0,0 +1,102 @@
+import json
+import math
+
+import numpy as np
+
+from accontrol_agent.utils.position_store import index_people
+from accontrol_agent.utils.occupancy import ANCHOR_IDS
+
+NO_ROOM = -1
+
+
+def points_in_polygon(xs: np.ndarray, ys: np.ndarray, polygon) -> np.ndarray:
+    """Even-odd rule for many points against one polygon [[x, y], ...]."""
+    inside = np.zeros(xs.shape, dtype=bool)
+    n = len(polygon)
+    for i in range(n):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % n]
+        if y1 == y2:
+            continue
+        crosses = (y1 > ys) != (y2 > ys)
+        x_at = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (xs < x_at)
+    return inside
+
+
+class RoomIndex:
+    """
+    Uniform grid over the room polygons. Every cell stores the index of the
+    room its centre falls in, so assigning N positions is one vectorized
+    lookup. Polygons use the same floor coordinates (metres) as the API.
+    """
+
+    def __init__(self, rooms: dict, cell_m: float = 0.25):
+        self.names = list(rooms)
+        self.cell_m = cell_m
+        vertices = np.array([pt for poly in rooms.values() for pt in poly], dtype=np.float64)
+        self.x0, self.y0 = vertices.min(axis=0)
+        x1, y1 = vertices.max(axis=0)
+        self.nx = max(1, math.ceil((x1 - self.x0) / cell_m))
+        self.ny = max(1, math.ceil((y1 - self.y0) / cell_m))
+
+        cx = self.x0 + (np.arange(self.nx) + 0.5) * cell_m
+        cy = self.y0 + (np.arange(self.ny) + 0.5) * cell_m
+        gx, gy = np.meshgrid(cx, cy, indexing="ij")
+        self.labels = np.full((self.nx, self.ny), NO_ROOM, dtype=np.int16)
+        for i, polygon in enumerate(rooms.values()):
+            inside = points_in_polygon(gx, gy, polygon)
+            # first listed room wins where polygons overlap
+            self.labels[inside & (self.labels == NO_ROOM)] = i
+
+    @classmethod
+    def from_json(cls, text: str | bytes, cell_m: float = 0.25) -> "RoomIndex":
+        return cls(json.loads(text), cell_m)
+
+    def assign(self, xs, ys) -> np.ndarray:
+        """Room index for each position, NO_ROOM outside every polygon."""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        ix = np.floor((xs - self.x0) / self.cell_m).astype(np.int64)
+        iy = np.floor((ys - self.y0) / self.cell_m).astype(np.int64)
+        valid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        result = np.full(xs.shape, NO_ROOM, dtype=np.int64)
+        result[valid] = self.labels[ix[valid], iy[valid]]
+        return result
+
+
+class RoomOccupancy:
+    """Per-room head counts kept in step with each new snapshot."""
+
+    def __init__(self, index: RoomIndex):
+        self.index = index
+        self.assignment = {}  # person_id -> room index
+        self.counts = np.zeros(len(index.names), dtype=np.int64)
+        self.time = None
+
+    def update(self, entries) -> set:
+        """Apply a snapshot; returns the names of rooms whose count changed."""
+        people = {pid: pos for pid, pos in index_people(entries).items() if pid not in ANCHOR_IDS}
+        pids = list(people)
+        if pids:
+            coords = np.array([people[pid] for pid in pids], dtype=np.float64)
+            labels = self.index.assign(coords[:, 0], coords[:, 1])
+        else:
+            labels = np.empty(0, dtype=np.int64)
+
+        changed = set()
+        assignment = dict(zip(pids, labels.tolist()))
+        for pid, old in self.assignment.items():
+            if old != NO_ROOM and assignment.get(pid) != old:
+                self.counts[old] -= 1
+                changed.add(old)
+        for pid, new in assignment.items():
+            if new != NO_ROOM and self.assignment.get(pid) != new:
+                self.counts[new] += 1
+                changed.add(new)
+        self.assignment = assignment
+        self.time = entries[0].get("time") if entries else None
+        return {self.index.names[i] for i in changed}
+
+    def snapshot(self) -> dict:
+        return {name: int(count) for name, count in zip(self.index.names, self.counts)}
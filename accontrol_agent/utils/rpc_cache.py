@@ -0,0 +1,175 @@
+import copy
+import json
+import time
+import asyncio
+import threading
+
+
+def record_entities(record: dict) -> set:
+    """Cache entities a sensor row belongs to: ("device", id) and ("room", name)."""
+    entities = set()
+    if not isinstance(record, dict):
+        return entities
+    for key in ("device_id", "devEUI", "dev_eui"):
+        if record.get(key):
+            entities.add(("device", str(record[key])))
+    for key in ("room", "room_name", "location"):
+        if record.get(key):
+            entities.add(("room", str(record[key])))
+    return entities
+
+
+class RPCCache:
+    """
+    Per-entity cache of RPC results. Entries expire after `ttl` seconds
+    (or `negative_ttl`, at most `ttl`, for empty results, e.g. unknown
+    rooms, so a room that starts reporting is not "no data" for longer
+    than a stale reading would be) and are
+    dropped early by invalidate(entity). A room result is also indexed
+    under every device in its rows, so "device X updated" clears the
+    rooms that device reports into. At most `max_entries` are kept:
+    expired entries are purged first, then the oldest (room names come
+    from user input, so the key space is unbounded). Callers get their
+    own copy of the rows.
+    """
+
+    def __init__(self, ttl: float = 60.0, negative_ttl: float | None = None, max_entries: int = 1024):
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else min(negative_ttl, ttl)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}       # key -> (expires, data, entities)
+        self.by_entity = {}     # entity -> set of keys
+        self.generation = 0     # bumped by every invalidation; a load that raced one is not stored
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0, "expired": 0, "evicted": 0}
+
+    def get_or_load(self, name: str, params: dict, entity: tuple, loader):
+        key = (name, json.dumps(params, sort_keys=True, ensure_ascii=False))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            fresh = entry is not None and entry[0] > now
+            if fresh:
+                self.stats["negative_hits" if not entry[1] else "hits"] += 1
+            else:
+                self.stats["expired"] += entry is not None
+                self.stats["misses"] += 1
+                generation = self.generation
+        if fresh:
+            # cached rows are shared by every caller: hand out copies (outside the lock)
+            return copy.deepcopy(entry[1])
+
+        data = loader()
+        entities = {entity} | {e for row in (data if isinstance(data, list) else []) for e in record_entities(row)}
+        with self.lock:
+            # a change event that arrived while loading means `data` may already be stale
+            if self.generation == generation:
+                self._drop(key)
+                if len(self.entries) >= self.max_entries:
+                    self._evict(time.monotonic())
+                ttl = self.ttl if data else self.negative_ttl
+                self.entries[key] = (time.monotonic() + ttl, data, entities)
+                for e in entities:
+                    self.by_entity.setdefault(e, set()).add(key)
+        return copy.deepcopy(data)
+
+    def _drop(self, key) -> bool:
+        """Remove key and its index entries (lock held)."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for e in entry[2]:
+            keys = self.by_entity.get(e)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_entity[e]
+        return True
+
+    def _evict(self, now: float):
+        """Make room for one entry: expired entries first, then the oldest inserted (lock held)."""
+        for key in [k for k, entry in self.entries.items() if entry[0] <= now]:
+            self._drop(key)
+            self.stats["expired"] += 1
+        while len(self.entries) >= self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.stats["evicted"] += 1
+
+    def invalidate(self, entity: tuple):
+        with self.lock:
+            self.generation += 1
+            for key in list(self.by_entity.get(entity, ())):
+                if self._drop(key):
+                    self.stats["invalidations"] += 1
+
+    def on_change(self, record: dict):
+        """Change-feed callback: drop everything cached for the row's device and room."""
+        for entity in record_entities(record):
+            self.invalidate(entity)
+
+    def report(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        hits = self.stats["hits"] + self.stats["negative_hits"]
+        return {**self.stats, "entries": len(self.entries), "entities": len(self.by_entity),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+
+
+class LocalChangeFeed:
+    """In-process stand-in for the realtime feed: publish() a sensor row to every subscriber."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def publish(self, record: dict):
+        for callback in list(self.subscribers):
+            callback(record)
+
+
+class SupabaseChangeFeed:
+    """
+    Supabase realtime subscription to changes on the sensor table,
+    run on its own event loop in a daemon thread. Each new row is passed
+    to the subscribers, like LocalChangeFeed.publish.
+    """
+
+    def __init__(self, url: str, key: str, table: str, schema: str = "public"):
+        self.url = url
+        self.key = key
+        self.table = table
+        self.schema = schema
+        self.subscribers = []
+        self.thread = None
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=lambda: asyncio.run(self._listen()),
+                                           name="rpc-change-feed", daemon=True)
+            self.thread.start()
+        return self
+
+    def _on_change(self, payload):
+        record = payload.get("data", {}).get("record") or {}
+        for callback in list(self.subscribers):
+            callback(record)
+
+    async def _listen(self):
+        from supabase import acreate_client
+
+        while True:
+            try:
+                client = await acreate_client(self.url, self.key)
+                channel = client.channel(f"rpc-cache-{self.table}")
+                channel.on_postgres_changes("*", callback=self._on_change, table=self.table, schema=self.schema)
+                await channel.subscribe()
+                print(f"[rpc_cache] Listening for changes on {self.schema}.{self.table}")
+                # the realtime client reconnects by itself; keep the loop alive
+                await asyncio.Event().wait()
+            except Exception as e:
+                print(f"[rpc_cache] Change feed error: {str(e)}; reconnecting")
+            await asyncio.sleep(5)
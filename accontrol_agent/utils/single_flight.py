@@ -0,0 +1,93 @@
+import re
+import copy
+import threading
+
+from accontrol_agent.utils.rerank import normalize
+
+TRAILING_PUNCT = re.compile(r"[\s。、．.!！?？]+$")
+
+
+def normalize_question(text: str) -> str:
+    """NFKC, lower case, collapsed whitespace, no trailing punctuation."""
+    text = re.sub(r"\s+", " ", normalize(text)).strip()
+    return TRAILING_PUNCT.sub("", text)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def waiter_error(error: Exception) -> Exception:
+    """A fresh copy of the leader's exception, so waiters never share (and re-raise) one object."""
+    try:
+        return copy.copy(error)
+    except Exception:
+        return RuntimeError(f"shared call failed: {error!r}")
+
+
+class SingleFlight:
+    """
+    Concurrent do() calls with the same key share one execution: the first
+    caller (leader) runs fn, the others wait and get a deep copy of its
+    result, or a copy of its exception chained from the original. Nothing
+    is cached; once the leader finishes, the next call runs again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise waiter_error(call.error) from call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def report(self) -> dict:
+        total = self.stats["leaders"] + self.stats["shared"]
+        return {
+            **self.stats,
+            "in_flight": len(self.calls),
+            "coalescing_ratio": round(self.stats["shared"] / total, 3) if total else 0.0,
+        }
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Process-wide group per call site (e.g. "orchestrator", "rpc")."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def flight_report() -> dict:
+    """Leaders, shared waiters and coalescing ratio (shared / all calls) per group."""
+    return {name: group.report() for name, group in list(_groups.items())}
@@ -1,17 +1,39 @@
 from typing import TypedDict, Optional,Dict, Any, List
 
+class ToolResult(TypedDict):
+    name: str
+    input: Dict[str, Any]
+    output: Any
+
+class KBPassage(TypedDict):
+    index: int
+    content: str
+    uri: str
+    score: float
+
+class WorkingSetEntry(TypedDict, total=False):
+    name: str  # tool name, "kb" for KB passages, "entities" for the last room / device
+    input: Dict[str, Any]
+    output: Any
+    fetched: float  # epoch seconds
+    basis: str  # KB entries: fingerprint of the tool data the passages were retrieved with
+
 class AgentState(TypedDict):
     user_input: str
     processed_input: Optional[str]
     room: Optional[str]
     device_id: Optional[str]
-    tool_results: Optional[List[Any]]
-    knowledge_base_results: Optional[str]
+    tool_results: Optional[List[ToolResult]]
+    knowledge_base_results: Optional[List[KBPassage]]
     orchistrator_response: Optional[str]
     final_result: Optional[str]
-    validation_result: Optional[Dict[str, Any]]
+    improved_result: Optional[str]  # validator's improved_response, used as advice on retry
+    validation_result: Optional[Dict[str, Any]]  # criterion -> score
     validation_passed: bool
+    improved_accepted: bool  # final_result is the validator's rewrite of an answer that failed
     retry_count: int
     error: Optional[str]
+    error_type: Optional[str]  # exception class behind `error`, e.g. "BedrockThrottled"
     next_action: Optional[str]
-    output: Optional[Dict[str, Any]] 
+    output: Optional[Dict[str, Any]]
+    working_set: Optional[Dict[str, WorkingSetEntry]]  # recent tool data and KB passages, kept across turns
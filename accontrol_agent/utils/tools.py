@@ -1,18 +1,19 @@
 import re
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 os.environ["LANGCHAIN_TRACING_V2"] = "false"
-import os
 # os.environ["REQUESTS_CA_BUNDLE"] = ""
-import boto3
 import json
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from supabase import create_client
-from langchain.tools import tool
-from langchain_aws import ChatBedrockConverse
+from langchain_core.tools import tool
+from accontrol_agent.utils.rerank import rerank_passages, terms
+from accontrol_agent.utils.bedrock_limiter import BedrockThrottled, limited_client
+from accontrol_agent.utils.single_flight import get_flight
+from accontrol_agent.utils.rpc_cache import RPCCache, LocalChangeFeed, SupabaseChangeFeed
+from accontrol_agent.utils.anomaly_sweeper import AnomalySweeper
 
 load_dotenv()
 
@@ -20,17 +21,176 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 AWS_REGION = "us-east-1"
 KNOWLEDGE_BASE_ID = "IZXJ8417SA"
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-bedrock_client = boto3.client("bedrock-runtime", region_name=AWS_REGION)
-kb_client = boto3.client("bedrock-agent-runtime", region_name=AWS_REGION)
+KB_NUMBER_OF_RESULTS = int(os.getenv("KB_NUMBER_OF_RESULTS", "10"))
+KB_MAX_PASSAGES = int(os.getenv("KB_MAX_PASSAGES", "5"))
+KB_TOKEN_BUDGET = int(os.getenv("KB_TOKEN_BUDGET", "2500"))
+# "bedrock" (remote KB) or "local" (memory-mapped index built with build_vector_index.py)
+KB_BACKEND = os.getenv("KB_BACKEND", "bedrock")
+KB_LOCAL_INDEX_PATH = os.getenv("KB_LOCAL_INDEX_PATH", "kb_index")
+KB_LOCAL_N_PROBE = int(os.getenv("KB_LOCAL_N_PROBE", "8"))
+# Optional n-gram index (build_lexical_index.py) queried alongside the KB for exact terms
+KB_LEXICAL_INDEX_PATH = os.getenv("KB_LEXICAL_INDEX_PATH")
+# Start KB retrieval from the question alone while tools run; refine only if the tool data adds
+# at least KB_REFINE_MIN_TERMS new terms and the early passages cover under KB_REFINE_COVERAGE of them
+KB_SPECULATIVE = os.getenv("KB_SPECULATIVE", "true").lower() == "true"
+KB_REFINE_MIN_TERMS = int(os.getenv("KB_REFINE_MIN_TERMS", "4"))
+KB_REFINE_COVERAGE = float(os.getenv("KB_REFINE_COVERAGE", "0.5"))
 model_id = "us.anthropic.claude-sonnet-4-20250514-v1:0"
 
-llm = ChatBedrockConverse(
-    model=model_id,
-    temperature=0,
-    client=bedrock_client,
-)
+# Per-room head counts published by the position service (3f.py)
+OCCUPANCY_BUCKET = os.getenv("OCCUPANCY_BUCKET", "osakaminohc")
+OCCUPANCY_KEY = os.getenv("OCCUPANCY_KEY", "room_occupancy.json")
+OCCUPANCY_TTL_SECONDS = int(os.getenv("OCCUPANCY_TTL_SECONDS", "10"))
+room_occupancy_cache = {"etag": None, "fetched": 0.0, "data": {}}
+
+# get_room_anomaly / get_device_anomaly results, cached per room / device until the TTL or a
+# change event for it. RPC_CACHE_FEED_TABLE (e.g. the sensor readings table) enables Supabase
+# realtime invalidation; without it the local feed (rpc_change_feed.publish) is the only source.
+RPC_CACHE_TTL_SECONDS = float(os.getenv("RPC_CACHE_TTL_SECONDS", "60"))
+# empty results (unknown rooms); capped at RPC_CACHE_TTL_SECONDS
+RPC_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("RPC_CACHE_NEGATIVE_TTL_SECONDS", str(RPC_CACHE_TTL_SECONDS)))
+RPC_CACHE_MAX_ENTRIES = int(os.getenv("RPC_CACHE_MAX_ENTRIES", "1024"))
+RPC_CACHE_FEED_TABLE = os.getenv("RPC_CACHE_FEED_TABLE")
+rpc_cache = RPCCache(RPC_CACHE_TTL_SECONDS, RPC_CACHE_NEGATIVE_TTL_SECONDS, RPC_CACHE_MAX_ENTRIES)
+rpc_change_feed = LocalChangeFeed()
+rpc_change_feed.subscribe(rpc_cache.on_change)
+
+# Background sweep of every room in ROOM_ALIASES and every device seen in their rows, every
+# ANOMALY_SWEEP_INTERVAL_SECONDS (0 = off). Room / device lookups are served from the sweep
+# while it is younger than ANOMALY_SWEEP_MAX_AGE_SECONDS (by default no older than what
+# rpc_cache would serve), and get_anomaly_overview answers building-wide questions from it.
+ANOMALY_SWEEP_INTERVAL_SECONDS = float(os.getenv("ANOMALY_SWEEP_INTERVAL_SECONDS", "0"))
+ANOMALY_SWEEP_MAX_AGE_SECONDS = float(os.getenv("ANOMALY_SWEEP_MAX_AGE_SECONDS",
+                                                str(min(ANOMALY_SWEEP_INTERVAL_SECONDS, RPC_CACHE_TTL_SECONDS))))
+ANOMALY_SWEEP_CONCURRENCY = int(os.getenv("ANOMALY_SWEEP_CONCURRENCY", "4"))
+# Sweep each kind with one RPC per ANOMALY_SWEEP_BATCH_SIZE rooms / devices instead of one per
+# entity; needs the batch functions in anomaly_sweep_batch.sql created in Supabase first
+ANOMALY_SWEEP_BATCH = os.getenv("ANOMALY_SWEEP_BATCH", "false").lower() == "true"
+ANOMALY_SWEEP_BATCH_SIZE = int(os.getenv("ANOMALY_SWEEP_BATCH_SIZE", "50"))
+ANOMALY_SWEEP_BATCH_RPCS = {"room": ("get_rooms_anomaly", "room_inputs"),
+                            "device": ("get_devices_anomaly", "device_inputs")}
+
+# Clients are created on first use (not at import) so graph startup stays fast
+# and importing this module works without credentials.
+_clients = {}
+_clients_lock = threading.RLock()  # factories may call other getters (get_llm -> get_bedrock_client)
+
+def _singleton(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _boto3_client(service: str):
+    import boto3
+    return boto3.client(service, region_name=AWS_REGION)
+
+def get_supabase():
+    def create():
+        from supabase import create_client
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _singleton("supabase", create)
+
+# Bedrock clients share the process-wide per-model limiters (bedrock_limiter.py)
+def get_bedrock_client():
+    return _singleton("bedrock-runtime", lambda: limited_client("bedrock-runtime", AWS_REGION))
+
+def get_kb_client():
+    return _singleton("bedrock-agent-runtime", lambda: limited_client("bedrock-agent-runtime", AWS_REGION))
+
+def get_s3_client():
+    return _singleton("s3", lambda: _boto3_client("s3"))
+
+def get_llm():
+    def create():
+        from langchain_aws import ChatBedrockConverse
+        return ChatBedrockConverse(
+            model=model_id,
+            temperature=0,
+            client=get_bedrock_client(),
+        )
+    return _singleton("llm", create)
+
+def get_local_kb():
+    def create():
+        from accontrol_agent.utils.vector_index import open_local_index
+        return open_local_index(KB_LOCAL_INDEX_PATH, get_bedrock_client(), n_probe=KB_LOCAL_N_PROBE)
+    return _singleton("local-kb", create)
+
+def get_lexical_kb():
+    def create():
+        from accontrol_agent.utils.lexical_index import LexicalIndex
+        return LexicalIndex(KB_LEXICAL_INDEX_PATH)
+    return _singleton("lexical-kb", create)
+
+def get_kb_pool():
+    return _singleton("kb-pool", lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix="kb"))
+
+def get_speculation_pool():
+    # separate from kb-pool: retrieve_with_lexical waits on kb-pool tasks itself
+    return _singleton("kb-speculation", lambda: ThreadPoolExecutor(max_workers=8, thread_name_prefix="kb-spec"))
+
+def get_openmeteo():
+    def create():
+        import openmeteo_requests
+        import requests_cache
+        from retry_requests import retry
+        # Setup Open-Meteo API client with caching and retries
+        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
+        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+        return openmeteo_requests.Client(session=retry_session)
+    return _singleton("openmeteo", create)
+
+def supabase_rpc(name: str, params: dict):
+    """RPC rows; identical concurrent calls (same function and params) share one request."""
+    key = (name, json.dumps(params, sort_keys=True, ensure_ascii=False))
+    return get_flight("rpc").do(key, lambda: get_supabase().rpc(name, params).execute().data)
+
+def get_realtime_feed():
+    def create():
+        feed = SupabaseChangeFeed(SUPABASE_URL, SUPABASE_KEY, RPC_CACHE_FEED_TABLE)
+        feed.subscribe(rpc_cache.on_change)
+        return feed.start()
+    return _singleton("realtime-feed", create)
+
+def sweep_batch_rpc(kind: str, ids: list) -> dict:
+    """Rows for many rooms or devices in one RPC, as {room or device id: rows}."""
+    name, param = ANOMALY_SWEEP_BATCH_RPCS[kind]
+    return supabase_rpc(name, {param: ids}) or {}
+
+def get_anomaly_sweeper():
+    def create():
+        sweeper = AnomalySweeper(
+            ROOM_ALIASES.values(),
+            lambda room: supabase_rpc('get_room_anomaly', {'room_input': room}),
+            lambda device: supabase_rpc('get_device_anomaly', {'device_input': device}),
+            interval=ANOMALY_SWEEP_INTERVAL_SECONDS,
+            max_age=ANOMALY_SWEEP_MAX_AGE_SECONDS,
+            concurrency=ANOMALY_SWEEP_CONCURRENCY,
+            batch_loader=sweep_batch_rpc if ANOMALY_SWEEP_BATCH else None,
+            batch_size=ANOMALY_SWEEP_BATCH_SIZE,
+        )
+        rpc_change_feed.subscribe(sweeper.on_change)
+        if RPC_CACHE_FEED_TABLE:
+            get_realtime_feed().subscribe(sweeper.on_change)
+        return sweeper.start()
+    return _singleton("anomaly-sweeper", create)
+
+def cached_rpc(name: str, params: dict, entity: tuple):
+    """
+    Swept rows when the background sweep is on and fresh, else supabase_rpc
+    through rpc_cache; empty results are cached too (negative caching).
+    """
+    if RPC_CACHE_FEED_TABLE:
+        get_realtime_feed()
+    if ANOMALY_SWEEP_INTERVAL_SECONDS > 0:
+        swept = get_anomaly_sweeper().lookup(entity)
+        if swept is not None:
+            return swept
+    return rpc_cache.get_or_load(name, params, entity, lambda: supabase_rpc(name, params))
 
 ROOM_ALIASES = {
     "402 CW1": "402 CW1",
@@ -59,9 +219,9 @@ def get_room_data(room: str):
         room_name = parsed["room"]
         print(f"Fetching data for room: {room}")
         print(f"Fetching data for room name: {room_name}")
-        data = supabase.rpc('get_room_anomaly', {'room_input': room_name}).execute()
-        print(f"Retrieved data for room {room_name}: {data.data}")
-        return data.data if data.data else {"error": f"No data found for room: {room_name}"}
+        data = cached_rpc('get_room_anomaly', {'room_input': room_name}, ("room", room_name))
+        print(f"Retrieved data for room {room_name}: {data}")
+        return data if data else {"error": f"No data found for room: {room_name}"}
     except Exception as e:
         return {"error": str(e)}
 
@@ -71,21 +231,61 @@ def get_device_data(device_id: str):
     try:
         parsed = json.loads(device_id)
         device_id_name = parsed["device_id"]
-        data = supabase.rpc('get_device_anomaly', {'device_input': device_id_name}).execute()
-        print(f"Retrieved data for room {device_id_name}: {data.data}")
-        return data.data if data.data else {"error": f"No data found for device: {device_id}"}
+        data = cached_rpc('get_device_anomaly', {'device_input': device_id_name}, ("device", device_id_name))
+        print(f"Retrieved data for room {device_id_name}: {data}")
+        return data if data else {"error": f"No data found for device: {device_id}"}
     except Exception as e:
         return {"error": str(e)}
     
 
+@tool
+def get_anomaly_overview():
+    """Get a building-wide summary of sensor anomalies: which rooms and devices are currently flagged and what changed since the previous check."""
+    try:
+        if ANOMALY_SWEEP_INTERVAL_SECONDS <= 0:
+            return {"error": "Anomaly sweep is not enabled"}
+        return get_anomaly_sweeper().overview()
+    except Exception as e:
+        return {"error": str(e)}
+
+def load_room_occupancy() -> dict:
+    """Cached copy of room_occupancy.json, refreshed at most every OCCUPANCY_TTL_SECONDS."""
+    now = time.time()
+    if now - room_occupancy_cache["fetched"] < OCCUPANCY_TTL_SECONDS:
+        return room_occupancy_cache["data"]
+    room_occupancy_cache["fetched"] = now
+    try:
+        kwargs = {"Bucket": OCCUPANCY_BUCKET, "Key": OCCUPANCY_KEY}
+        if room_occupancy_cache["etag"]:
+            kwargs["IfNoneMatch"] = room_occupancy_cache["etag"]
+        obj = get_s3_client().get_object(**kwargs)
+        room_occupancy_cache["data"] = json.loads(obj["Body"].read())
+        room_occupancy_cache["etag"] = obj.get("ETag")
+    except Exception as e:
+        # 304 Not Modified surfaces as a ClientError; keep the cached copy
+        if "304" not in str(e) and "Not Modified" not in str(e):
+            print(f"Error loading room occupancy: {str(e)}")
+    return room_occupancy_cache["data"]
+
+@tool
+def get_room_occupancy(room: str):
+    """Get the current number of people in a specific room."""
+    try:
+        room_name = json.loads(room)["room"] if room.strip().startswith("{") else room
+        room_name = extract_room_name(room_name) or room_name
+        occupancy = load_room_occupancy()
+        entry = occupancy.get("rooms", {}).get(room_name)
+        if entry is None:
+            return {"error": f"No occupancy data for room: {room_name}"}
+        return {"room": room_name, "people": entry["count"], "time": entry.get("time")}
+    except Exception as e:
+        return {"error": str(e)}
+
 @tool
 def get_weather_data():
     """Get current weather data for Minoh Campus, Osaka, Japan. can use to comfort air control system."""
     try:
-        # Setup Open-Meteo API client with caching and retries
-        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        openmeteo = openmeteo_requests.Client(session=retry_session)
+        openmeteo = get_openmeteo()
 
         url = "https://api.open-meteo.com/v1/forecast"
         params = {
@@ -101,7 +301,7 @@ def get_weather_data():
             "timezone": "Asia/Tokyo"
         }
 
-        responses = openmeteo.weather_api(url, params=params)
+        responses = get_flight("weather").do("current", openmeteo.weather_api, url, params=params)
         response = responses[0]
         current = response.Current()
         print("Current data object:", current)
@@ -137,36 +337,118 @@ def get_weather_data():
         traceback.print_exc()
         return {"error": str(e)}
     
-def search_knowledge_base(query: str, tool_results: list[dict], advice: str = "") -> str:
+def retrieve_passages(text: str, k: int) -> list[dict]:
+    """Top-k `retrievalResults` from the configured knowledge base backend."""
+    if KB_BACKEND == "local":
+        return get_local_kb().retrieve(text, k)
+    response = get_kb_client().retrieve(
+        knowledgeBaseId=KNOWLEDGE_BASE_ID,
+        retrievalQuery={"text": text},
+        retrievalConfiguration={
+            "vectorSearchConfiguration": {"numberOfResults": k}
+        }
+    )
+    return response['retrievalResults'] if response['retrievalResults'] else []
+
+def retrieve_with_lexical(query: str, prompt: str, k: int) -> list[dict]:
+    """
+    Run the KB retrieval and, if configured, the local lexical index in
+    parallel and merge them by reciprocal rank. The lexical side only sees
+    the question, where error codes and device IDs appear verbatim.
+    """
+    if not KB_LEXICAL_INDEX_PATH:
+        return retrieve_passages(prompt, k)
+    from accontrol_agent.utils.lexical_index import reciprocal_rank_fusion
+
+    pool = get_kb_pool()
+    remote = pool.submit(retrieve_passages, prompt, k)
+    lexical = pool.submit(lambda: get_lexical_kb().retrieve(query, k))
+    try:
+        lexical_results = lexical.result()
+    except Exception as e:
+        print(f"Lexical index error: {str(e)}")
+        lexical_results = []
+    try:
+        remote_results = remote.result()
+    except Exception:
+        if not lexical_results:
+            raise
+        print("Knowledge base retrieval failed, using lexical results only.")
+        remote_results = []
+    return reciprocal_rank_fusion([lexical_results, remote_results], limit=k)
+
+def retrieve_kb_passages(query: str, tool_results: list[dict], advice: str = "") -> list[dict]:
+    """Reranked KB passages as KBPassage dicts (index is the retrieval rank)."""
     prompt = f"""以下の質問と、与えられる情報に基づき関連する文章を抽出してください。
     質問：{query}
     情報：{tool_results}
     アドバイス：{advice}
     """
+    results = get_flight("kb").do(prompt, retrieve_with_lexical, query, prompt, KB_NUMBER_OF_RESULTS)
+    passages = []
+    for idx, item in enumerate(results, 1):
+        passages.append({
+            "index": idx,
+            "content": item.get("content", {}).get("text", ""),
+            "uri": item.get("location", {}).get("s3Location", {}).get("uri", ""),
+            "score": item.get("score", 0),
+        })
+    # Rerank against the question plus the validator's advice (empty on a first run; on a retry it
+    # names what the previous answer missed), not the tool data, whose readings and IDs would
+    # dominate the scores; drop duplicates and trim to the token budget
+    return [
+        {k: v for k, v in r.items() if k != "rerank_score"}
+        for r in rerank_passages(f"{query} {advice}", passages, text_key="content",
+                                 max_passages=KB_MAX_PASSAGES, token_budget=KB_TOKEN_BUDGET)
+    ]
+
+NOISE_VALUE = re.compile(r"^[\d\s:.\-+TZ/]*$|^[a-fA-F0-9\-]{32,36}$")
+
+def tool_terms(value) -> set[str]:
+    """Terms from the text values in tool outputs (numbers, timestamps and IDs are skipped)."""
+    found = set()
+    if isinstance(value, dict):
+        for v in value.values():
+            found |= tool_terms(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            found |= tool_terms(v)
+    elif isinstance(value, str) and not NOISE_VALUE.match(value):
+        found |= set(terms(value))
+    return found
+
+def kb_refine_needed(query: str, tool_outputs: list, passages: list[dict]) -> bool:
+    """
+    Whether passages retrieved from the question alone miss what the tool
+    data added: new terms (anomaly types, error messages, ...) that the
+    passages do not cover.
+    """
+    novel = tool_terms(tool_outputs) - set(terms(query))
+    if len(novel) < KB_REFINE_MIN_TERMS:
+        return False
+    covered = set()
+    for p in passages:
+        covered |= novel & set(terms(p.get("content", "")))
+    return len(covered) / len(novel) < KB_REFINE_COVERAGE
+
+def format_kb_passages(passages: list[dict]) -> str:
+    """Prompt text for KB passages, in the format the prompts have always used."""
+    extracted_results = [
+        {'Index': p["index"], 'Content': p["content"], 'DocumentURI': p["uri"], 'Score': p["score"]}
+        for p in passages
+    ]
+    return f"参考マニュアル情報：\n{str(extracted_results)}"
+
+def search_knowledge_base(query: str, tool_results: list[dict], advice: str = "") -> str:
     try:
-        response = kb_client.retrieve(
-            knowledgeBaseId=KNOWLEDGE_BASE_ID,
-            retrievalQuery={"text": prompt}
-        )
-        results = response['retrievalResults'][:5] if response['retrievalResults'] else []
-        extracted_results = []
-        for item in results:
-            content = item.get("content", {}).get("text", "")
-            document_uri = item.get("location", {}).get("s3Location", {}).get("uri", "")
-            score = item.get("score", 0)
-            extracted_results.append({
-                'Content': content,
-                'DocumentURI': document_uri,
-                'Score': score
-            })
-        return f"参考マニュアル情報：\n{str(extracted_results)}"
+        return format_kb_passages(retrieve_kb_passages(query, tool_results, advice))
     except Exception as e:
         return f"Error retrieving from knowledge base: {str(e)}"
 
 def extract_room_name(text: str) -> str | None:
     text_lower = text.lower()
     for alias, official in ROOM_ALIASES.items():
-        if alias in text_lower:
+        if alias.lower() in text_lower:
             return official
     return None
 
@@ -176,7 +458,11 @@ def extract_device_id(text: str) -> str | None:
     return match.group(0) if match else None
 
 def run_interface(prompt: str) -> str:
-    bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+    # identical prompts in flight at the same time (same answer being validated, ...) share one call
+    return get_flight("llm").do(prompt, _run_interface, prompt)
+
+def _run_interface(prompt: str) -> str:
+    bedrock_runtime = get_bedrock_client()
     try:
         input_data = {
             "thinking": {"type": "enabled", "budget_tokens": 1600},
@@ -197,6 +483,9 @@ def run_interface(prompt: str) -> str:
     )
         print("----------orchestrator response_body----------", text_content)
         return text_content
+    except BedrockThrottled:
+        # Let the caller fail the step instead of validating an error string
+        raise
     except Exception as e:
         print(f"Error querying Bedrock: {str(e)}")
         return f"Error querying Bedrock: {str(e)}"
\ No newline at end of file
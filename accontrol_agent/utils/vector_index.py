@@ -0,0 +1,212 @@
+import os
+import json
+import zlib
+
+import numpy as np
+
+from accontrol_agent.utils.rerank import terms
+
+VECTORS_FILE = "vectors.f32"
+CENTROIDS_FILE = "centroids.npy"
+META_FILE = "meta.jsonl"
+INDEX_FILE = "index.json"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: hashed character bigrams / ASCII terms into `dim`
+    buckets. Lower quality than a neural model, but needs no network.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in terms(text):
+                h = zlib.crc32(term.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return normalize_rows(out)
+
+
+class BedrockEmbedder:
+    """Titan text embeddings through bedrock-runtime (one call per text)."""
+
+    name = "titan-v2"
+
+    def __init__(self, client, dim: int = 1024, model_id: str = "amazon.titan-embed-text-v2:0"):
+        self.client = client
+        self.dim = dim
+        self.model_id = model_id
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for text in texts:
+            response = self.client.invoke_model(
+                modelId=self.model_id,
+                body=json.dumps({"inputText": text[:8000], "dimensions": self.dim, "normalize": True}),
+                contentType="application/json",
+            )
+            vectors.append(json.loads(response["body"].read())["embedding"])
+        return normalize_rows(np.array(vectors, dtype=np.float32))
+
+
+def kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids (cosine), trained on at most 50k rows."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), 50_000), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def build_index(out_dir: str, passages: list[dict], embeddings: np.ndarray,
+                n_lists: int = 0, embedder: str = "titan-v2"):
+    """
+    Write a memory-mappable index. `passages` are dicts with at least
+    `text` and `uri` (optionally `title`), aligned with `embeddings`.
+    With n_lists > 0, rows are grouped by IVF list so each list is one
+    contiguous slice of the matrix.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    vectors = normalize_rows(embeddings)
+    order = np.arange(len(vectors))
+    offsets = None
+    # k-means picks its initial centroids among the rows
+    n_lists = min(n_lists, len(vectors))
+    if n_lists:
+        centroids = kmeans(vectors, n_lists)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+        np.save(os.path.join(out_dir, CENTROIDS_FILE), centroids)
+
+    vectors[order].tofile(os.path.join(out_dir, VECTORS_FILE))
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        for i in order:
+            p = passages[i]
+            f.write(json.dumps({"text": p["text"], "uri": p.get("uri", ""), "title": p.get("title")},
+                               ensure_ascii=False) + "\n")
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump({
+            "count": len(vectors),
+            "dim": vectors.shape[1],
+            "n_lists": n_lists,
+            "offsets": offsets,
+            "embedder": embedder,
+        }, f)
+
+
+class LocalVectorIndex:
+    """
+    Read side of build_index. The float32 matrix is memory-mapped, so
+    opening is cheap and only touched pages are read. Queries are scored
+    with batched dot products, over all rows or the `n_probe` closest IVF
+    lists.
+    """
+
+    def __init__(self, path: str, embed=None, n_probe: int = 8, block_rows: int = 65_536):
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.info = json.load(f)
+        self.count = self.info["count"]
+        self.dim = self.info["dim"]
+        self.vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32,
+                                 mode="r", shape=(self.count, self.dim))
+        self.offsets = self.info.get("offsets")
+        self.centroids = np.load(os.path.join(path, CENTROIDS_FILE)) if self.offsets else None
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = [json.loads(line) for line in f]
+        self.embed = embed
+        self.n_probe = n_probe
+        self.block_rows = block_rows
+
+    def _top_k(self, scores: np.ndarray, k: int):
+        k = min(k, scores.shape[1])
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-part, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+    def _search_flat(self, queries: np.ndarray, k: int):
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.count, self.block_rows):
+            block = self.vectors[start:start + self.block_rows]
+            idx, scores = self._top_k(queries @ block.T, k)
+            best_idx, best_scores = self._top_k_merge(best_idx, best_scores, idx + start, scores, k)
+        return best_idx, best_scores
+
+    def _top_k_merge(self, idx_a, scores_a, idx_b, scores_b, k):
+        idx = np.concatenate([idx_a, idx_b], axis=1)
+        scores = np.concatenate([scores_a, scores_b], axis=1)
+        pick, top = self._top_k(scores, k)
+        return np.take_along_axis(idx, pick, axis=1), top
+
+    def _search_ivf(self, queries: np.ndarray, k: int):
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :n_probe]
+        # score every query against the union of probed lists in one matmul, then mask
+        # out the rows of lists a query did not probe
+        lists = np.unique(probes)
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+        if not len(rows):
+            return ([np.empty(0, dtype=np.int64)] * len(queries),
+                    [np.empty(0, dtype=np.float32)] * len(queries))
+        row_list = np.repeat(lists, [self.offsets[c + 1] - self.offsets[c] for c in lists])
+        probed = np.zeros((len(queries), len(self.centroids)), dtype=bool)
+        np.put_along_axis(probed, probes, True, axis=1)
+        scores = queries @ self.vectors[rows].T
+        scores[~probed[:, row_list]] = -np.inf
+        idx, top = self._top_k(scores, k)
+        keep = np.isfinite(top)
+        return ([rows[i[m]] for i, m in zip(idx, keep)],
+                [t[m] for t, m in zip(top, keep)])
+
+    def search(self, queries: np.ndarray, k: int = 10):
+        """Top-k (row ids, cosine scores) for each query vector."""
+        queries = normalize_rows(np.atleast_2d(queries))
+        if self.offsets:
+            return self._search_ivf(queries, k)
+        idx, scores = self._search_flat(queries, k)
+        return list(idx), list(scores)
+
+    def retrieve(self, text: str, k: int = 10) -> list[dict]:
+        """Same shape as bedrock-agent-runtime `retrievalResults`."""
+        idx, scores = self.search(self.embed([text]), k)
+        results = []
+        for row, score in zip(idx[0], scores[0]):
+            meta = self.meta[row]
+            results.append({
+                "content": {"text": meta["text"]},
+                "location": {"s3Location": {"uri": meta["uri"]}},
+                "score": float(score),
+                **({"title": meta["title"]} if meta.get("title") else {}),
+            })
+        return results
+
+
+def open_local_index(path: str, bedrock_client=None, n_probe: int = 8) -> LocalVectorIndex:
+    """Open an index with the query embedder it was built with."""
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        info = json.load(f)
+    if info.get("embedder") == HashingEmbedder.name:
+        embed = HashingEmbedder(info["dim"])
+    else:
+        embed = BedrockEmbedder(bedrock_client, info["dim"])
+    return LocalVectorIndex(path, embed=embed, n_probe=n_probe)
@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+from accontrol_agent.utils.rerank import terms
+
+# Seconds an entry stays reusable, per tool ("kb" = KB passages, "entities" = the room / device a
+# follow-up without one inherits), e.g. WORKING_SET_TTLS="kb=600,entities=60" overrides the defaults.
+# Room / device sensor data is not kept here: it goes through tools.cached_rpc, whose cache and
+# anomaly sweep are invalidated by change events, which a per-thread copy would miss.
+TTL_SECONDS = {"get_room_occupancy": 30.0, "get_weather_data": 600.0, "kb": 1800.0, "entities": 120.0}
+TTL_SECONDS.update({k.strip(): float(v) for k, v in
+                    (item.split("=", 1) for item in os.getenv("WORKING_SET_TTLS", "").split(",") if "=" in item)})
+MAX_ENTRIES = int(os.getenv("WORKING_SET_MAX_ENTRIES", "16"))
+# Share of the follow-up question's terms the kept passages must contain to be reused
+KB_COVERAGE = float(os.getenv("WORKING_SET_KB_COVERAGE", "0.5"))
+KANJI_KATAKANA = re.compile(r"[\u4e00-\u9fff\u30a0-\u30ff]+")
+
+
+def canonical_input(tool_input: dict) -> dict:
+    """Tool arguments with JSON-string values parsed, so router and LLM spellings of a call compare equal."""
+    canonical = {}
+    for k, v in (tool_input or {}).items():
+        try:
+            canonical[k] = json.loads(v) if isinstance(v, str) else v
+        except ValueError:
+            canonical[k] = v
+    return canonical
+
+
+def entry_key(name: str, tool_input: dict) -> str:
+    return f"{name}:{json.dumps(canonical_input(tool_input), sort_keys=True, ensure_ascii=False)}"
+
+
+def keeps(name: str) -> bool:
+    """Whether outputs of this tool are kept at all."""
+    return TTL_SECONDS.get(name, 0.0) > 0
+
+
+def make_entry(name: str, tool_input: dict, output, fetched: float | None = None, basis: str | None = None) -> dict:
+    entry = {"name": name, "input": tool_input, "output": output,
+             "fetched": time.time() if fetched is None else fetched}
+    if basis is not None:
+        entry["basis"] = basis
+    return entry
+
+
+def fingerprint(outputs) -> str:
+    """Stable digest of tool outputs (across processes, unlike hash()), to tell whether data changed."""
+    data = json.dumps(outputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def flight_fingerprint(working_set: dict | None) -> str:
+    """
+    Which entries a run could reuse (key and fetch time of each fresh one),
+    for the single-flight key: runs only share an answer built from the
+    same kept data and follow-up entities.
+    """
+    now = time.time()
+    usable = sorted((k, v["fetched"]) for k, v in (working_set or {}).items() if is_fresh(v, now))
+    return fingerprint(usable) if usable else ""
+
+
+def is_fresh(entry: dict, now: float | None = None) -> bool:
+    now = time.time() if now is None else now
+    return now - entry["fetched"] <= TTL_SECONDS.get(entry["name"], 0.0)
+
+
+def lookup(working_set: dict | None, name: str, tool_input: dict) -> dict | None:
+    """The fresh entry for this tool call, if any."""
+    entry = (working_set or {}).get(entry_key(name, tool_input))
+    return entry if entry and is_fresh(entry) else None
+
+
+def content_terms(text: str) -> set[str]:
+    """Kanji / katakana bigrams and ASCII words of 3+ characters; particles and endings say nothing about topic."""
+    return {t for t in terms(text)
+            if (t.isascii() and len(t) >= 3 and t.isalnum()) or (not t.isascii() and KANJI_KATAKANA.fullmatch(t))}
+
+
+def kb_input(room, device_id) -> dict:
+    return {"room": room, "device_id": device_id}
+
+
+def reusable_passages(working_set: dict | None, question: str, room, device_id) -> dict | None:
+    """
+    The kept KB entry for the same room and device, if fresh and its
+    passages still contain most of the new question's content terms;
+    None means retrieve again.
+    """
+    entry = lookup(working_set, "kb", kb_input(room, device_id))
+    if not entry or not entry["output"]:
+        return None
+    wanted = content_terms(question)
+    have = set().union(*(content_terms(p.get("content", "")) for p in entry["output"]))
+    return entry if wanted and len(wanted & have) / len(wanted) >= KB_COVERAGE else None
+
+
+def merge(working_set: dict | None, entries: dict) -> dict:
+    """Working set with entries added, stale entries dropped and at most MAX_ENTRIES (newest) kept."""
+    merged = {k: v for k, v in {**(working_set or {}), **entries}.items() if is_fresh(v)}
+    newest = sorted(merged.items(), key=lambda kv: kv[1]["fetched"], reverse=True)[:MAX_ENTRIES]
+    return dict(newest)
+
+
+def entities_entry(room, device_id) -> dict:
+    """The room / device of this turn, for follow-ups within TTL_SECONDS["entities"]."""
+    entity = {"room": room, "device_id": device_id}
+    return {entry_key("entities", {}): make_entry("entities", entity, None)} if room or device_id else {}
+
+
+def follow_up_entities(working_set: dict | None) -> dict | None:
+    """Room and device of a recent turn ({"room", "device_id"}), or None once that is too long ago."""
+    entry = lookup(working_set, "entities", {})
+    return entry["input"] if entry else None
@@ -0,0 +1,90 @@
+import io
+import os
+import time
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+
+# Model calls are not what the working set saves; keep data-source latencies
+os.environ.setdefault("FAKE_LLM_MS", "0")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+os.environ["AGENT_CHECKPOINT_DB"] = os.path.join(tempfile.mkdtemp(prefix="working_set_"), "checkpoints.sqlite")
+
+from accontrol_agent.fake_backends import create_fake_agent_graph
+from accontrol_agent.utils import nodes, tools
+from accontrol_agent.utils.checkpoint import thread_config
+from accontrol_agent.utils.rpc_cache import RPCCache
+
+ROOMS = ["403 CW2", "402 CW1", "405 中講義室", "404 SALC"]
+# A question naming the room, then follow-ups that do not
+CONVERSATION = [
+    "{room} が暑いです",
+    "何度に設定すればいい？",
+    "エアコンの設定温度は？",
+]
+UPSTREAM = {"bedrock-agent-runtime": "kb", "supabase": "rpc", "openmeteo": "weather"}
+COUNTS = {label: 0 for label in UPSTREAM.values()}
+COUNTED = []
+
+
+class Counted:
+    """Counts calls into a fake client's public methods."""
+
+    def __init__(self, client, counts: dict, name: str):
+        self.client, self.counts, self.name = client, counts, name
+
+    def __getattr__(self, attr):
+        target = getattr(self.client, attr)
+        if not callable(target) or attr.startswith("_"):
+            return target
+
+        def call(*args, **kwargs):
+            self.counts[self.name] += 1
+            return target(*args, **kwargs)
+        return call
+
+
+def run(name, graph, enabled: bool):
+    nodes.WORKING_SET = enabled
+    # a fresh process-wide RPC cache per run, so both runs start cold
+    tools.rpc_cache = RPCCache(ttl=tools.RPC_CACHE_TTL_SECONDS, negative_ttl=tools.RPC_CACHE_NEGATIVE_TTL_SECONDS)
+    tools.rpc_change_feed.subscribers = [tools.rpc_cache.on_change]
+    for counted in COUNTED:
+        counted.counts[counted.name] = 0
+    before = dict(nodes.working_set_stats)
+    latencies = [[] for _ in CONVERSATION]
+    wrong = 0
+    for i, room in enumerate(ROOMS):
+        config = thread_config(f"{name}-{i}")
+        for turn, template in enumerate(CONVERSATION):
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                state = graph.invoke({"user_input": template.format(room=room)}, config)
+            latencies[turn].append(time.perf_counter() - start)
+            wrong += state.get("room") != room
+    reused = {k: nodes.working_set_stats[k] - before[k] for k in before}
+    print(f"{name:>12} | {statistics.median(latencies[0]) * 1000:8.0f} | "
+          f"{statistics.median(sum(latencies[1:], [])) * 1000:11.0f} | {COUNTS['kb']:8d} | {COUNTS['rpc']:9d} | "
+          f"{reused['reused'] + reused['kb_reused']:6d} | {wrong:10d}")
+
+
+if __name__ == "__main__":
+    graph = create_fake_agent_graph()
+    for client, label in UPSTREAM.items():
+        if client.startswith("bedrock"):
+            # count the fake behind the limiter, keep the limiter
+            limited = tools._clients[client]
+            limited._client = Counted(limited._client, COUNTS, label)
+            COUNTED.append(limited._client)
+        else:
+            tools._clients[client] = Counted(tools._clients[client], COUNTS, label)
+            COUNTED.append(tools._clients[client])
+    print(f"{len(ROOMS)} conversations of {len(CONVERSATION)} turns (checkpointed threads); "
+          f"fake KB {os.getenv('FAKE_KB_MS', '300')} ms, RPC {os.getenv('FAKE_RPC_MS', '80')} ms")
+    print(f"{'working set':>12} | {'first ms':>8} | {'follow-up ms':>11} | {'KB calls':>8} | {'RPC calls':>9} | "
+          f"{'reused':>6} | {'wrong room':>10}")
+    run("off", graph, enabled=False)
+    run("on", graph, enabled=True)